@@ -1,8 +1,8 @@
-import os
+from main.utils import PUBLIC_URL
 from django.contrib import admin
 from django.utils.html import mark_safe, format_html
 from django.urls import reverse
-from .models import Location, Checklist, ChecklistItem, Collection, Transportation, Note, ContentImage, Visit, Category, ContentAttachment, Lodging, CollectionInvite, Trail, Activity, CollectionItineraryItem, CollectionItineraryDay
+from .models import Location, Checklist, ChecklistItem, Collection, Transportation, Note, ContentImage, Visit, Category, ContentAttachment, Lodging, CollectionInvite, Trail, Activity, CollectionItineraryItem, CollectionItineraryDay, GeocodeJob, ReverseGeocodeCache
 from worldtravel.models import Country, Region, VisitedRegion, City, VisitedCity
 from allauth.account.decorators import secure_admin_login
 
@@ -12,13 +12,21 @@ admin.site.login = secure_admin_login(admin.site.login)
 @admin.action(description="Trigger geocoding")
 def trigger_geocoding(modeladmin, request, queryset):
     count = 0
-    for location in queryset:
+    for location in queryset.filter(latitude__isnull=False, longitude__isnull=False):
         try:
-            location.save()  # Triggers geocoding logic in your model
+            GeocodeJob.enqueue(location.id)
             count += 1
         except Exception as e:
             modeladmin.message_user(request, f"Error geocoding {location}: {e}", level='error')
-    modeladmin.message_user(request, f"Geocoding triggered for {count} locations.", level='success')
+    modeladmin.message_user(request, f"Geocoding queued for {count} locations.", level='success')
+
+@admin.action(description="Retry selected geocode jobs")
+def retry_geocode_jobs(modeladmin, request, queryset):
+    count = 0
+    for job in queryset:
+        GeocodeJob.enqueue(job.location_id)
+        count += 1
+    modeladmin.message_user(request, f"Requeued {count} geocode jobs.", level='success')
     
 
 
@@ -45,6 +53,33 @@ class LocationAdmin(admin.ModelAdmin):
     get_visit_count.short_description = 'Visit Count'
 
 
+class GeocodeJobAdmin(admin.ModelAdmin):
+    list_display = ('location', 'status', 'attempts', 'run_after', 'completed_at', 'last_error')
+    list_filter = ('status',)
+    search_fields = ('location__name',)
+    raw_id_fields = ('location',)
+    readonly_fields = ('requested_at', 'locked_at', 'completed_at', 'created_at', 'updated_at')
+    actions = [retry_geocode_jobs]
+
+    def changelist_view(self, request, extra_context=None):
+        # Surface queue depth and throughput above the job list
+        from adventures.utils.geocode_queue import queue_stats
+        stats = queue_stats()
+        self.message_user(
+            request,
+            f"Queue: {stats['pending']} pending ({stats['due']} due), {stats['running']} running, "
+            f"{stats['failed']} failed, {stats['throughput_per_minute']} jobs/min over the last hour",
+        )
+        return super().changelist_view(request, extra_context)
+
+
+class ReverseGeocodeCacheAdmin(admin.ModelAdmin):
+    list_display = ('cell', 'precision', 'provider', 'updated_at')
+    list_filter = ('provider', 'precision')
+    search_fields = ('cell',)
+    readonly_fields = ('created_at', 'updated_at')
+
+
 class CountryAdmin(admin.ModelAdmin):
     list_display = ('name', 'country_code', 'number_of_regions')
     list_filter = ('subregion',)
@@ -91,9 +126,7 @@ class CustomUserAdmin(UserAdmin):
     )
     def image_display(self, obj):
         if obj.profile_pic:
-            public_url = os.environ.get('PUBLIC_URL', 'http://127.0.0.1:8000').rstrip('/')
-            public_url = public_url.replace("'", "")
-            return mark_safe(f'<img src="{public_url}/media/{obj.profile_pic.name}" width="100px" height="100px"')
+            return mark_safe(f'<img src="{PUBLIC_URL}/media/{obj.profile_pic.name}" width="100px" height="100px"')
         else:
             return
         
@@ -102,9 +135,7 @@ class ContentImageImageAdmin(admin.ModelAdmin):
 
     def image_display(self, obj):
         if obj.image:
-            public_url = os.environ.get('PUBLIC_URL', 'http://127.0.0.1:8000').rstrip('/')
-            public_url = public_url.replace("'", "")
-            return mark_safe(f'<img src="{public_url}/media/{obj.image.name}" width="100px" height="100px"')
+            return mark_safe(f'<img src="{PUBLIC_URL}/media/{obj.image.name}" width="100px" height="100px"')
         else:
             return
 
@@ -117,9 +148,7 @@ class VisitAdmin(admin.ModelAdmin):
 
     def image_display(self, obj):
         if obj.image:  # Ensure this field matches your model's image field
-            public_url = os.environ.get('PUBLIC_URL', 'http://127.0.0.1:8000').rstrip('/')
-            public_url = public_url.replace("'", "")
-            return mark_safe(f'<img src="{public_url}/media/{obj.image.name}" width="100px" height="100px"')
+            return mark_safe(f'<img src="{PUBLIC_URL}/media/{obj.image.name}" width="100px" height="100px"')
         else:
             return
 
@@ -195,6 +224,8 @@ admin.site.register(Trail)
 admin.site.register(Activity, ActivityAdmin)
 admin.site.register(CollectionItineraryItem, CollectionItineraryItemAdmin)
 admin.site.register(CollectionItineraryDay)
+admin.site.register(GeocodeJob, GeocodeJobAdmin)
+admin.site.register(ReverseGeocodeCache, ReverseGeocodeCacheAdmin)
 
 admin.site.site_header = 'AdventureLog Admin'
 admin.site.site_title = 'AdventureLog Admin Site'
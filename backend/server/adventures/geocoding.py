@@ -1,10 +1,39 @@
 import requests
 import time
-import socket
-import re
-import unicodedata
-from worldtravel.models import Region, City, VisitedRegion, VisitedCity
+import logging
+from datetime import timedelta
+from worldtravel.models import Region, City, VisitedRegion, VisitedCity, normalize_place_name
 from django.conf import settings
+from main import http_client
+from django.contrib.gis.db.models.functions import GeometryDistance
+from django.contrib.gis.geos import Point
+from django.core.cache import cache
+from django.utils import timezone
+from geopy.distance import geodesic
+
+logger = logging.getLogger(__name__)
+
+# Shared reverse geocode cache, keyed by coordinates rounded to a number of decimal places
+# (3 decimals is a ~110m cell). Only the administrative part of a provider response (country,
+# region, city, ISO codes) is cached: the place name and street address are specific to the
+# exact point and must not be handed to other users in the same cell. Visited flags are added
+# after the lookup.
+REVERSE_GEOCODE_CACHE_ENABLED = getattr(settings, 'REVERSE_GEOCODE_CACHE_ENABLED', True)
+REVERSE_GEOCODE_CACHE_PRECISION = getattr(settings, 'REVERSE_GEOCODE_CACHE_PRECISION', 3)
+REVERSE_GEOCODE_CACHE_TTL = getattr(settings, 'REVERSE_GEOCODE_CACHE_TTL', 60 * 60 * 24 * 30)  # 30 days default
+REVERSE_GEOCODE_CACHE_PREFIX = 'reverse_geocode'
+# Address keys kept in the cache, besides the ISO3166 codes
+CACHED_ADDRESS_KEYS = {
+    'country', 'state', 'county', 'municipality', 'city', 'city_district', 'town', 'village', 'hamlet',
+    'locality', 'suburb', 'neighbourhood', 'neighborhood',
+}
+# Resolve regions against the boundaries loaded by download-countries before calling a provider
+REVERSE_GEOCODE_OFFLINE = getattr(settings, 'REVERSE_GEOCODE_OFFLINE', True)
+# Maximum distance of the nearest known city when no city name could be matched
+REVERSE_GEOCODE_CITY_RADIUS_KM = getattr(settings, 'REVERSE_GEOCODE_CITY_RADIUS_KM', 10)
+
+class GeocodeError(Exception):
+    """Raised when a geocoding provider failed and the request should be retried."""
 
 # -----------------
 # SEARCHING
@@ -28,7 +57,7 @@ def search_google(query):
             "maxResultCount": 20  # Adjust as needed
         }
         
-        response = requests.post(url, json=payload, headers=headers, timeout=(2, 5))
+        response = http_client.post('google', url, json=payload, headers=headers)
         response.raise_for_status()
 
         data = response.json()
@@ -75,6 +104,8 @@ def search_google(query):
 
     except requests.exceptions.Timeout:
         return {"error": "Request timed out while contacting Google Maps. Please try again."}
+    except http_client.ProviderUnavailable:
+        return {"error": "Google Maps is temporarily unavailable. Please try again later."}
     except requests.exceptions.ConnectionError:
         return {"error": "Unable to connect to Google Maps service. Please check your internet connection."}
     except requests.exceptions.HTTPError as e:
@@ -130,7 +161,7 @@ def search_osm(query):
     try:
         url = f"https://nominatim.openstreetmap.org/search?q={query}&format=jsonv2"
         headers = {'User-Agent': 'AdventureLog Server'}
-        response = requests.get(url, headers=headers, timeout=(2, 5))
+        response = http_client.get('nominatim', url, headers=headers)
         response.raise_for_status()
         data = response.json()
 
@@ -147,6 +178,8 @@ def search_osm(query):
         } for item in data]
     except requests.exceptions.Timeout:
         return {"error": "Request timed out while contacting OpenStreetMap. Please try again."}
+    except http_client.ProviderUnavailable:
+        return {"error": "OpenStreetMap is temporarily unavailable. Please try again later."}
     except requests.exceptions.ConnectionError:
         return {"error": "Unable to connect to OpenStreetMap service. Please check your internet connection."}
     except requests.exceptions.HTTPError as e:
@@ -179,13 +212,32 @@ def search(query):
 def extractIsoCode(user, data):
     """
     Extract the ISO code from the response data.
-    Returns a dictionary containing the region name, country name, and ISO code if found.
+    Returns a dictionary containing the region name, country name, and ISO code if found,
+    along with whether the user has visited the region and city.
+    """
+    result = resolve_address(data)
+    if 'error' in result:
+        return result
+    return add_visited_flags(result, user)
+
+def add_visited_flags(result, user):
+    """Add the user specific region_visited/city_visited flags to a resolved address."""
+    result = dict(result)
+    result['region_visited'] = VisitedRegion.objects.filter(region_id=result['region_id'], user=user).exists()
+    result['city_visited'] = bool(
+        result.get('city_id') and VisitedCity.objects.filter(city_id=result['city_id'], user=user).exists()
+    )
+    return result
+
+def resolve_address(data):
+    """
+    Resolve the region and city of a Nominatim-style response without any user specific data,
+    so the result can be shared between users.
     """
     iso_code = None
     display_name = None
     country_code = None
     city = None
-    visited_city = None
     location_name = None
 
     if 'name' in data.keys():
@@ -245,7 +297,7 @@ def extractIsoCode(user, data):
     for candidate in iso_candidates:
         if len(str(candidate)) <= 2:
             continue
-        match = Region.objects.filter(id=candidate).first()
+        match = Region.objects.filter(id=candidate).select_related('country').defer('geometry').first()
         if match and match not in region_candidates:
             region_candidates.append(match)
 
@@ -253,7 +305,7 @@ def extractIsoCode(user, data):
 
     # Fallback: attempt to resolve region by name and country code when no ISO match.
     if not region and state_name:
-        region_queryset = Region.objects.filter(name__iexact=state_name)
+        region_queryset = Region.objects.filter(name__iexact=state_name).select_related('country').defer('geometry')
         if country_code:
             region_queryset = region_queryset.filter(country__country_code=country_code)
         region = region_queryset.first()
@@ -270,9 +322,6 @@ def extractIsoCode(user, data):
     if not country_code:
         country_code = region.country.country_code
 
-    region_visited = False
-    city_visited = False
-
     # ordered preference for best-effort locality matching
     locality_keys = [
         'suburb',
@@ -288,38 +337,44 @@ def extractIsoCode(user, data):
         'county',
     ]
 
-    def _normalize_name(value):
-        normalized = unicodedata.normalize("NFKD", value)
-        ascii_only = normalized.encode("ascii", "ignore").decode("ascii")
-        return re.sub(r"[^a-z0-9]", "", ascii_only.lower())
+    locality_values = {key_name: address.get(key_name) for key_name in locality_keys if address.get(key_name)}
+    normalized_values = {key_name: normalize_place_name(value) for key_name, value in locality_values.items()}
 
-    def match_locality(key_name, target_region):
-        value = address.get(key_name)
+    def match_locality(key_name, target_region, named_cities):
+        value = locality_values.get(key_name)
         if not value:
             return None
-        qs = City.objects.filter(region=target_region)
 
         # Use exact matches first to avoid broad county/name collisions (e.g. Troms vs Tromsø).
-        exact_match = qs.filter(name__iexact=value).first()
-        if exact_match:
-            return exact_match
-
-        normalized_value = _normalize_name(value)
-        for candidate in qs.values_list('id', 'name'):
-            candidate_id, candidate_name = candidate
-            if _normalize_name(candidate_name) == normalized_value:
-                return qs.filter(id=candidate_id).first()
+        normalized_value = normalized_values[key_name]
+        if normalized_value:
+            matches = [c for c in named_cities if c.normalized_name == normalized_value]
+            for candidate in matches:
+                if candidate.name.lower() == value.lower():
+                    return candidate
+            if matches:
+                return matches[0]
+        else:
+            # Names without Latin letters or digits (CJK, Cyrillic, ...) normalize to nothing
+            exact_match = City.objects.filter(region=target_region, name__iexact=value).first()
+            if exact_match:
+                return exact_match
 
         # Allow partial matching for most locality fields but keep county strict.
         if key_name == 'county':
             return None
 
-        return qs.filter(name__icontains=value).first()
+        return City.objects.filter(region=target_region, name__icontains=value).first()
 
     chosen_region = region
+    wanted_names = {value for value in normalized_values.values() if value}
     for candidate_region in region_candidates or [region]:
+        # One indexed lookup for every locality name of this region instead of a scan per key
+        named_cities = list(
+            City.objects.filter(region=candidate_region, normalized_name__in=wanted_names).order_by('id')
+        ) if wanted_names else []
         for key_name in locality_keys:
-            city = match_locality(key_name, candidate_region)
+            city = match_locality(key_name, candidate_region, named_cities)
             if city:
                 chosen_region = candidate_region
                 iso_code = chosen_region.id
@@ -329,13 +384,9 @@ def extractIsoCode(user, data):
 
     region = chosen_region
     iso_code = region.id
-    visited_region = VisitedRegion.objects.filter(region=region, user=user).first()
-    region_visited = bool(visited_region)
 
     if city:
         display_name = f"{city.name}, {region.name}, {country_code or region.country.country_code}"
-        visited_city = VisitedCity.objects.filter(city=city, user=user).first()
-        city_visited = bool(visited_city)
     else:
         display_name = f"{region.name}, {country_code or region.country.country_code}"
 
@@ -344,46 +395,256 @@ def extractIsoCode(user, data):
         "region": region.name,
         "country": region.country.name,
         "country_id": region.country.country_code,
-        "region_visited": region_visited,
         "display_name": display_name,
         "city": city.name if city else None,
         "city_id": city.id if city else None,
-        "city_visited": city_visited,
         'location_name': location_name,
     }
 
-def is_host_resolvable(hostname: str) -> bool:
+def _cache_cell(lat, lon):
+    """Quantize coordinates to the shared cache cell they fall in."""
+    precision = REVERSE_GEOCODE_CACHE_PRECISION
+    return f"{round(float(lat), precision):.{precision}f},{round(float(lon), precision):.{precision}f}"
+
+def _cacheable_response(data):
+    """The part of a provider response that holds for the whole cache cell."""
+    address = data.get('address', {}) or {}
+    return {
+        'address': {
+            key: value for key, value in address.items()
+            if key in CACHED_ADDRESS_KEYS or key.startswith('ISO3166')
+        }
+    }
+
+def _get_cached_response(cell):
+    cache_key = f"{REVERSE_GEOCODE_CACHE_PREFIX}:{REVERSE_GEOCODE_CACHE_PRECISION}:{cell}"
+    data = cache.get(cache_key)
+    if data is not None:
+        return _cacheable_response(data)
+
+    from adventures.models import ReverseGeocodeCache
+    expires_before = timezone.now() - timedelta(seconds=REVERSE_GEOCODE_CACHE_TTL)
+    entry = ReverseGeocodeCache.objects.filter(
+        cell=cell, precision=REVERSE_GEOCODE_CACHE_PRECISION, updated_at__gte=expires_before
+    ).only('response', 'updated_at').first()
+    if not entry:
+        return None
+
+    # Warm memcached for the remaining lifetime of the persisted entry
+    remaining = REVERSE_GEOCODE_CACHE_TTL - (timezone.now() - entry.updated_at).total_seconds()
+    # Entries written before names were left out are stripped on the way out
+    response = _cacheable_response(entry.response)
+    cache.set(cache_key, response, max(int(remaining), 1))
+    return response
+
+def _set_cached_response(cell, provider, data):
+    from adventures.models import ReverseGeocodeCache
+    cache_key = f"{REVERSE_GEOCODE_CACHE_PREFIX}:{REVERSE_GEOCODE_CACHE_PRECISION}:{cell}"
+    data = _cacheable_response(data)
+    cache.set(cache_key, data, REVERSE_GEOCODE_CACHE_TTL)
+    ReverseGeocodeCache.objects.update_or_create(
+        cell=cell,
+        precision=REVERSE_GEOCODE_CACHE_PRECISION,
+        defaults={'provider': provider, 'response': data},
+    )
+
+def purge_reverse_geocode_cache():
+    """Delete the persisted cache entries older than REVERSE_GEOCODE_CACHE_TTL. Returns the number deleted."""
+    from adventures.models import ReverseGeocodeCache
+    expires_before = timezone.now() - timedelta(seconds=REVERSE_GEOCODE_CACHE_TTL)
+    deleted, _ = ReverseGeocodeCache.objects.filter(updated_at__lt=expires_before).delete()
+    return deleted
+
+def _read_cache(cell):
     try:
-        socket.gethostbyname(hostname)
-        return True
-    except socket.error:
-        return False
+        return _get_cached_response(cell)
+    except Exception as e:
+        logger.warning(f"Reverse geocode cache lookup failed for {cell}: {e}")
+        return None
 
-def reverse_geocode(lat, lon, user):
+def fetch_reverse_geocode(lat, lon, with_name=False):
+    """
+    Return the Nominatim-style provider response for a coordinate, served from the shared
+    coordinate cell cache when possible. Tries Google first when configured, then OSM.
+
+    Cached responses have no place name. `with_name` asks the provider first and only falls
+    back to the cache when it fails.
+    """
+    cell = _cache_cell(lat, lon)
+    if REVERSE_GEOCODE_CACHE_ENABLED and not with_name:
+        cached = _read_cache(cell)
+        if cached is not None:
+            return cached
+
+    provider = 'nominatim'
+    data = None
     if getattr(settings, 'GOOGLE_MAPS_API_KEY', None):
-        google_result = reverse_geocode_google(lat, lon, user)
-        if "error" not in google_result:
-            return google_result
-        # If Google fails, fallback to OSM
-        return reverse_geocode_osm(lat, lon, user)
-    return reverse_geocode_osm(lat, lon, user)
+        data = fetch_reverse_geocode_google(lat, lon)
+        provider = 'google'
+        if "error" in data:
+            # If Google fails (or its circuit is open), fallback to OSM
+            logger.info(f"Google reverse geocoding failed, falling back to OpenStreetMap: {data['error']}")
+            data = None
+    if data is None:
+        data = fetch_reverse_geocode_osm(lat, lon)
+        provider = 'nominatim'
+
+    if "error" in data and with_name and REVERSE_GEOCODE_CACHE_ENABLED:
+        return _read_cache(cell) or data
+    if "error" not in data and REVERSE_GEOCODE_CACHE_ENABLED:
+        try:
+            _set_cached_response(cell, provider, data)
+        except Exception as e:
+            logger.warning(f"Reverse geocode cache write failed for {cell}: {e}")
+    return data
+
+def find_nearest_city(lat, lon, region_id=None, radius_km=None):
+    """
+    Return the city closest to a coordinate, optionally limited to one region, or None when
+    the closest city is further away than `radius_km`. Ordering by GeometryDistance uses the
+    KNN operator so the GiST index on City.point answers this with a single index scan.
+    """
+    radius_km = REVERSE_GEOCODE_CITY_RADIUS_KM if radius_km is None else radius_km
+    point = Point(float(lon), float(lat), srid=4326)
+
+    queryset = City.objects.filter(point__isnull=False)
+    if region_id:
+        queryset = queryset.filter(region_id=region_id)
+    city = (
+        queryset.select_related('region__country').defer('region__geometry')
+        .order_by(GeometryDistance('point', point)).first()
+    )
+    if not city:
+        return None
+
+    if geodesic((float(lat), float(lon)), (city.point.y, city.point.x)).km > radius_km:
+        return None
+    return city
+
+def _display_name(region, city=None):
+    if city:
+        return f"{city.name}, {region.name}, {region.country.country_code}"
+    return f"{region.name}, {region.country.country_code}"
+
+def resolve_location_offline(lat, lon):
+    """
+    Resolve the region and city of a coordinate without calling a provider: the region whose
+    stored boundary contains the point and the nearest city in it. Without a matching
+    boundary the nearest city within the radius decides the region. Returns None when
+    neither is found, e.g. when the world travel data was not imported.
+    """
+    point = Point(float(lon), float(lat), srid=4326)
+    region = (
+        Region.objects.filter(geometry__contains=point)
+        .select_related('country')
+        .only('id', 'name', 'country__name', 'country__country_code')
+        .first()
+    )
+    if region:
+        city = find_nearest_city(lat, lon, region_id=region.id)
+    else:
+        city = find_nearest_city(lat, lon)
+        if not city:
+            return None
+        region = city.region
+
+    return {
+        "region_id": region.id,
+        "region": region.name,
+        "country": region.country.name,
+        "country_id": region.country.country_code,
+        "display_name": _display_name(region, city),
+        "city": city.name if city else None,
+        "city_id": city.id if city else None,
+        'location_name': None,
+    }
+
+def add_nearest_city(result, lat, lon):
+    """Fill in the closest city of the resolved region when the provider's names matched none."""
+    if result.get('city_id'):
+        return result
+    city = find_nearest_city(lat, lon, region_id=result['region_id'])
+    if not city:
+        return result
+
+    result = dict(result)
+    result['city'] = city.name
+    result['city_id'] = city.id
+    result['display_name'] = _display_name(city.region, city)
+    return result
+
+def _resolve_offline(lat, lon):
+    if not REVERSE_GEOCODE_OFFLINE:
+        return None
+    try:
+        return resolve_location_offline(lat, lon)
+    except (TypeError, ValueError):
+        return None
+
+def resolve_coordinates(lat, lon):
+    """
+    Resolve the region, city and country of a coordinate without any user specific data:
+    offline first when enabled, then through the provider. Used by the geocode queue and the
+    backfill, which only assign regions and cities and do not need the place name.
+    """
+    result = _resolve_offline(lat, lon)
+    if result:
+        return result
+
+    data = fetch_reverse_geocode(lat, lon)
+    if "error" in data:
+        return data
+    result = resolve_address(data)
+    if 'error' in result:
+        return result
+    return add_nearest_city(result, lat, lon)
+
+def reverse_geocode(lat, lon, user):
+    """
+    Reverse geocode a coordinate picked in the UI. The provider goes first since only it knows
+    the place name (location_name, display_name); the offline boundaries answer when it fails.
+    """
+    data = fetch_reverse_geocode(lat, lon, with_name=True)
+    result = data if "error" in data else resolve_address(data)
+    if 'error' in result:
+        offline = _resolve_offline(lat, lon)
+        if not offline:
+            return result
+        result = dict(offline, location_name=data.get('name'))
+    else:
+        result = add_nearest_city(result, lat, lon)
+    return add_visited_flags(result, user)
 
 def reverse_geocode_osm(lat, lon, user):
+    data = fetch_reverse_geocode_osm(lat, lon)
+    if "error" in data:
+        return data
+    return extractIsoCode(user, data)
+
+def reverse_geocode_google(lat, lon, user):
+    data = fetch_reverse_geocode_google(lat, lon)
+    if "error" in data:
+        return data
+    return extractIsoCode(user, data)
+
+def fetch_reverse_geocode_osm(lat, lon):
     url = f"https://nominatim.openstreetmap.org/reverse?format=jsonv2&lat={lat}&lon={lon}"
     headers = {'User-Agent': 'AdventureLog Server'}
-    connect_timeout = 1
-    read_timeout = 5
-
-    if not is_host_resolvable("nominatim.openstreetmap.org"):
-        return {"error": "Unable to resolve OpenStreetMap service. Please check your internet connection."}
 
     try:
-        response = requests.get(url, headers=headers, timeout=(connect_timeout, read_timeout))
+        response = http_client.get('nominatim', url, headers=headers)
         response.raise_for_status()
         data = response.json()
-        return extractIsoCode(user, data)
+        if not isinstance(data, dict) or "error" in data:
+            return {"error": "No location found for the given coordinates."}
+        return {
+            "name": data.get("name"),
+            "address": data.get("address", {}) or {},
+        }
     except requests.exceptions.Timeout:
         return {"error": "Request timed out while contacting OpenStreetMap. Please try again."}
+    except http_client.ProviderUnavailable:
+        return {"error": "OpenStreetMap is temporarily unavailable. Please try again later."}
     except requests.exceptions.ConnectionError:
         return {"error": "Unable to connect to OpenStreetMap service. Please check your internet connection."}
     except requests.exceptions.HTTPError as e:
@@ -398,7 +659,7 @@ def reverse_geocode_osm(lat, lon, user):
     except Exception:
         return {"error": "An unexpected error occurred during OpenStreetMap geocoding. Please try again."}
 
-def reverse_geocode_google(lat, lon, user):
+def fetch_reverse_geocode_google(lat, lon):
     api_key = settings.GOOGLE_MAPS_API_KEY
     
     # Updated to use the new Geocoding API endpoint (this one is still supported)
@@ -407,7 +668,7 @@ def reverse_geocode_google(lat, lon, user):
     params = {"latlng": f"{lat},{lon}", "key": api_key}
 
     try:
-        response = requests.get(url, params=params, timeout=(2, 5))
+        response = http_client.get('google', url, params=params)
         response.raise_for_status()
         data = response.json()
 
@@ -426,13 +687,14 @@ def reverse_geocode_google(lat, lon, user):
 
         # Convert Google schema to Nominatim-style for extractIsoCode
         first_result = data.get("results", [])[0]
-        result_data = {
+        return {
             "name": first_result.get("formatted_address"),
             "address": _parse_google_address_components(first_result.get("address_components", []))
         }
-        return extractIsoCode(user, result_data)
     except requests.exceptions.Timeout:
         return {"error": "Request timed out while contacting Google Maps. Please try again."}
+    except http_client.ProviderUnavailable:
+        return {"error": "Google Maps is temporarily unavailable. Please try again later."}
     except requests.exceptions.ConnectionError:
         return {"error": "Unable to connect to Google Maps service. Please check your internet connection."}
     except requests.exceptions.HTTPError as e:
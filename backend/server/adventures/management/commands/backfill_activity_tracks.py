@@ -0,0 +1,64 @@
+"""
+Django management command that reads the track of every activity with a GPX file into
+Activity.track, used by the activity vector tiles. New and changed activities get their
+track on save; this is for activities uploaded before the column existed.
+
+Usage:
+    python manage.py backfill_activity_tracks
+    python manage.py backfill_activity_tracks --all --batch-size 200
+"""
+
+from django.core.management.base import BaseCommand
+
+from adventures.models import Activity
+from adventures.utils.conditional import bump_data_version
+from adventures.utils.geojson import gpx_to_track
+
+
+class Command(BaseCommand):
+    help = 'Store the GPX track of activities for the vector tiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Number of activities written per batch (default: 100)',
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Also re-read activities that already have a track',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        queryset = Activity.objects.filter(gpx_file__isnull=False).exclude(gpx_file='').only('id', 'user_id', 'gpx_file')
+        if not options['all']:
+            queryset = queryset.filter(track__isnull=True)
+
+        total = queryset.count()
+        if total == 0:
+            self.stdout.write(self.style.WARNING('No activities without a track found'))
+            return
+        self.stdout.write(f'Reading tracks of {total} activities')
+
+        updated = 0
+        user_ids = set()
+        batch = []
+        for activity in queryset.iterator(chunk_size=batch_size):
+            activity.track = gpx_to_track(activity.gpx_file)
+            if activity.track is None:
+                self.stdout.write(self.style.WARNING(f'No track in the GPX file of activity {activity.id}'))
+                continue
+            batch.append(activity)
+            user_ids.add(activity.user_id)
+            if len(batch) >= batch_size:
+                updated += Activity.objects.bulk_update(batch, ['track'])
+                batch = []
+        if batch:
+            updated += Activity.objects.bulk_update(batch, ['track'])
+
+        # bulk_update skips the signals that retire the users' cached tiles
+        bump_data_version(*user_ids)
+        self.stdout.write(self.style.SUCCESS(f'Stored the track of {updated} activities'))
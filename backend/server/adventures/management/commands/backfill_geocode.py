@@ -0,0 +1,190 @@
+"""
+Django management command that fills region, city and country for locations that
+have coordinates but were never geocoded (e.g. imported or legacy locations).
+
+Locations are read in keyset-paginated batches ordered by id. Each batch geocodes
+every unique coordinate once on a thread pool (the provider rate limits still apply),
+writes the results with bulk_update and marks regions/cities of visited locations as
+visited. Locations whose provider lookup failed are handed to the geocode queue, which
+retries them with backoff. The id of the last finished batch is checkpointed in the
+database (BackfillCheckpoint), so an interrupted run continues where it stopped.
+
+Usage:
+    python manage.py backfill_geocode
+    python manage.py backfill_geocode --workers 4 --batch-size 1000
+    python manage.py backfill_geocode --restart
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from adventures.geocoding import resolve_coordinates
+from adventures.models import PERMANENT_GEOCODE_ERRORS, BackfillCheckpoint, GeocodeJob, Location, Visit
+from adventures.utils.conditional import bump_data_version
+from adventures.utils.stats_cache import invalidate_user_stats
+from main import provider_limits
+from worldtravel.models import Country, VisitedCity, VisitedRegion
+
+CHECKPOINT_NAME = 'geocode_backfill'
+
+
+class Command(BaseCommand):
+    help = 'Geocode all locations that have coordinates but no region, city or country'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.GEOCODE_QUEUE_WORKERS,
+            help=f'Number of concurrent geocoding workers (default: {settings.GEOCODE_QUEUE_WORKERS})',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of locations read and written per batch (default: 500)',
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Ignore the saved checkpoint and start from the first location',
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Also re-geocode locations that already have a country',
+        )
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        batch_size = max(1, options['batch_size'])
+
+        checkpoint = BackfillCheckpoint.objects.filter(name=CHECKPOINT_NAME)
+        if options['restart']:
+            checkpoint.delete()
+        last_id = checkpoint.values_list('last_id', flat=True).first()
+        if last_id:
+            self.stdout.write(f'Resuming after location {last_id}')
+
+        queryset = Location.objects.filter(latitude__isnull=False, longitude__isnull=False)
+        if not options['all']:
+            queryset = queryset.filter(country__isnull=True)
+
+        started = time.monotonic()
+        processed = updated = failed = requeued = geocoded = 0
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='geocode-backfill') as pool:
+            while True:
+                batch_queryset = queryset.order_by('id')
+                if last_id:
+                    batch_queryset = batch_queryset.filter(id__gt=last_id)
+                batch = list(batch_queryset.only('id', 'user_id', 'latitude', 'longitude')[:batch_size])
+                if not batch:
+                    break
+
+                # Identical points are geocoded once per batch
+                coordinates = list({(location.latitude, location.longitude) for location in batch})
+                results = dict(zip(coordinates, pool.map(self._resolve, coordinates)))
+                geocoded += len(coordinates)
+
+                last_id = str(batch[-1].id)
+                batch_updated, batch_failed, batch_requeued = self._apply_results(batch, results, batch_size, last_id)
+                processed += len(batch)
+                updated += batch_updated
+                failed += batch_failed
+                requeued += batch_requeued
+
+                elapsed = max(time.monotonic() - started, 0.001)
+                self.stdout.write(
+                    f'  {processed} locations processed ({updated} updated, {failed} failed, '
+                    f'{requeued} queued for retry), {geocoded} unique coordinates, {processed / elapsed:.1f} locations/s'
+                )
+
+        checkpoint.delete()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Geocode backfill complete: {processed} locations processed, {updated} updated, '
+            f'{failed} failed ({requeued} queued for retry) in {elapsed:.1f}s'
+        ))
+
+    def _resolve(self, coordinate):
+        latitude, longitude = coordinate
+        try:
+            with provider_limits.waiting():
+                return resolve_coordinates(latitude, longitude)
+        except Exception as e:
+            return {'error': str(e)}
+        finally:
+            close_old_connections()
+
+    def _apply_results(self, batch, results, batch_size, last_id):
+        """
+        Write the geocoded fields of a batch, mark visited regions/cities, queue the failed
+        lookups for retry and move the checkpoint past the batch. Returns (updated, failed, requeued).
+        """
+        country_ids = dict(
+            Country.objects.filter(
+                country_code__in={r['country_id'] for r in results.values() if r.get('country_id')}
+            ).values_list('country_code', 'id')
+        )
+        today = timezone.now().date()
+        visited_ids = set(
+            Visit.objects.filter(location__in=batch, start_date__date__lte=today)
+            .values_list('location_id', flat=True)
+        )
+
+        now = timezone.now()
+        to_update = []
+        visited_regions = set()
+        visited_cities = set()
+        retry_ids = []
+        failed = 0
+        for location in batch:
+            result = results[(location.latitude, location.longitude)]
+            if 'error' in result:
+                failed += 1
+                if result['error'] not in PERMANENT_GEOCODE_ERRORS:
+                    retry_ids.append(location.id)
+                continue
+
+            location.region_id = result.get('region_id')
+            location.city_id = result.get('city_id')
+            location.country_id = country_ids.get(result.get('country_id'))
+            location.updated_at = now
+            to_update.append(location)
+
+            if location.id in visited_ids:
+                if location.region_id:
+                    visited_regions.add((location.user_id, location.region_id))
+                if location.city_id:
+                    visited_cities.add((location.user_id, location.city_id))
+
+        with transaction.atomic():
+            # bulk_update skips Location.save, so no geocode jobs are queued for these rows
+            Location.objects.bulk_update(
+                to_update, ['region', 'city', 'country', 'updated_at'], batch_size=batch_size
+            )
+
+            VisitedRegion.objects.bulk_create(
+                [VisitedRegion(user_id=user_id, region_id=region_id) for user_id, region_id in visited_regions],
+                ignore_conflicts=True,
+            )
+            VisitedCity.objects.bulk_create(
+                [VisitedCity(user_id=user_id, city_id=city_id) for user_id, city_id in visited_cities],
+                ignore_conflicts=True,
+            )
+
+            # Failed lookups are retried by the queue worker, the checkpoint can move past them
+            GeocodeJob.enqueue_many(retry_ids)
+            BackfillCheckpoint.objects.update_or_create(name=CHECKPOINT_NAME, defaults={'last_id': last_id})
+
+            # The bulk writes skip the signals that retire the owners' stats, ETags and cached tiles
+            user_ids = {location.user_id for location in to_update}
+            transaction.on_commit(lambda: (invalidate_user_stats(*user_ids), bump_data_version(*user_ids)))
+
+        return len(to_update), failed, len(retry_ids)
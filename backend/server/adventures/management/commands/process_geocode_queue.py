@@ -0,0 +1,80 @@
+"""
+Django management command that processes the background reverse geocoding queue.
+
+Locations enqueue a GeocodeJob when they are saved with coordinates. This command
+runs a fixed-size pool of workers that resolve region/city/country for those jobs,
+retrying failed jobs with exponential backoff.
+
+Usage:
+    python manage.py process_geocode_queue
+    python manage.py process_geocode_queue --workers 4
+    python manage.py process_geocode_queue --once
+    python manage.py process_geocode_queue --stats
+"""
+
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from adventures.utils.geocode_queue import queue_stats, run_worker
+
+
+class Command(BaseCommand):
+    help = 'Process pending background geocoding jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.GEOCODE_QUEUE_WORKERS,
+            help=f'Number of concurrent geocoding workers (default: {settings.GEOCODE_QUEUE_WORKERS})',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=5.0,
+            help='Seconds to wait between polls when the queue is empty (default: 5)',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit once there are no more due jobs instead of polling forever',
+        )
+        parser.add_argument(
+            '--stats',
+            action='store_true',
+            help='Print queue depth and throughput and exit',
+        )
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            stats = queue_stats()
+            self.stdout.write(
+                f"Pending: {stats['pending']} ({stats['due']} due)\n"
+                f"Running: {stats['running']}\n"
+                f"Done: {stats['done']}\n"
+                f"Failed: {stats['failed']}\n"
+                f"Completed in last {stats['window_minutes']} min: {stats['completed_in_window']} "
+                f"({stats['throughput_per_minute']} jobs/min)"
+            )
+            return
+
+        workers = max(1, options['workers'])
+        stop_event = threading.Event()
+
+        def _handle_termination(signum, frame):
+            self.stdout.write(f'Received signal {signum}; finishing current jobs...')
+            stop_event.set()
+
+        signal.signal(signal.SIGTERM, _handle_termination)
+        signal.signal(signal.SIGINT, _handle_termination)
+
+        self.stdout.write(f'Starting geocode queue worker with {workers} worker(s)...')
+        processed, succeeded = run_worker(
+            workers, options['poll_interval'], stop_event, once=options['once']
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f'Geocode queue worker stopped: {processed} jobs processed, {succeeded} succeeded')
+        )
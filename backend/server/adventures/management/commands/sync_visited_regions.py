@@ -1,28 +1,47 @@
 """
 Django management command to synchronize visited regions and cities based on user locations.
 
-This command processes all users' visited locations and marks their regions and cities as visited.
-It's designed to be run periodically (e.g., nightly cron job) to keep visited regions/cities up to date.
+This command processes users' visited locations and marks their regions and cities as visited.
+
+Modes:
+    (default)      every user
+    --pending      only users flagged by a location/visit change (PendingVisitedSync), run every minute
+    --incremental  only users with locations/visits changed since the last run's watermark, plus
+                   users whose future visits have started since then; run nightly as reconciliation.
+                   Falls back to every user when no watermark is stored yet.
 
 Usage:
     python manage.py sync_visited_regions
+    python manage.py sync_visited_regions --pending
+    python manage.py sync_visited_regions --incremental
     python manage.py sync_visited_regions --dry-run
     python manage.py sync_visited_regions --user-id 123
     python manage.py sync_visited_regions --batch-size 50
+    python manage.py sync_visited_regions --set-based --workers 4
 """
 
 from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth import get_user_model
-from django.db import transaction
-from django.db.models import Prefetch, Q
-from adventures.models import Location
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Exists, IntegerField, OuterRef, Prefetch, Q
+from django.db.models.functions import Mod
+from django.utils import timezone
+from adventures.models import Location, Visit, PendingVisitedSync
+from adventures.utils.conditional import bump_data_version
+from adventures.utils.stats_cache import invalidate_user_stats
 from worldtravel.models import Region, City, VisitedRegion, VisitedCity
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
 
+# Start time of the last completed full or incremental sync
+WATERMARK_CACHE_KEY = 'visited_sync:watermark'
+
 
 class Command(BaseCommand):
     help = 'Synchronize visited regions and cities based on user locations'
@@ -49,6 +68,27 @@ class Command(BaseCommand):
             action='store_true',
             help='Show detailed output for each user',
         )
+        parser.add_argument(
+            '--pending',
+            action='store_true',
+            help='Only process users flagged by location or visit changes',
+        )
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help='Only process users with changes since the last full or incremental sync',
+        )
+        parser.add_argument(
+            '--set-based',
+            action='store_true',
+            help='Insert all missing visited regions/cities with one INSERT ... SELECT per shard instead of per user',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='With --set-based, number of user shards processed concurrently on separate connections (default: 1)',
+        )
 
     def handle(self, *args, **options):
         dry_run = options['dry_run']
@@ -61,30 +101,57 @@ class Command(BaseCommand):
                 self.style.WARNING('DRY RUN MODE - No changes will be made')
             )
 
+        started_at = timezone.now()
+        watermark = cache.get(WATERMARK_CACHE_KEY) if options['incremental'] else None
+
         # Build user queryset
         users_queryset = User.objects.all()
+
+        if options['pending']:
+            users_queryset = users_queryset.filter(pending_visited_sync__requested_at__lte=started_at)
+        elif watermark:
+            self.stdout.write(f'Processing changes since {watermark.isoformat()}')
+            users_queryset = users_queryset.filter(id__in=self._changed_user_ids(watermark, started_at))
+        elif options['incremental']:
+            self.stdout.write(self.style.WARNING('No sync watermark stored, processing every user'))
         
         if user_id:
             users_queryset = users_queryset.filter(id=user_id)
             if not users_queryset.exists():
                 raise CommandError(f'User with ID {user_id} not found')
 
+        phase_started = time.monotonic()
         total_users = users_queryset.count()
         
         if total_users == 0:
+            self._finish(options, started_at, [], 0)
             self.stdout.write(self.style.WARNING('No users found'))
             return
 
         self.stdout.write(f'Processing {total_users} user(s)...\n')
 
+        if options['set_based']:
+            # A full run needs no user filter at all
+            scoped = options['pending'] or watermark or user_id
+            self._handle_set_based(
+                users_queryset if scoped else None, max(1, options['workers']), dry_run
+            )
+            processed_user_ids = list(users_queryset.values_list('id', flat=True)) if options['pending'] else []
+            self._finish(options, started_at, processed_user_ids, 0)
+            return
+
         # Track overall statistics
         total_new_regions = 0
         total_new_cities = 0
         users_processed = 0
         users_with_changes = 0
+        processed_user_ids = []
+        failed_users = 0
 
         # Process users in batches to manage memory
         user_ids = list(users_queryset.values_list('id', flat=True))
+        self._write_phase('Select users', phase_started)
+        phase_started = time.monotonic()
         
         for i in range(0, len(user_ids), batch_size):
             batch_user_ids = user_ids[i:i + batch_size]
@@ -98,6 +165,7 @@ class Command(BaseCommand):
                     total_new_regions += new_regions
                     total_new_cities += new_cities
                     users_processed += 1
+                    processed_user_ids.append(user_id)
                     
                     if new_regions > 0 or new_cities > 0:
                         users_with_changes += 1
@@ -109,6 +177,7 @@ class Command(BaseCommand):
                         )
                         
                 except Exception as e:
+                    failed_users += 1
                     self.stdout.write(
                         self.style.ERROR(
                             f'Error processing user {user_id}: {str(e)}'
@@ -116,6 +185,9 @@ class Command(BaseCommand):
                     )
                     logger.exception(f'Error processing user {user_id}')
 
+        self._write_phase('Process users', phase_started)
+        self._finish(options, started_at, processed_user_ids, failed_users)
+
         # Summary
         self.stdout.write('\n' + '='*60)
         if dry_run:
@@ -139,30 +211,132 @@ class Command(BaseCommand):
                 )
             )
 
+    def _write_phase(self, label, phase_started):
+        self.stdout.write(f'  {label}: {time.monotonic() - phase_started:.2f}s')
+
+    def _handle_set_based(self, users_queryset, workers, dry_run):
+        """Create every missing visited region, then city, with one statement per user shard."""
+        totals = {}
+        changed_user_ids = set()
+        for field in ('region', 'city'):
+            phase_started = time.monotonic()
+            if workers == 1:
+                shards = [self._insert_missing(field, users_queryset, 0, 1, dry_run)]
+            else:
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    shards = list(pool.map(
+                        lambda shard: self._insert_missing(field, users_queryset, shard, workers, dry_run),
+                        range(workers),
+                    ))
+            totals[field] = sum(count for count, _ in shards)
+            for _, user_ids in shards:
+                changed_user_ids |= user_ids
+            self._write_phase(f'Visited {field} pairs', phase_started)
+        self._after_write(changed_user_ids)
+
+        self.stdout.write('\n' + '='*60)
+        verb = 'Would create' if dry_run else 'Created'
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'{"DRY RUN" if dry_run else "SYNC"} COMPLETE (set-based, {workers} worker(s)):\n'
+                f'  {verb} {totals["region"]} new visited regions\n'
+                f'  {verb} {totals["city"]} new visited cities'
+            )
+        )
+
+    def _insert_missing(self, field, users_queryset, shard, shards, dry_run):
+        """
+        INSERT ... SELECT the (user, region|city) pairs of visited locations that are not
+        visited yet, for the users where user_id % shards == shard. Returns the row count and
+        the ids of the users that got new rows.
+        """
+        visited_model = VisitedRegion if field == 'region' else VisitedCity
+        column = f'{field}_id'
+        already_visited = visited_model.objects.filter(
+            user_id=OuterRef('user_id'), **{column: OuterRef(column)}
+        )
+        pairs = (
+            Location.objects.visited()
+            .filter(**{f'{column}__isnull': False})
+            .filter(~Exists(already_visited))
+        )
+        if users_queryset is not None:
+            pairs = pairs.filter(user_id__in=users_queryset.values('id'))
+        if shards > 1:
+            pairs = pairs.annotate(shard=Mod('user_id', shards, output_field=IntegerField())).filter(shard=shard)
+        pairs = pairs.order_by().values_list('user_id', column).distinct()
+
+        try:
+            if dry_run:
+                return pairs.count(), set()
+            sql, params = pairs.query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'INSERT INTO {visited_model._meta.db_table} (user_id, {column}) {sql} '
+                    f'ON CONFLICT DO NOTHING RETURNING user_id',
+                    params,
+                )
+                user_ids = [row[0] for row in cursor.fetchall()]
+                return len(user_ids), set(user_ids)
+        finally:
+            if shards > 1:
+                # Each shard runs on its own thread-local connection
+                connection.close()
+
+    def _after_write(self, user_ids):
+        """Bulk inserts skip the model signals, retire the changed users' stats, ETags and cached tiles here."""
+        if user_ids:
+            invalidate_user_stats(*user_ids)
+            bump_data_version(*user_ids)
+
+    def _changed_user_ids(self, watermark, now):
+        """Users with locations or visits changed since the watermark, or with visits that started since then."""
+        user_ids = set(
+            Location.objects.filter(updated_at__gt=watermark).values_list('user_id', flat=True)
+        )
+        user_ids |= set(
+            Visit.objects.filter(
+                Q(updated_at__gt=watermark) |
+                Q(start_date__date__gt=watermark.date(), start_date__date__lte=now.date())
+            ).values_list('location__user_id', flat=True)
+        )
+        return user_ids
+
+    def _finish(self, options, started_at, processed_user_ids, failed_users):
+        """
+        Clear the pending flags of processed users, or advance the watermark after a
+        full/incremental run. Failed users stay pending and keep the watermark in place.
+        """
+        if options['dry_run'] or options.get('user_id'):
+            return
+        if options['pending']:
+            # Users flagged again while they were processed stay pending
+            PendingVisitedSync.objects.filter(
+                user_id__in=processed_user_ids, requested_at__lte=started_at
+            ).delete()
+        elif not failed_users:
+            cache.set(WATERMARK_CACHE_KEY, started_at, None)
+
     def _process_user(self, user_id, dry_run=False, verbose=False):
         """
         Process a single user and return counts of new regions and cities.
         Returns: (new_regions_count, new_cities_count)
         """
-        # Get all visited locations with their region and city data in a single query
+        # Get the region and city ids of all visited locations in a single query
         visited_locations = Location.objects.filter(
             user_id=user_id
-        ).select_related('region', 'city')
+        ).visited().values_list('region_id', 'city_id')
         
         # Collect unique regions and cities from visited locations
         regions_to_mark = set()
         cities_to_mark = set()
         
-        for location in visited_locations:
-            # Only process locations that are marked as visited
-            if not location.is_visited_status():
-                continue
+        for region_id, city_id in visited_locations:
+            if region_id:
+                regions_to_mark.add(region_id)
             
-            if location.region_id:
-                regions_to_mark.add(location.region_id)
-            
-            if location.city_id:
-                cities_to_mark.add(location.city_id)
+            if city_id:
+                cities_to_mark.add(city_id)
         
         # Early exit if no regions or cities to mark
         if not regions_to_mark and not cities_to_mark:
@@ -183,6 +357,9 @@ class Command(BaseCommand):
                 user_id, cities_to_mark, dry_run
             )
         
+        if not dry_run and (new_regions_count > 0 or new_cities_count > 0):
+            self._after_write([user_id])
+
         if verbose and (new_regions_count > 0 or new_cities_count > 0):
             self.stdout.write(
                 f'User {user_id}: '
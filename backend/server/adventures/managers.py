@@ -1,7 +1,74 @@
 from django.db import models
-from django.db.models import Q
+from django.db.models import Count, Exists, F, OuterRef, Prefetch, Q
+from django.utils import timezone
 
-class LocationManager(models.Manager):
+
+class LocationQuerySet(models.QuerySet):
+    def with_visited(self):
+        """
+        Annotate `is_visited`: whether the location has a visit that started today or earlier.
+        Same rule as adventures.utils.get_is_visited.is_location_visited, computed in SQL.
+        """
+        from adventures.models import Visit
+
+        visited = Visit.objects.filter(
+            location=OuterRef('pk'),
+            start_date__date__lte=timezone.now().date(),
+        )
+        return self.annotate(is_visited=Exists(visited))
+
+    def visited(self):
+        return self.with_visited().filter(is_visited=True)
+
+    def for_serializer(self, user=None, fields=None):
+        """
+        Load everything LocationSerializer renders in a fixed number of queries, however many
+        locations are serialized: owner and city/region/country with their counts, category with
+        its location count, images, attachments, visits with their activities, trails and
+        collections. `user` is the requesting user, for the per-user country visit counts.
+        `fields` is the set of rendered field names of a sparse response (see
+        CustomModelSerializer); relations that are not rendered are not loaded.
+        """
+        from adventures.models import Activity, Category, ContentAttachment, ContentImage, Trail, Visit
+        from worldtravel.models import Country, Region
+
+        def wanted(name):
+            return fields is None or name in fields
+
+        related = ['user'] if wanted('user') else []
+        if wanted('city'):
+            related.append('city__region__country')
+        queryset = self.select_related(*related) if related else self
+        if wanted('city'):
+            queryset = queryset.defer('city__region__geometry')
+
+        prefetches = {
+            'category': lambda: Prefetch(
+                'category',
+                queryset=Category.objects.annotate(
+                    num_locations=Count('location', filter=Q(location__user=F('user')))
+                ),
+            ),
+            'region': lambda: Prefetch(
+                'region', queryset=Region.objects.select_related('country').defer('geometry').with_counts()
+            ),
+            'country': lambda: Prefetch('country', queryset=Country.objects.with_counts(user)),
+            # CustomModelSerializer renders the owner's uuid of every nested object
+            'images': lambda: Prefetch('images', queryset=ContentImage.objects.select_related('user')),
+            'attachments': lambda: Prefetch('attachments', queryset=ContentAttachment.objects.select_related('user')),
+            'visits': lambda: Prefetch(
+                'visits',
+                queryset=Visit.objects.prefetch_related(
+                    Prefetch('activities', queryset=Activity.objects.select_related('user'))
+                ),
+            ),
+            'trails': lambda: Prefetch('trails', queryset=Trail.objects.select_related('user')),
+            'collections': lambda: 'collections',
+        }
+        return queryset.prefetch_related(*(build() for name, build in prefetches.items() if wanted(name)))
+
+
+class LocationManager(models.Manager.from_queryset(LocationQuerySet)):
     def retrieve_locations(self, user, include_owned=False, include_shared=False, include_public=False):
         query = Q()
 
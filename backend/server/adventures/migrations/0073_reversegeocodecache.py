@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-17 06:11
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adventures', '0072_geocodejob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReverseGeocodeCache',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False, unique=True)),
+                ('cell', models.CharField(max_length=40)),
+                ('precision', models.PositiveSmallIntegerField()),
+                ('provider', models.CharField(max_length=20)),
+                ('response', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Reverse Geocode Cache Entry',
+                'verbose_name_plural': 'Reverse Geocode Cache',
+                'unique_together': {('cell', 'precision')},
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-17 06:19
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adventures', '0073_reversegeocodecache'),
+        ('users', '0006_customuser_default_currency'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingVisitedSync',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='pending_visited_sync', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('requested_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Pending Visited Sync',
+                'verbose_name_plural': 'Pending Visited Syncs',
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-17 06:37
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adventures', '0074_pendingvisitedsync'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activity',
+            name='track',
+            field=django.contrib.gis.db.models.fields.MultiLineStringField(blank=True, editable=False, null=True, srid=4326),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.8 on 2026-10-17 06:39
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adventures', '0075_activity_track'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='point',
+            field=django.contrib.gis.db.models.fields.PointField(blank=True, editable=False, null=True, srid=4326),
+        ),
+        migrations.AddField(
+            model_name='lodging',
+            name='point',
+            field=django.contrib.gis.db.models.fields.PointField(blank=True, editable=False, null=True, srid=4326),
+        ),
+        migrations.AddField(
+            model_name='transportation',
+            name='destination_point',
+            field=django.contrib.gis.db.models.fields.PointField(blank=True, editable=False, null=True, srid=4326),
+        ),
+        migrations.AddField(
+            model_name='transportation',
+            name='origin_point',
+            field=django.contrib.gis.db.models.fields.PointField(blank=True, editable=False, null=True, srid=4326),
+        ),
+        migrations.RunSQL(
+            sql=(
+                "UPDATE adventures_location "
+                "SET point = ST_SetSRID(ST_MakePoint(longitude, latitude), 4326) "
+                "WHERE longitude IS NOT NULL AND latitude IS NOT NULL"
+            ),
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.RunSQL(
+            sql=(
+                "UPDATE adventures_lodging "
+                "SET point = ST_SetSRID(ST_MakePoint(longitude, latitude), 4326) "
+                "WHERE longitude IS NOT NULL AND latitude IS NOT NULL"
+            ),
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.RunSQL(
+            sql=(
+                "UPDATE adventures_transportation SET "
+                "origin_point = CASE WHEN origin_longitude IS NOT NULL AND origin_latitude IS NOT NULL "
+                "THEN ST_SetSRID(ST_MakePoint(origin_longitude, origin_latitude), 4326) END, "
+                "destination_point = CASE WHEN destination_longitude IS NOT NULL AND destination_latitude IS NOT NULL "
+                "THEN ST_SetSRID(ST_MakePoint(destination_longitude, destination_latitude), 4326) END "
+                "WHERE origin_latitude IS NOT NULL OR destination_latitude IS NOT NULL"
+            ),
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-17 06:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adventures', '0077_backfillcheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reversegeocodecache',
+            index=models.Index(fields=['updated_at'], name='adventures__updated_c84672_idx'),
+        ),
+    ]
@@ -1,9 +1,10 @@
 import os
 import uuid
 from django.db import models
+from django.contrib.gis.db import models as gis_models
+from django.contrib.gis.geos import Point
 from django.utils.deconstruct import deconstructible
 from adventures.managers import LocationManager
-import threading
 from django.contrib.auth import get_user_model
 from django.contrib.postgres.fields import ArrayField
 from django_resized import ResizedImageField
@@ -14,48 +15,63 @@ from django.utils import timezone
 from adventures.utils.timezones import TIMEZONES
 from adventures.utils.sports_types import SPORT_TYPE_CHOICES
 from adventures.utils.get_is_visited import is_location_visited
+from adventures.utils.geojson import gpx_to_track
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.db.models import Q
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericRelation
 
+def coordinates_to_point(latitude, longitude):
+    """Point (SRID 4326) for the spatial columns synced from latitude/longitude, None when either is missing."""
+    if latitude is None or longitude is None:
+        return None
+    return Point(float(longitude), float(latitude), srid=4326)
+
+
+def _with_synced_fields(update_fields, coordinate_fields, point_field):
+    """Add the point column to update_fields when the coordinates it is built from are saved."""
+    if update_fields is not None and set(update_fields) & set(coordinate_fields):
+        return {*update_fields, point_field}
+    return update_fields
+
 def background_geocode_and_assign(location_id: str):
-    print(f"[Location Geocode Thread] Starting geocode for location {location_id}")
-    try:
-        location = Location.objects.get(id=location_id)
-        if not (location.latitude and location.longitude):
-            return
-        
-        from adventures.geocoding import reverse_geocode  # or wherever you defined it
-        is_visited = location.is_visited_status()
-        result = reverse_geocode(location.latitude, location.longitude, location.user)
-
-        if 'region_id' in result:
-            region = Region.objects.filter(id=result['region_id']).first()
-            if region:
-                location.region = region
-                if is_visited:
-                    VisitedRegion.objects.get_or_create(user=location.user, region=region)
-
-        if 'city_id' in result:
-            city = City.objects.filter(id=result['city_id']).first()
-            if city:
-                location.city = city
-                if is_visited:
-                    VisitedCity.objects.get_or_create(user=location.user, city=city)
-
-        if 'country_id' in result:
-            country = Country.objects.filter(country_code=result['country_id']).first()
-            if country:
-                location.country = country
-
-        # Save updated location info
-        # Save updated location info, skip geocode threading
-        location.save(update_fields=["region", "city", "country"], _skip_geocode=True)
-
-    except Exception as e:
-        # Optional: log or print the error
-        print(f"[Location Geocode Thread] Error processing {location_id}: {e}")
+    """
+    Reverse geocode a location and assign its region, city and country.
+    Called by the geocode queue worker; raises GeocodeError when the provider
+    failed in a way that is worth retrying.
+    """
+    location = Location.objects.filter(id=location_id).with_visited().select_related('user').first()
+    if not location or not (location.latitude and location.longitude):
+        return
+
+    from adventures.geocoding import resolve_coordinates, GeocodeError
+    is_visited = location.is_visited
+    result = resolve_coordinates(location.latitude, location.longitude)
+
+    if 'error' in result and result['error'] not in PERMANENT_GEOCODE_ERRORS:
+        raise GeocodeError(result['error'])
+
+    if 'region_id' in result:
+        region = Region.objects.filter(id=result['region_id']).defer('geometry').first()
+        if region:
+            location.region = region
+            if is_visited:
+                VisitedRegion.objects.get_or_create(user=location.user, region=region)
+
+    if 'city_id' in result:
+        city = City.objects.filter(id=result['city_id']).first()
+        if city:
+            location.city = city
+            if is_visited:
+                VisitedCity.objects.get_or_create(user=location.user, city=city)
+
+    if 'country_id' in result:
+        country = Country.objects.filter(country_code=result['country_id']).first()
+        if country:
+            location.country = country
+
+    # Save updated location info, skip re-queueing the geocode
+    location.save(update_fields=["region", "city", "country"], _skip_geocode=True)
 
 def validate_file_extension(value):
     import os
@@ -116,6 +132,19 @@ TRANSPORTATION_TYPES = [
     ('other', 'Other')
 ]
 
+GEOCODE_JOB_STATUSES = [
+    ('pending', 'Pending'),
+    ('running', 'Running'),
+    ('done', 'Done'),
+    ('failed', 'Failed')
+]
+
+# Geocoding errors that will not go away by retrying, the job is finished without a region
+PERMANENT_GEOCODE_ERRORS = {
+    "No region found",
+    "No location found for the given coordinates.",
+}
+
 # Assuming you have a default user ID you want to use
 default_user = 1  # Replace with an actual user ID
 
@@ -164,6 +193,8 @@ class Location(models.Model):
     is_public = models.BooleanField(default=False)
     longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    # Built from latitude/longitude on save, GiST indexed for bbox and proximity queries
+    point = gis_models.PointField(srid=4326, null=True, blank=True, editable=False)
     city = models.ForeignKey(City, on_delete=models.SET_NULL, blank=True, null=True)
     region = models.ForeignKey(Region, on_delete=models.SET_NULL, blank=True, null=True)
     country = models.ForeignKey(Country, on_delete=models.SET_NULL, blank=True, null=True)
@@ -178,6 +209,9 @@ class Location(models.Model):
     objects = LocationManager()
 
     def is_visited_status(self):
+        # Locations loaded through LocationQuerySet.with_visited() already carry the answer
+        if hasattr(self, 'is_visited'):
+            return self.is_visited
         return is_location_visited(self)
 
     def clean(self, skip_shared_validation=False):
@@ -218,6 +252,8 @@ class Location(models.Model):
             )
             self.category = category
 
+        self.point = coordinates_to_point(self.latitude, self.longitude)
+        update_fields = _with_synced_fields(update_fields, ('latitude', 'longitude'), 'point')
         result = super().save(force_insert, force_update, using, update_fields)
 
         # Validate collections after saving (since M2M relationships require saved instance)
@@ -229,14 +265,12 @@ class Location(models.Model):
                 # For now, we'll re-raise the error
                 raise e
 
-        # ⛔ Skip threading if called from geocode background thread
+        # ⛔ Skip queueing if called from the geocode worker
         if _skip_geocode:
             return result
 
         if self.latitude and self.longitude:
-            thread = threading.Thread(target=background_geocode_and_assign, args=(str(self.id),))
-            thread.daemon = True  # Allows the thread to exit when the main program ends
-            thread.start()
+            GeocodeJob.enqueue(self.id)
 
         return result
 
@@ -250,6 +284,122 @@ class Location(models.Model):
 
     def __str__(self):
         return self.name
+
+class GeocodeJob(models.Model):
+    """
+    Durable reverse geocode request for a location. There is at most one job per
+    location so repeated saves collapse into a single pending job, which is
+    picked up by the process_geocode_queue worker.
+    """
+    id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True, primary_key=True)
+    location = models.OneToOneField(Location, on_delete=models.CASCADE, related_name='geocode_job')
+    status = models.CharField(max_length=20, choices=GEOCODE_JOB_STATUSES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    requested_at = models.DateTimeField(default=timezone.now)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(blank=True, null=True)
+    completed_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Geocode Job"
+        verbose_name_plural = "Geocode Jobs"
+        indexes = [
+            models.Index(fields=["status", "run_after"]),
+        ]
+
+    @classmethod
+    def enqueue(cls, location_id):
+        """Create or reset the pending job for a location."""
+        now = timezone.now()
+        job, _ = cls.objects.update_or_create(
+            location_id=location_id,
+            defaults={
+                'status': 'pending',
+                'attempts': 0,
+                'requested_at': now,
+                'run_after': now,
+                'last_error': None,
+            }
+        )
+        return job
+
+    @classmethod
+    def enqueue_many(cls, location_ids):
+        """Create or reset the pending jobs for many locations in a single upsert."""
+        now = timezone.now()
+        return cls.objects.bulk_create(
+            [cls(location_id=location_id, requested_at=now, run_after=now) for location_id in set(location_ids)],
+            update_conflicts=True,
+            unique_fields=['location'],
+            update_fields=['status', 'attempts', 'requested_at', 'run_after', 'last_error', 'updated_at'],
+        )
+
+    def __str__(self):
+        return f"Geocode {self.location_id} ({self.status})"
+
+class ReverseGeocodeCache(models.Model):
+    """
+    Provider reverse geocode response for a quantized coordinate cell, shared between users.
+    Only user independent data is stored; visited flags are computed per request.
+    """
+    id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True, primary_key=True)
+    cell = models.CharField(max_length=40)
+    precision = models.PositiveSmallIntegerField()
+    provider = models.CharField(max_length=20)
+    response = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Reverse Geocode Cache Entry"
+        verbose_name_plural = "Reverse Geocode Cache"
+        unique_together = ('cell', 'precision')
+        indexes = [
+            models.Index(fields=["updated_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.cell} ({self.provider})"
+
+class BackfillCheckpoint(models.Model):
+    """
+    Progress of a resumable backfill command: the id of the last finished batch. Stored in the
+    database so an evicted cache or a restart never skips or repeats rows.
+    """
+    name = models.CharField(max_length=100, primary_key=True)
+    last_id = models.CharField(max_length=100)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Backfill Checkpoint"
+        verbose_name_plural = "Backfill Checkpoints"
+
+    def __str__(self):
+        return f"{self.name} after {self.last_id}"
+
+class PendingVisitedSync(models.Model):
+    """
+    User whose visited regions/cities need to be recomputed because one of their
+    locations or visits changed. Rows are written by signals and consumed by
+    `sync_visited_regions --pending`, so only changed users are processed.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='pending_visited_sync')
+    requested_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = "Pending Visited Sync"
+        verbose_name_plural = "Pending Visited Syncs"
+
+    @classmethod
+    def mark(cls, user_id):
+        """Flag a user for the next incremental sync."""
+        cls.objects.update_or_create(user_id=user_id, defaults={'requested_at': timezone.now()})
+
+    def __str__(self):
+        return f"Visited sync for user {self.user_id}"
     
 class CollectionInvite(models.Model):
     id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True, primary_key=True)
@@ -325,6 +475,9 @@ class Transportation(models.Model):
     origin_longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     destination_latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     destination_longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    # Built from the coordinates on save, GiST indexed for bbox and proximity queries
+    origin_point = gis_models.PointField(srid=4326, null=True, blank=True, editable=False)
+    destination_point = gis_models.PointField(srid=4326, null=True, blank=True, editable=False)
     start_code = models.CharField(max_length=100, blank=True, null=True) # Could be airport code, station code, etc.
     end_code = models.CharField(max_length=100, blank=True, null=True)   # Could be airport code, station code, etc.
     to_location = models.CharField(max_length=200, blank=True, null=True)
@@ -347,6 +500,19 @@ class Transportation(models.Model):
             if self.user != self.collection.user:
                 raise ValidationError('Transportations must be associated with collections owned by the same user. Collection owner: ' + self.collection.user.username + ' Transportation owner: ' + self.user.username)
 
+    def save(self, *args, **kwargs):
+        self.origin_point = coordinates_to_point(self.origin_latitude, self.origin_longitude)
+        self.destination_point = coordinates_to_point(self.destination_latitude, self.destination_longitude)
+        update_fields = _with_synced_fields(
+            kwargs.get('update_fields'), ('origin_latitude', 'origin_longitude'), 'origin_point'
+        )
+        update_fields = _with_synced_fields(
+            update_fields, ('destination_latitude', 'destination_longitude'), 'destination_point'
+        )
+        if update_fields is not None:
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+
     def delete(self, *args, **kwargs):
         # Delete all associated images and attachments
         for image in self.images.all():
@@ -565,6 +731,8 @@ class Lodging(models.Model):
     price = MoneyField(max_digits=12, decimal_places=2, default_currency='USD', null=True, blank=True)
     latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    # Built from latitude/longitude on save, GiST indexed for bbox and proximity queries
+    point = gis_models.PointField(srid=4326, null=True, blank=True, editable=False)
     location = models.CharField(max_length=200, blank=True, null=True)
     is_public = models.BooleanField(default=False)
     collection = models.ForeignKey('Collection', on_delete=models.CASCADE, blank=True, null=True)
@@ -585,6 +753,13 @@ class Lodging(models.Model):
             if self.user != self.collection.user:
                 raise ValidationError('Lodging must be associated with collections owned by the same user. Collection owner: ' + self.collection.user.username + ' Lodging owner: ' + self.user.username)
 
+    def save(self, *args, **kwargs):
+        self.point = coordinates_to_point(self.latitude, self.longitude)
+        update_fields = _with_synced_fields(kwargs.get('update_fields'), ('latitude', 'longitude'), 'point')
+        if update_fields is not None:
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+
     def delete(self, *args, **kwargs):
         # Delete all associated images and attachments
         for image in self.images.all():
@@ -679,9 +854,27 @@ class Activity(models.Model):
     # Optional links
     external_service_id = models.CharField(max_length=100, blank=True, null=True)  # E.g., Strava ID
 
+    # Track of the GPX file, kept in sync on save for the vector tiles
+    track = gis_models.MultiLineStringField(srid=4326, blank=True, null=True, editable=False)
+
     def __str__(self):
         return f"{self.name} ({self.sport_type})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_gpx_name = instance.__dict__.get('gpx_file') or None
+        return instance
+
+    def save(self, *args, **kwargs):
+        gpx_name = self.gpx_file.name if self.gpx_file else None
+        if gpx_name != getattr(self, '_loaded_gpx_name', None):
+            self.track = gpx_to_track(self.gpx_file)
+            self._loaded_gpx_name = gpx_name
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'track'}
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = "Activity"
         verbose_name_plural = "Activities"
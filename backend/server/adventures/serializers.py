@@ -1,11 +1,10 @@
-import os
 from .models import Location, ContentImage, ChecklistItem, Collection, Note, Transportation, Checklist, Visit, Category, ContentAttachment, Lodging, CollectionInvite, Trail, Activity, CollectionItineraryItem, CollectionItineraryDay
 from rest_framework import serializers
-from main.utils import CustomModelSerializer
+from main.utils import CustomModelSerializer, PUBLIC_URL
 from users.serializers import CustomUserDetailsSerializer
 from worldtravel.serializers import CountrySerializer, RegionSerializer, CitySerializer
 from geopy.distance import geodesic
-from integrations.models import ImmichIntegration
+from integrations.utils import get_immich_resolver
 from adventures.utils.geojson import gpx_to_geojson
 import gpxpy
 import logging
@@ -18,9 +17,7 @@ def _build_profile_pic_url(user):
     if not getattr(user, 'profile_pic', None):
         return None
 
-    public_url = os.environ.get('PUBLIC_URL', 'http://127.0.0.1:8000').rstrip('/')
-    public_url = public_url.replace("'", "")
-    return f"{public_url}/media/{user.profile_pic.name}"
+    return f"{PUBLIC_URL}/media/{user.profile_pic.name}"
 
 
 def _serialize_collaborator(user, owner_id=None, request_user=None):
@@ -46,25 +43,22 @@ class ContentImageSerializer(CustomModelSerializer):
         read_only_fields = ['id', 'user']
 
     def to_representation(self, instance):
-        # If immich_id is set, check for user integration once
+        # If immich_id is set, look up the owner's integration (once per user and request)
         integration = None
         if instance.immich_id:
-            integration = ImmichIntegration.objects.filter(user=instance.user).first()
+            integration = get_immich_resolver(self.context).get(instance.user_id)
             if not integration:
                 return None  # Skip if Immich image but no integration
 
         # Base representation
         representation = super().to_representation(instance)
 
-        # Prepare public URL once
-        public_url = os.environ.get('PUBLIC_URL', 'http://127.0.0.1:8000').rstrip('/').replace("'", "")
-
         if instance.immich_id:
             # Use Immich integration URL
-            representation['image'] = f"{public_url}/api/integrations/immich/{integration.id}/get/{instance.immich_id}"
+            representation['image'] = f"{PUBLIC_URL}/api/integrations/immich/{integration.id}/get/{instance.immich_id}"
         elif instance.image:
             # Use local image URL
-            representation['image'] = f"{public_url}/media/{instance.image.name}"
+            representation['image'] = f"{PUBLIC_URL}/media/{instance.image.name}"
 
         return representation
     
@@ -75,6 +69,7 @@ class AttachmentSerializer(CustomModelSerializer):
         model = ContentAttachment
         fields = ['id', 'file', 'extension', 'name', 'user', 'geojson']
         read_only_fields = ['id', 'user']
+        expandable_fields = ['geojson']
 
     def get_extension(self, obj):
         return obj.file.name.split('.')[-1]
@@ -82,11 +77,7 @@ class AttachmentSerializer(CustomModelSerializer):
     def to_representation(self, instance):
         representation = super().to_representation(instance)
         if instance.file:
-            public_url = os.environ.get('PUBLIC_URL', 'http://127.0.0.1:8000').rstrip('/')
-            #print(public_url)
-            # remove any  ' from the url
-            public_url = public_url.replace("'", "")
-            representation['file'] = f"{public_url}/media/{instance.file.name}"
+            representation['file'] = f"{PUBLIC_URL}/media/{instance.file.name}"
         return representation
 
     def get_geojson(self, obj):
@@ -118,6 +109,9 @@ class CategorySerializer(serializers.ModelSerializer):
         return instance
     
     def get_num_locations(self, obj):
+        # Annotated by Location.objects.for_serializer()
+        if hasattr(obj, 'num_locations'):
+            return obj.num_locations
         return Location.objects.filter(category=obj, user=obj.user).count()
     
 class TrailSerializer(CustomModelSerializer):
@@ -208,18 +202,18 @@ class ActivitySerializer(CustomModelSerializer):
             'start_lat', 'start_lng', 'end_lat', 'end_lng', 'external_service_id', 'geojson'
         ]
         read_only_fields = ['id', 'user']
+        expandable_fields = ['geojson']
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
         if instance.gpx_file:
-            public_url = os.environ.get('PUBLIC_URL', 'http://127.0.0.1:8000').rstrip('/').replace("'", "")
-            representation['gpx_file'] = f"{public_url}/media/{instance.gpx_file.name}"
+            representation['gpx_file'] = f"{PUBLIC_URL}/media/{instance.gpx_file.name}"
         return representation
     
     def get_geojson(self, obj):
         return gpx_to_geojson(obj.gpx_file)
 
-class VisitSerializer(serializers.ModelSerializer):
+class VisitSerializer(CustomModelSerializer):
 
     activities = ActivitySerializer(many=True, read_only=True, required=False)
 
@@ -227,6 +221,7 @@ class VisitSerializer(serializers.ModelSerializer):
         model = Visit
         fields = ['id', 'start_date', 'end_date', 'timezone', 'notes', 'activities','location', 'created_at', 'updated_at']
         read_only_fields = ['id', 'created_at', 'updated_at']
+        expandable_fields = ['activities']
 
     def create(self, validated_data):
         if not validated_data.get('end_date') and validated_data.get('start_date'):
@@ -283,6 +278,10 @@ class LocationSerializer(CustomModelSerializer):
             'price', 'price_currency'
         ]
         read_only_fields = ['id', 'created_at', 'updated_at', 'user', 'is_visited']
+        # Left out of sparse responses (?fields= / ?expand=) unless requested
+        expandable_fields = [
+            'images', 'visits', 'attachments', 'trails', 'collections', 'category', 'city', 'country', 'region'
+        ]
 
     # Makes it so the whole user object is returned in the serializer instead of just the user uuid
     def to_representation(self, instance):
@@ -292,7 +291,8 @@ class LocationSerializer(CustomModelSerializer):
 
         if not is_nested:
             # Full representation for standalone locations
-            representation['user'] = CustomUserDetailsSerializer(instance.user, context=self.context).data
+            if 'user' in representation:
+                representation['user'] = CustomUserDetailsSerializer(instance.user, context=self.context).data
         else:
             # Slim representation for nested contexts, but keep allowed fields
             fields_to_remove = [
@@ -381,7 +381,12 @@ class LocationSerializer(CustomModelSerializer):
         if category_data:
             user = self.context['request'].user
             name = category_data.get('name', '').lower()
-            existing_category = Category.objects.filter(user=user, name=name).first()
+            # Batches pass the user's categories by name so items do not look them up one by one
+            categories = self.context.get('categories')
+            if categories is not None:
+                existing_category = categories.get(name)
+            else:
+                existing_category = Category.objects.filter(user=user, name=name).first()
             if existing_category:
                 return existing_category
             category_data['name'] = name
@@ -519,7 +524,8 @@ class TransportationSerializer(CustomModelSerializer):
         return None
 
     def _get_gpx_distance_km(self, obj):
-        gpx_attachments = obj.attachments.filter(file__iendswith='.gpx')
+        # Filtered in Python so prefetched attachments are reused
+        gpx_attachments = [a for a in obj.attachments.all() if a.file and a.file.name.lower().endswith('.gpx')]
         for attachment in gpx_attachments:
             distance_km = self._parse_gpx_distance_km(attachment.file)
             if distance_km is not None:
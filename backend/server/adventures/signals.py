@@ -1,8 +1,14 @@
-from django.db.models.signals import m2m_changed, post_delete
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
 from django.contrib.contenttypes.models import ContentType
 
-from adventures.models import Location
+from adventures.models import (
+    Activity, Category, Checklist, ChecklistItem, Collection, CollectionItineraryDay, CollectionItineraryItem,
+    ContentAttachment, ContentImage, Location, Lodging, Note, PendingVisitedSync, Trail, Transportation, Visit,
+)
+from adventures.utils.conditional import bump_data_version
+from adventures.utils.stats_cache import invalidate_user_stats
+from worldtravel.models import VisitedCity, VisitedRegion
 
 
 @receiver(m2m_changed, sender=Location.collections.through)
@@ -72,3 +78,87 @@ def _remove_collection_itinerary_items_on_object_delete(sender, instance, **kwar
             # If deletion fails for any reason, do nothing; we don't want to
             # raise errors during another model's delete.
             pass
+
+
+@receiver(post_save, sender=Location)
+def _mark_visited_sync_on_location_save(sender, instance, **kwargs):
+    """Recompute the owner's visited regions/cities when a location (or its region/city) changes."""
+    PendingVisitedSync.mark(instance.user_id)
+
+
+def _visit_owner_id(visit):
+    """
+    Owner of the visit's location. Several receivers need it for every visit write, so it is
+    looked up once and kept on the instance (keyed by location_id, which an admin can change).
+    """
+    cached = getattr(visit, '_owner_id_cache', None)
+    if cached and cached[0] == visit.location_id:
+        return cached[1]
+    if Visit.location.is_cached(visit) and visit.location.pk == visit.location_id:
+        user_id = visit.location.user_id
+    else:
+        user_id = Location.objects.filter(id=visit.location_id).values_list('user_id', flat=True).first()
+    visit._owner_id_cache = (visit.location_id, user_id)
+    return user_id
+
+
+@receiver(post_save, sender=Visit)
+def _mark_visited_sync_on_visit_save(sender, instance, **kwargs):
+    """A new or moved visit can make a location visited."""
+    user_id = _visit_owner_id(instance)
+    if user_id:
+        PendingVisitedSync.mark(user_id)
+
+
+@receiver(post_save, sender=Location)
+@receiver(post_delete, sender=Location)
+@receiver(post_save, sender=Activity)
+@receiver(post_delete, sender=Activity)
+@receiver(post_save, sender=Collection)
+@receiver(post_delete, sender=Collection)
+@receiver(post_save, sender=VisitedRegion)
+@receiver(post_delete, sender=VisitedRegion)
+@receiver(post_save, sender=VisitedCity)
+@receiver(post_delete, sender=VisitedCity)
+def _invalidate_stats_on_write(sender, instance, **kwargs):
+    """Drop the owner's cached stats snapshot when something it counts changes."""
+    invalidate_user_stats(instance.user_id)
+
+
+@receiver(post_save, sender=Visit)
+@receiver(post_delete, sender=Visit)
+def _invalidate_stats_on_visit_write(sender, instance, **kwargs):
+    """Visits decide whether a location counts as visited."""
+    invalidate_user_stats(_visit_owner_id(instance))
+
+
+# Everything a location, collection, stats or world data response renders, see adventures.utils.conditional
+VERSIONED_MODELS = (
+    Location, Visit, Activity, Trail, ContentImage, ContentAttachment, Category, Collection,
+    CollectionItineraryDay, CollectionItineraryItem, Transportation, Lodging, Note, Checklist, ChecklistItem,
+    VisitedRegion, VisitedCity,
+)
+
+
+def _owner_id(instance):
+    if isinstance(instance, Visit):
+        return _visit_owner_id(instance)
+    if isinstance(instance, (CollectionItineraryDay, CollectionItineraryItem)):
+        return Collection.objects.filter(id=instance.collection_id).values_list('user_id', flat=True).first()
+    return instance.user_id
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def _bump_data_version_on_write(sender, instance, **kwargs):
+    """Change the ETag of every response that can render the written object."""
+    if sender in VERSIONED_MODELS:
+        bump_data_version(_owner_id(instance))
+
+
+@receiver(m2m_changed, sender=Location.collections.through)
+@receiver(m2m_changed, sender=Collection.shared_with.through)
+def _bump_data_version_on_m2m_change(sender, instance, action, **kwargs):
+    """Linking locations to collections and sharing collections skip post_save."""
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_data_version(getattr(instance, 'user_id', instance.pk))
@@ -1,3 +1,1133 @@
-from django.test import TestCase
+import io
+import json
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.contrib.gis.geos import LineString, MultiLineString, MultiPolygon, Polygon
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, connection, transaction
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from adventures import geocoding
+from adventures.management.commands import backfill_geocode, sync_visited_regions
+from adventures.models import (
+    Activity, BackfillCheckpoint, Category, Collection, ContentImage, GeocodeJob, Location, PendingVisitedSync,
+    ReverseGeocodeCache, Trail, Visit,
+)
+from adventures.utils import geocode_queue
+from integrations.models import ImmichIntegration
+from main import http_client, provider_limits
+from users.models import CustomUser
+from worldtravel.models import City, Country, Region, VisitedCity, VisitedRegion, normalize_place_name
+from worldtravel.serializers import CountrySerializer, RegionSerializer
+
+
+class LocationAPITestCase(APITestCase):
+    """A user with a category and a collection, and locations created with everything they can render."""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username='testuser', email='testuser@example.com', password='testpassword'
+        )
+        self.client.force_authenticate(user=self.user)
+
+        self.country = Country.objects.create(name='Testland', country_code='TL')
+        self.region = Region.objects.create(id='TL-01', name='Test Region', country=self.country)
+        self.city = City.objects.create(id='TL-01-001', name='Test City', region=self.region)
+        self.category = Category.objects.create(user=self.user, name='museum', display_name='Museum')
+        self.collection = Collection.objects.create(user=self.user, name='Test Trip')
+
+    def _create_locations(self, count):
+        for i in range(count):
+            location = Location.objects.create(
+                user=self.user,
+                name=f'Location {i}',
+                category=self.category,
+                city=self.city,
+                region=self.region,
+                country=self.country,
+            )
+            location.collections.add(self.collection)
+            visit = Visit.objects.create(location=location, start_date=timezone.now(), end_date=timezone.now())
+            Activity.objects.create(user=self.user, visit=visit, name=f'Walk {i}', sport_type='Walk', distance=1000)
+            Trail.objects.create(user=self.user, location=location, name=f'Trail {i}', link='https://example.com/trail')
+            ContentImage.objects.create(user=self.user, content_object=location, immich_id=f'asset-{i}')
+
+    def _get(self, url):
+        """Return the number of queries a GET request took and its response data."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+            if response.streaming:
+                data = json.loads(b''.join(response.streaming_content))
+            else:
+                data = response.json()
+        self.assertEqual(response.status_code, 200)
+        return len(queries), data
+
+
+class LocationQueryCountTestCase(LocationAPITestCase):
+    """Serializing locations must take the same number of queries for any number of locations."""
+
+    def test_001_list_query_count(self):
+        self._create_locations(2)
+        small_count, data = self._get('/api/locations/?page_size=2')
+        self.assertEqual(len(data['results']), 2)
+
+        self._create_locations(8)
+        large_count, data = self._get('/api/locations/?page_size=10')
+        self.assertEqual(len(data['results']), 10)
+        self.assertEqual(small_count, large_count)
+
+        location = data['results'][0]
+        self.assertTrue(location['is_visited'])
+        self.assertEqual(location['category']['num_locations'], 10)
+        self.assertEqual(location['region']['num_cities'], 1)
+        self.assertEqual(location['country']['num_regions'], 1)
+        self.assertEqual(len(location['visits'][0]['activities']), 1)
+        self.assertEqual(len(location['trails']), 1)
+
+    def test_002_all_query_count(self):
+        self._create_locations(2)
+        small_count, data = self._get('/api/locations/all/?include_collections=true')
+        self.assertEqual(len(data), 2)
+
+        self._create_locations(8)
+        large_count, data = self._get('/api/locations/all/?include_collections=true')
+        self.assertEqual(len(data), 10)
+        self.assertEqual(small_count, large_count)
+
+    def test_003_collection_retrieve_query_count(self):
+        url = f'/api/collections/{self.collection.id}/'
+        self._create_locations(2)
+        small_count, data = self._get(url)
+        self.assertEqual(len(data['locations']), 2)
+
+        self._create_locations(8)
+        large_count, data = self._get(url)
+        self.assertEqual(len(data['locations']), 10)
+        self.assertEqual(small_count, large_count)
+
+    def test_004_immich_images_query_count(self):
+        integration = ImmichIntegration.objects.create(
+            user=self.user, server_url='https://immich.example.com', api_key='key'
+        )
+        self._create_locations(2)
+        small_count, data = self._get('/api/locations/?page_size=2')
+
+        self._create_locations(8)
+        large_count, data = self._get('/api/locations/?page_size=10')
+        self.assertEqual(small_count, large_count)
+
+        image = data['results'][0]['images'][0]
+        self.assertIn(f'/api/integrations/immich/{integration.id}/get/', image['image'])
+
+
+class LocationVisitedTestCase(APITestCase):
+    """Whether a location counts as visited, in SQL and in the Python fallback."""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username='testuser', email='testuser@example.com', password='testpassword'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.category = Category.objects.create(user=self.user, name='museum', display_name='Museum')
+
+    def test_001_is_visited(self):
+        now = timezone.now()
+        for name, start in [('Past', now - timedelta(days=1)), ('Future', now + timedelta(days=30)), ('Never', None)]:
+            location = Location.objects.create(user=self.user, name=name, category=self.category)
+            if start:
+                Visit.objects.create(location=location, start_date=start, end_date=start)
+
+        annotated = dict(Location.objects.with_visited().values_list('name', 'is_visited'))
+        self.assertEqual(annotated, {'Past': True, 'Future': False, 'Never': False})
+        # The Python fallback for locations loaded without the annotation agrees
+        self.assertEqual({location.name: location.is_visited_status() for location in Location.objects.all()}, annotated)
+
+        def names(is_visited):
+            response = self.client.get(f'/api/locations/filtered/?types=museum&is_visited={is_visited}')
+            self.assertEqual(response.status_code, 200)
+            return sorted((location['name'], location['is_visited']) for location in response.json()['results'])
+
+        self.assertEqual(names('true'), [('Past', True)])
+        self.assertEqual(names('false'), [('Future', False), ('Never', False)])
+
+
+class LocationPaginationTestCase(LocationAPITestCase):
+    """Cursor pagination of the location list."""
+
+    def test_001_cursor_pagination(self):
+        self._create_locations(5)
+        seen = []
+        url = '/api/locations/?pagination=cursor&page_size=2&count=true'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertEqual(data['count'], 5)
+            seen.extend(location['id'] for location in data['results'])
+            url = data['next']
+
+        expected = [str(pk) for pk in Location.objects.order_by('-updated_at', '-id').values_list('id', flat=True)]
+        self.assertEqual(seen, expected)
+
+        response = self.client.get('/api/locations/?pagination=cursor&page_size=2')
+        self.assertNotIn('count', response.json())
+
+
+class LocationFieldsTestCase(LocationAPITestCase):
+    """Sparse fieldsets and expansions of location responses."""
+
+    def test_001_sparse_fieldsets(self):
+        self._create_locations(2)
+        full_count, data = self._get('/api/locations/')
+        sparse_count, data = self._get('/api/locations/?fields=id,name')
+        self.assertEqual(set(data['results'][0]), {'id', 'name'})
+        self.assertLess(sparse_count, full_count)
+
+        _, data = self._get('/api/locations/?expand=visits.activities')
+        location = data['results'][0]
+        self.assertNotIn('images', location)
+        self.assertNotIn('geojson', location['visits'][0]['activities'][0])
+        self.assertIn('name', location)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class LocationConditionalGetTestCase(LocationAPITestCase):
+    """ETags of location responses, and the writes that change them."""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_001_conditional_get(self):
+        self._create_locations(2)
+        response = self.client.get('/api/locations/')
+        etag = response['ETag']
+        # Second resolution dates cannot tell apart writes in the same second
+        self.assertNotIn('Last-Modified', response)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/locations/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertLess(len(queries), 5)
+
+        # A new image does not touch the location's updated_at but must change the ETag
+        ContentImage.objects.create(user=self.user, content_object=Location.objects.first(), immich_id='asset-new')
+        response = self.client.get('/api/locations/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class LocationClusterTestCase(LocationAPITestCase):
+    """Location pins grouped into clusters per map tile."""
+
+    def test_001_clustered_pins(self):
+        for i, (latitude, longitude) in enumerate([(48.85, 2.35), (48.86, 2.34), (40.71, -74.0)]):
+            location = Location.objects.create(user=self.user, name=f'Pin {i}', latitude=latitude, longitude=longitude)
+            if i == 0:
+                Visit.objects.create(location=location, start_date=timezone.now(), end_date=timezone.now())
+
+        response = self.client.get('/api/locations/pins/clusters/?zoom=2')
+        self.assertEqual(response.status_code, 200)
+        clusters = sorted(response.json()['clusters'], key=lambda cluster: cluster['count'])
+        self.assertEqual([cluster['count'] for cluster in clusters], [1, 2])
+        self.assertEqual((clusters[1]['visited'], clusters[1]['unvisited']), (1, 1))
+        self.assertAlmostEqual(clusters[1]['latitude'], 48.855)
+
+        response = self.client.get('/api/locations/pins/clusters/?zoom=2&bbox=0,40,10,50')
+        self.assertEqual(sum(cluster['count'] for cluster in response.json()['clusters']), 2)
+
+        response = self.client.get('/api/locations/pins/clusters/?zoom=30')
+        self.assertEqual(response.status_code, 400)
+
+        # Points on the far edges of the map belong to the last column and row
+        Location.objects.create(user=self.user, name='Edge', latitude=90, longitude=180)
+        response = self.client.get('/api/locations/pins/clusters/?zoom=1')
+        self.assertEqual(sum(cluster['count'] for cluster in response.json()['clusters']), 4)
+
+
+class LocationSpatialFilterTestCase(LocationAPITestCase):
+    """Bounding box and radius filters of the location list."""
+
+    def test_001_spatial_filters(self):
+        paris = Location.objects.create(user=self.user, name='Paris', latitude=48.8566, longitude=2.3522)
+        Location.objects.create(user=self.user, name='Versailles', latitude=48.8049, longitude=2.1204)
+        Location.objects.create(user=self.user, name='New York', latitude=40.7128, longitude=-74.0060)
+        self.assertIsNotNone(paris.point)
+
+        def names(url):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            return sorted(location['name'] for location in response.json()['results'])
+
+        self.assertEqual(names('/api/locations/?bbox=2,48,3,49'), ['Paris', 'Versailles'])
+        self.assertEqual(names('/api/locations/?near=48.8566,2.3522&radius=5'), ['Paris'])
+        self.assertEqual(names('/api/locations/?near=48.8566,2.3522&radius=30'), ['Paris', 'Versailles'])
+        self.assertEqual(self.client.get('/api/locations/?bbox=1,2').status_code, 400)
+
+
+class BatchCreateTestCase(LocationAPITestCase):
+    """Creating many locations, visits and activities in one request."""
+
+    def test_001_batch_create(self):
+        response = self.client.post('/api/locations/batch/', {'locations': [
+            {'name': 'Louvre', 'latitude': '48.860600', 'longitude': '2.337600',
+             'category': {'name': 'Museum', 'display_name': 'Museum', 'icon': '🏛️'},
+             'collections': [str(self.collection.id)]},
+            {'name': 'Eiffel Tower', 'latitude': '48.858400', 'longitude': '2.294500'},
+            {'latitude': '1.000000'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 207)
+        results = response.json()['results']
+        self.assertIn('name', results[2]['errors'])
+
+        louvre = Location.objects.get(id=results[0]['id'])
+        self.assertEqual(louvre.category, self.category)
+        self.assertEqual(list(louvre.collections.all()), [self.collection])
+        self.assertIsNotNone(louvre.point)
+        self.assertEqual(Location.objects.get(id=results[1]['id']).category.name, 'general')
+        self.assertEqual(GeocodeJob.objects.filter(location__user=self.user).count(), 2)
+
+        response = self.client.post('/api/visits/batch/', {'visits': [
+            {'location': results[0]['id'], 'start_date': timezone.now().isoformat()},
+            {'location': results[1]['id'], 'start_date': timezone.now().isoformat()},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        visit = Visit.objects.get(id=response.json()['results'][0]['id'])
+        self.assertEqual(visit.end_date, visit.start_date)
+
+        response = self.client.post('/api/activities/batch/', {'activities': [
+            {'visit': str(visit.id), 'name': 'Walk', 'sport_type': 'Walk', 'distance': 1000},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Activity.objects.get(visit=visit).user, self.user)
+
+        other = CustomUser.objects.create_user(username='other', email='other@example.com', password='testpassword')
+        self.client.force_authenticate(user=other)
+        response = self.client.post('/api/visits/batch/', {'visits': [
+            {'location': results[0]['id'], 'start_date': timezone.now().isoformat()},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.post('/api/visits/batch/', {'visits': []}, format='json').status_code, 400)
+
+    def test_002_activity_batch_query_count(self):
+        def post(count):
+            visits = [
+                Visit.objects.create(
+                    location=Location.objects.create(user=self.user, name=f'Location {i}'),
+                    start_date=timezone.now(), end_date=timezone.now(),
+                )
+                for i in range(count)
+            ]
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post('/api/activities/batch/', {'activities': [
+                    {'visit': str(visit.id), 'name': 'Walk', 'sport_type': 'Walk'} for visit in visits
+                ]}, format='json')
+            self.assertEqual(response.status_code, 201)
+            return len(queries)
+
+        self.assertEqual(post(2), post(10))
+        self.assertEqual(Activity.objects.filter(user=self.user).count(), 12)
+
+
+class GeocodingTestCase(APITestCase):
+    """Reverse geocoding of locations, with the provider mocked."""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username='testuser', email='testuser@example.com', password='testpassword'
+        )
+        self.client.force_authenticate(user=self.user)
+
+        self.country = Country.objects.create(name='France', country_code='FR')
+        self.region = Region.objects.create(
+            id='FR-IDF', name='Île-de-France', country=self.country,
+            geometry=MultiPolygon(Polygon.from_bbox((1.5, 48.0, 3.5, 49.5)), srid=4326),
+        )
+        self.city = City.objects.create(
+            id='FR-IDF-PAR', name='Paris', region=self.region, latitude=48.8566, longitude=2.3522
+        )
+
+    def _provider_response(self, name='Musée du Louvre', city='Paris'):
+        return {
+            'name': name,
+            'address': {'ISO3166-1': 'FR', 'ISO3166-2-lvl4': 'FR-IDF', 'state': 'Île-de-France', 'city': city},
+        }
+
+    @mock.patch('adventures.utils.geocode_queue.close_old_connections')
+    def test_001_geocode_queue(self, _):
+        location = Location.objects.create(user=self.user, name='Louvre', latitude=48.8606, longitude=2.3376)
+        location.save()
+        job = GeocodeJob.objects.get(location=location)
+        self.assertEqual(job.status, 'pending')
+
+        [claimed] = geocode_queue.claim_jobs(10)
+        self.assertEqual(claimed.id, job.id)
+        self.assertEqual(geocode_queue.claim_jobs(10), [])
+
+        # A provider failure reschedules the job with backoff
+        error = {'error': 'Too many requests to OpenStreetMap. Please try again later.'}
+        with mock.patch.object(geocoding, 'resolve_coordinates', return_value=error):
+            self.assertFalse(geocode_queue.run_job(claimed))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('pending', 1))
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertEqual(geocode_queue.claim_jobs(10), [])
+        self.assertLess(geocode_queue.retry_delay(1), geocode_queue.retry_delay(3))
+
+        # A job left running by a killed worker is claimed again once its lock is stale
+        GeocodeJob.objects.filter(id=job.id).update(status='running', locked_at=timezone.now() - timedelta(hours=1))
+        [claimed] = geocode_queue.claim_jobs(10)
+        self.assertTrue(geocode_queue.run_job(claimed))
+        job.refresh_from_db()
+        location.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+        self.assertEqual((location.region_id, location.city_id), ('FR-IDF', 'FR-IDF-PAR'))
+        self.assertEqual(location.country, self.country)
+
+        # Saving the location while its job runs leaves the newer request pending
+        location.save()
+        [claimed] = geocode_queue.claim_jobs(10)
+        location.save()
+        self.assertTrue(geocode_queue.run_job(claimed))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'pending')
+
+        # The last allowed attempt marks the job as failed
+        [claimed] = geocode_queue.claim_jobs(10)
+        with override_settings(GEOCODE_QUEUE_MAX_ATTEMPTS=1), \
+                mock.patch.object(geocoding, 'resolve_coordinates', return_value=error):
+            self.assertFalse(geocode_queue.run_job(claimed))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.last_error), ('failed', error['error']))
+
+    @override_settings(
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}, GOOGLE_MAPS_API_KEY=''
+    )
+    def test_002_reverse_geocode_cache(self):
+        cache.clear()
+        response = self._provider_response()
+        response['address']['road'] = 'Rue de Rivoli'
+        with mock.patch.object(geocoding, 'fetch_reverse_geocode_osm', return_value=response) as fetch:
+            self.assertEqual(geocoding.fetch_reverse_geocode(48.8606, 2.3376), response)
+            # Another point in the same cell is served from the cache, without what only holds for the first one
+            cached = geocoding.fetch_reverse_geocode(48.86061, 2.33759)
+            cache.clear()
+            self.assertEqual(geocoding.fetch_reverse_geocode(48.8606, 2.3376), cached)
+        fetch.assert_called_once()
+        self.assertNotIn('name', cached)
+        self.assertNotIn('road', cached['address'])
+        self.assertEqual(cached['address']['city'], 'Paris')
+
+        # Interactive lookups ask the provider for the place name and only fall back to the cache
+        error = {'error': 'OpenStreetMap is temporarily unavailable. Please try again later.'}
+        with mock.patch.object(geocoding, 'fetch_reverse_geocode_osm', return_value=error):
+            self.assertEqual(geocoding.fetch_reverse_geocode(48.8606, 2.3376, with_name=True), cached)
+
+        # Entries older than the TTL are purged and fetched again
+        ReverseGeocodeCache.objects.update(updated_at=timezone.now() - timedelta(days=365))
+        cache.clear()
+        self.assertEqual(geocoding.purge_reverse_geocode_cache(), 1)
+        with mock.patch.object(geocoding, 'fetch_reverse_geocode_osm', return_value=response) as fetch:
+            geocoding.fetch_reverse_geocode(48.8606, 2.3376)
+        fetch.assert_called_once()
+
+    def test_003_offline_resolution(self):
+        with mock.patch.object(geocoding, 'fetch_reverse_geocode') as fetch:
+            result = geocoding.resolve_coordinates(48.8606, 2.3376)
+        fetch.assert_not_called()
+        self.assertEqual((result['region_id'], result['city_id'], result['country_id']), ('FR-IDF', 'FR-IDF-PAR', 'FR'))
+        self.assertEqual(result['display_name'], 'Paris, Île-de-France, FR')
+
+        # Outside every boundary and further than the radius from any city, or when disabled, the provider answers
+        self.assertIsNone(geocoding.resolve_location_offline(10.0, 10.0))
+        with mock.patch.object(geocoding, 'REVERSE_GEOCODE_OFFLINE', False), \
+                mock.patch.object(geocoding, 'fetch_reverse_geocode', return_value=self._provider_response()) as fetch:
+            result = geocoding.resolve_coordinates(48.8606, 2.3376)
+        fetch.assert_called_once()
+        self.assertEqual(result['city_id'], 'FR-IDF-PAR')
+
+    def test_004_normalized_city_names(self):
+        self.assertEqual(normalize_place_name('Saint-Étienne'), 'saintetienne')
+        self.assertEqual(normalize_place_name('  São Paulo '), 'saopaulo')
+        self.assertEqual(normalize_place_name('新宿'), '')
+
+        norway = Country.objects.create(name='Norway', country_code='NO')
+        troms_region = Region.objects.create(id='NO-55', name='Troms', country=norway)
+        troms = City.objects.create(id='NO-55-001', name='Troms', region=troms_region)
+        tromso = City.objects.create(id='NO-55-002', name='Tromso', region=troms_region)
+        self.assertEqual(tromso.normalized_name, 'tromso')
+        tromso.name = 'Tromsø'
+        tromso.save()
+        # ø has no ASCII decomposition, so both names share the normalized form
+        self.assertEqual(tromso.normalized_name, 'troms')
+
+        def city_id(name):
+            return geocoding.resolve_address({
+                'name': None, 'address': {'ISO3166-1': 'NO', 'ISO3166-2-lvl4': 'NO-55', 'city': name},
+            })['city_id']
+
+        # The exact spelling wins among cities with the same normalized name
+        self.assertEqual(city_id('Tromsø'), tromso.id)
+        self.assertEqual(city_id('TROMS'), troms.id)
+        saint_etienne = City.objects.create(id='FR-IDF-SET', name='Saint-Étienne', region=self.region)
+        result = geocoding.resolve_address(self._provider_response(city='Saint Etienne'))
+        self.assertEqual(result['city_id'], saint_etienne.id)
+
+    def test_005_nearest_city_fallback(self):
+        self.assertEqual(geocoding.find_nearest_city(48.86, 2.35), self.city)
+        self.assertIsNone(geocoding.find_nearest_city(48.1, 1.6))
+        self.assertEqual(geocoding.find_nearest_city(48.1, 1.6, radius_km=200), self.city)
+        self.assertIsNone(geocoding.find_nearest_city(48.86, 2.35, region_id='FR-ARA'))
+
+        # A locality name the provider knows but the city table does not
+        response = self._provider_response(city='Le Marais')
+        with mock.patch.object(geocoding, 'REVERSE_GEOCODE_OFFLINE', False), \
+                mock.patch.object(geocoding, 'fetch_reverse_geocode', return_value=response):
+            result = geocoding.resolve_coordinates(48.8575, 2.3590)
+        self.assertEqual(result['city_id'], 'FR-IDF-PAR')
+        self.assertEqual(result['display_name'], 'Paris, Île-de-France, FR')
+
+    def test_006_offline_resolution_without_city_or_boundary(self):
+        # Inside the boundary but far from every city of the region
+        result = geocoding.resolve_location_offline(48.1, 1.6)
+        self.assertEqual(result['region_id'], 'FR-IDF')
+        self.assertIsNone(result['city_id'])
+
+        # Without a stored boundary the nearest city decides the region
+        belgium = Country.objects.create(name='Belgium', country_code='BE')
+        brussels_region = Region.objects.create(id='BE-BRU', name='Brussels', country=belgium)
+        City.objects.create(id='BE-BRU-001', name='Brussels', region=brussels_region, latitude=50.8503, longitude=4.3517)
+        result = geocoding.resolve_location_offline(50.8467, 4.3525)
+        self.assertEqual((result['region_id'], result['city_id'], result['country_id']), ('BE-BRU', 'BE-BRU-001', 'BE'))
+
+    def test_007_backfill_checkpoint(self):
+        louvre = Location.objects.create(user=self.user, name='Louvre', latitude=48.8606, longitude=2.3376)
+        Visit.objects.create(location=louvre, start_date=timezone.now(), end_date=timezone.now())
+        unreachable = Location.objects.create(user=self.user, name='Lake Chad', latitude=10.0, longitude=10.0)
+        ocean = Location.objects.create(user=self.user, name='Atlantic', latitude=0.0, longitude=-30.0)
+        GeocodeJob.objects.all().delete()
+        results = {
+            (48.8606, 2.3376): geocoding.resolve_location_offline(48.8606, 2.3376),
+            (10.0, 10.0): {'error': 'Too many requests to OpenStreetMap. Please try again later.'},
+            (0.0, -30.0): {'error': 'No region found'},
+        }
+        resolved = []
+
+        def resolve(latitude, longitude):
+            resolved.append((float(latitude), float(longitude)))
+            return results[resolved[-1]]
+
+        # Stop after the first batch, as if the command was killed
+        apply_results = backfill_geocode.Command._apply_results
+
+        def apply_once(command, *args):
+            if BackfillCheckpoint.objects.exists():
+                raise RuntimeError('interrupted')
+            return apply_results(command, *args)
+
+        first, *rest = sorted([louvre, unreachable, ocean], key=lambda location: location.id)
+        with mock.patch.object(backfill_geocode, 'resolve_coordinates', side_effect=resolve), \
+                mock.patch.object(backfill_geocode.Command, '_apply_results', apply_once), \
+                self.assertRaises(RuntimeError):
+            call_command('backfill_geocode', batch_size=1, workers=1, stdout=io.StringIO())
+        self.assertEqual(BackfillCheckpoint.objects.get().last_id, str(first.id))
+
+        resolved.clear()
+        with mock.patch.object(backfill_geocode, 'resolve_coordinates', side_effect=resolve):
+            call_command('backfill_geocode', batch_size=1, workers=1, stdout=io.StringIO())
+        self.assertEqual(resolved, [(float(location.latitude), float(location.longitude)) for location in rest])
+        self.assertFalse(BackfillCheckpoint.objects.exists())
+
+        louvre.refresh_from_db()
+        self.assertEqual((louvre.region_id, louvre.city_id, louvre.country), ('FR-IDF', 'FR-IDF-PAR', self.country))
+        self.assertTrue(VisitedRegion.objects.filter(user=self.user, region=self.region).exists())
+        # Failures worth retrying go to the geocode queue, permanent ones do not
+        self.assertEqual(list(GeocodeJob.objects.values_list('location_id', flat=True)), [unreachable.id])
+
+    def test_008_interactive_reverse_geocode_keeps_place_name(self):
+        with mock.patch.object(geocoding, 'fetch_reverse_geocode', return_value=self._provider_response()):
+            result = geocoding.reverse_geocode(48.8606, 2.3376, self.user)
+        self.assertEqual(result['location_name'], 'Musée du Louvre')
+        self.assertEqual(result['display_name'], 'Paris, Île-de-France, FR')
+        self.assertFalse(result['region_visited'])
+
+        # The stored boundaries answer when the provider is unavailable
+        error = {'error': 'OpenStreetMap is temporarily unavailable. Please try again later.'}
+        with mock.patch.object(geocoding, 'fetch_reverse_geocode', return_value=error):
+            result = geocoding.reverse_geocode(48.8606, 2.3376, self.user)
+        self.assertEqual((result['region_id'], result['city_id']), ('FR-IDF', 'FR-IDF-PAR'))
+
+    def test_009_region_responses_leave_out_geometry(self):
+        response = self.client.get('/api/regions/FR-IDF/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('geometry', response.json())
+        response = self.client.get('/api/FR/regions/')
+        self.assertNotIn('geometry', response.json()[0])
+
+    def test_010_non_latin_locality_names(self):
+        japan = Country.objects.create(name='Japan', country_code='JP')
+        tokyo = Region.objects.create(id='JP-13', name='Tokyo', country=japan)
+        City.objects.create(id='JP-13-001', name='西新宿', region=tokyo)
+        shinjuku = City.objects.create(id='JP-13-002', name='新宿', region=tokyo)
+        self.assertEqual(shinjuku.normalized_name, '')
+
+        for key in ('city', 'county'):
+            result = geocoding.resolve_address({
+                'name': None, 'address': {'ISO3166-1': 'JP', 'ISO3166-2-lvl4': 'JP-13', key: '新宿'},
+            })
+            self.assertEqual(result['city_id'], 'JP-13-002', key)
+
+    @override_settings(GOOGLE_MAPS_API_KEY='key')
+    def test_011_search_when_provider_unavailable(self):
+        with mock.patch.object(http_client, 'request', side_effect=http_client.ProviderUnavailable('rate limit exceeded')):
+            self.assertEqual(
+                geocoding.search_osm('Louvre'),
+                {'error': 'OpenStreetMap is temporarily unavailable. Please try again later.'},
+            )
+            self.assertEqual(
+                geocoding.search_google('Louvre'),
+                {'error': 'Google Maps is temporarily unavailable. Please try again later.'},
+            )
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class VisitedSyncTestCase(APITestCase):
+    """Visited regions and cities derived from the locations with a started visit."""
+
+    def setUp(self):
+        cache.clear()
+        self.country = Country.objects.create(name='France', country_code='FR')
+        self.region = Region.objects.create(id='FR-IDF', name='Île-de-France', country=self.country)
+        self.city = City.objects.create(id='FR-IDF-PAR', name='Paris', region=self.region)
+        self.user = CustomUser.objects.create_user(
+            username='testuser', email='testuser@example.com', password='testpassword'
+        )
+        self.other = CustomUser.objects.create_user(
+            username='other', email='other@example.com', password='testpassword'
+        )
+
+    def _visited_location(self, user, name='Louvre'):
+        location = Location.objects.create(user=user, name=name, region=self.region, city=self.city)
+        Visit.objects.create(location=location, start_date=timezone.now(), end_date=timezone.now())
+        return location
+
+    def _visited_users(self):
+        return (
+            set(VisitedRegion.objects.filter(region=self.region).values_list('user_id', flat=True)),
+            set(VisitedCity.objects.filter(city=self.city).values_list('user_id', flat=True)),
+        )
+
+    def _sync(self, **options):
+        call_command('sync_visited_regions', stdout=io.StringIO(), **options)
+
+    def test_001_incremental_sync(self):
+        location = Location.objects.create(user=self.user, name='Louvre', region=self.region, city=self.city)
+        self.assertTrue(PendingVisitedSync.objects.filter(user=self.user).exists())
+        self._sync(pending=True)
+        self.assertFalse(PendingVisitedSync.objects.exists())
+        self.assertEqual(self._visited_users(), (set(), set()))
+
+        # Only flagged users are processed
+        Visit.objects.create(location=location, start_date=timezone.now(), end_date=timezone.now())
+        self._visited_location(self.other)
+        PendingVisitedSync.objects.filter(user=self.other).delete()
+        self._sync(pending=True)
+        self.assertEqual(self._visited_users(), ({self.user.id}, {self.user.id}))
+        self.assertFalse(PendingVisitedSync.objects.exists())
+
+        # The first incremental run has no watermark yet and processes everyone
+        self._sync(incremental=True)
+        self.assertEqual(self._visited_users(), ({self.user.id, self.other.id}, {self.user.id, self.other.id}))
+
+        # Later runs only process users with changes since the previous one
+        VisitedRegion.objects.all().delete()
+        location.save()
+        self._sync(incremental=True)
+        self.assertEqual(self._visited_users()[0], {self.user.id})
+
+    def test_002_set_based_sync(self):
+        self._visited_location(self.user)
+        self._visited_location(self.other)
+        # A location without a started visit does not count
+        Location.objects.create(user=self.other, name='Later', region=self.region, city=self.city)
+        VisitedRegion.objects.create(user=self.user, region=self.region)
+
+        self._sync(set_based=True, dry_run=True)
+        self.assertEqual(self._visited_users(), ({self.user.id}, set()))
+
+        with mock.patch.object(sync_visited_regions, 'invalidate_user_stats') as invalidate:
+            self._sync(set_based=True)
+        both = {self.user.id, self.other.id}
+        self.assertEqual(self._visited_users(), (both, both))
+        self.assertEqual({user_id for call in invalidate.call_args_list for user_id in call.args}, both)
+
+        # Nothing is missing anymore
+        with mock.patch.object(sync_visited_regions, 'invalidate_user_stats') as invalidate:
+            self._sync(set_based=True)
+        invalidate.assert_not_called()
+        self.assertEqual(VisitedRegion.objects.count(), 2)
+
+    def test_003_visited_batch_endpoints(self):
+        self.client.force_authenticate(user=self.user)
+        auvergne = Region.objects.create(id='FR-ARA', name='Auvergne-Rhône-Alpes', country=self.country)
+        City.objects.create(id='FR-ARA-LYS', name='Lyon', region=auvergne)
+
+        response = self.client.post(
+            '/api/visitedcity/batch/', {'cities': ['FR-IDF-PAR', 'FR-ARA-LYS', 'XX-00-000']}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'cities_created': 2, 'regions_created': 2, 'not_found': ['XX-00-000']})
+        response = self.client.post('/api/visitedcity/batch/', {'cities': ['FR-IDF-PAR']}, format='json')
+        self.assertEqual((response.json()['cities_created'], response.json()['regions_created']), (0, 0))
+        # A city that is already visited is turned away, not a server error
+        response = self.client.post('/api/visitedcity/', {'city': 'FR-ARA-LYS'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(VisitedCity.objects.filter(user=self.user, city='FR-ARA-LYS').count(), 1)
+
+        Region.objects.create(id='FR-BRE', name='Bretagne', country=self.country)
+        response = self.client.post('/api/visitedregion/batch/', {'country': 'fr'}, format='json')
+        self.assertEqual(response.json(), {'regions_created': 1, 'not_found': []})
+        self.assertEqual(self.client.post('/api/visitedregion/batch/', {}, format='json').status_code, 400)
+
+        with transaction.atomic(), self.assertRaises(IntegrityError):
+            VisitedRegion.objects.create(user=self.user, region=self.region)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class WorldTravelCountsTestCase(APITestCase):
+    """Country and region lists count regions, visits and cities in the query that lists them."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(
+            username='testuser', email='testuser@example.com', password='testpassword'
+        )
+        self.other_user = CustomUser.objects.create_user(
+            username='otheruser', email='otheruser@example.com', password='testpassword'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.countries = []
+
+    def _create_countries(self, count):
+        """Countries with one more region than the one before, each region with as many cities as its number."""
+        for _ in range(count):
+            i = len(self.countries)
+            country = Country.objects.create(name=f'Country {i}', country_code=f'A{chr(ord("A") + i)}')
+            for j in range(i + 1):
+                region = Region.objects.create(id=f'{country.country_code}-{j}', name=f'Region {j}', country=country)
+                City.objects.bulk_create([
+                    City(id=f'{region.id}-{k}', name=f'City {k}', region=region) for k in range(j + 1)
+                ])
+                # The user visited every other region, the other user all of them
+                if j % 2 == 0:
+                    VisitedRegion.objects.create(user=self.user, region=region)
+                VisitedRegion.objects.create(user=self.other_user, region=region)
+            self.countries.append(country)
+
+    def _get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.json()
+
+    def test_001_countries_query_count(self):
+        self._create_countries(2)
+        small_count, data = self._get('/api/countries/')
+        self.assertEqual(len(data), 2)
+
+        self._create_countries(4)
+        large_count, data = self._get('/api/countries/')
+        self.assertEqual(len(data), 6)
+        self.assertEqual(small_count, large_count)
+
+        # The annotated counts match what the serializer counts for a single country
+        request = mock.Mock(user=self.user)
+        for country in data:
+            expected = CountrySerializer(Country.objects.get(id=country['id']), context={'request': request}).data
+            self.assertEqual(
+                (country['num_regions'], country['num_visits']), (expected['num_regions'], expected['num_visits'])
+            )
+        self.assertEqual([(c['num_regions'], c['num_visits']) for c in data[:3]], [(1, 1), (2, 1), (3, 2)])
+
+    def test_002_regions_query_count(self):
+        self._create_countries(6)
+        small_count, data = self._get(f'/api/{self.countries[1].country_code}/regions/')
+        self.assertEqual(len(data), 2)
+
+        large_count, data = self._get(f'/api/{self.countries[5].country_code}/regions/')
+        self.assertEqual(len(data), 6)
+        self.assertEqual(small_count, large_count)
+
+        for region in data:
+            expected = RegionSerializer(Region.objects.get(id=region['id'])).data
+            self.assertEqual(region['num_cities'], expected['num_cities'])
+        self.assertEqual(sorted(region['num_cities'] for region in data), [1, 2, 3, 4, 5, 6])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class StatsTestCase(APITestCase):
+    """Per-user stats snapshots and timelines, and when their cached copies are dropped."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(
+            username='testuser', email='testuser@example.com', password='testpassword'
+        )
+        self.client.force_authenticate(user=self.user)
+
+        self.country = Country.objects.create(name='France', country_code='FR')
+        self.region = Region.objects.create(id='FR-IDF', name='Île-de-France', country=self.country)
+        self.location = Location.objects.create(user=self.user, name='Louvre', region=self.region, country=self.country)
+        self.january = datetime(2025, 1, 15, 12, tzinfo=dt_timezone.utc)
+        self.march = datetime(2025, 3, 15, 12, tzinfo=dt_timezone.utc)
+        self.visit = Visit.objects.create(location=self.location, start_date=self.january, end_date=self.january)
+        Visit.objects.create(location=self.location, start_date=self.march, end_date=self.march)
+
+        for sport_type, distance, minutes, elevation_gain, speed, start in [
+            ('Run', 10000, 60, 100, 3.0, self.january),
+            ('Run', 5000, 30, None, 2.5, self.january),
+            ('Hike', 8000, 180, 500, 1.0, self.march),
+        ]:
+            self._activity(sport_type, distance, minutes, elevation_gain, speed, start)
+
+    def _activity(self, sport_type, distance, minutes, elevation_gain=None, speed=None, start=None):
+        return Activity.objects.create(
+            user=self.user, visit=self.visit, name=sport_type, sport_type=sport_type, distance=distance,
+            moving_time=timedelta(minutes=minutes), elevation_gain=elevation_gain, average_speed=speed,
+            max_speed=speed, start_date=start,
+        )
+
+    def _get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.json()
+
+    def test_001_counts(self):
+        first_count, data = self._get('/api/stats/counts/testuser/')
+        self.assertEqual(data['activities_overall']['total_count'], 3)
+        self.assertEqual(data['activities_overall']['total_distance'], 23000)
+        self.assertEqual(data['activities_overall']['total_moving_time'], 270 * 60)
+        running = data['activities_by_category']['running']
+        self.assertEqual((running['count'], running['avg_distance'], running['max_distance']), (2, 7500, 10000))
+        # Averages only count the activities that have the value
+        self.assertEqual((running['avg_elevation_gain'], running['avg_speed']), (100, 2.75))
+        self.assertEqual(running['sports']['Run']['total_elevation_gain'], 100)
+        self.assertEqual(data['activities_by_category']['walking_hiking']['count'], 1)
+        self.assertEqual((data['visited_location_count'], data['visited_region_count']), (1, 0))
+
+        # Served from the snapshot until something it counts changes
+        cached_count, _ = self._get('/api/stats/counts/testuser/')
+        self.assertLess(cached_count, first_count)
+        self._activity('Ride', 20000, 45)
+        _, data = self._get('/api/stats/counts/testuser/')
+        self.assertEqual(data['activity_count'], 4)
+        self.assertEqual(data['activities_by_category']['cycling']['total_distance'], 20000)
+
+        # Bulk writes skip the signals and drop the snapshot themselves
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/visitedregion/batch/', {'regions': ['FR-IDF']}, format='json')
+        _, data = self._get('/api/stats/counts/testuser/')
+        self.assertEqual((data['visited_region_count'], data['visited_country_count']), (1, 1))
+
+    def test_002_timeline(self):
+        def buckets(period='month'):
+            _, data = self._get(f'/api/stats/timeline/testuser/?period={period}')
+            self.assertEqual(data['period'], period)
+            return {bucket.pop('start'): bucket for bucket in data['buckets']}
+
+        data = buckets()
+        self.assertEqual(list(data), ['2025-01-01', '2025-03-01'])
+        self.assertEqual(data['2025-01-01'], {
+            'activity_count': 2, 'distance': 15000, 'elevation_gain': 100, 'moving_time': 90 * 60,
+            'visit_count': 1, 'new_countries': 1, 'new_regions': 1,
+        })
+        # Visiting the same country again is not new
+        self.assertEqual((data['2025-03-01']['visit_count'], data['2025-03-01']['new_countries']), (1, 0))
+        self.assertEqual(list(buckets('week')), ['2025-01-13', '2025-03-10'])
+
+        # Closed buckets come from the cache, the current one is always recomputed
+        Activity.objects.bulk_create([
+            Activity(user=self.user, visit=self.visit, name='Run', sport_type='Run', start_date=start)
+            for start in (self.january, timezone.now())
+        ])
+        data = buckets()
+        self.assertEqual(data['2025-01-01']['activity_count'], 2)
+        self.assertEqual(data[timezone.localdate().replace(day=1).isoformat()]['activity_count'], 1)
+
+        # Any write that goes through the signals drops the cached buckets
+        self._activity('Run', 1000, 5, start=self.january)
+        self.assertEqual(buckets()['2025-01-01']['activity_count'], 4)
+
+        response = self.client.get('/api/stats/timeline/testuser/?period=decade')
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}, MEDIA_ROOT=tempfile.mkdtemp()
+)
+class VectorTileTestCase(APITestCase):
+    """Vector tiles of a user's locations, activity tracks and visited regions."""
+
+    # Paris is in tile 1/1/0, nothing is in 1/0/1
+    tile = '1/1/0'
+    empty_tile = '1/0/1'
+    gpx = (
+        b'<?xml version="1.0"?><gpx version="1.1" creator="test" xmlns="http://www.topografix.com/GPX/1/1">'
+        b'<trk><trkseg><trkpt lat="48.85" lon="2.35"/><trkpt lat="48.86" lon="2.36"/></trkseg></trk></gpx>'
+    )
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(
+            username='testuser', email='testuser@example.com', password='testpassword'
+        )
+        self.other_user = CustomUser.objects.create_user(
+            username='otheruser', email='otheruser@example.com', password='testpassword'
+        )
+        self.client.force_authenticate(user=self.user)
+
+        self.country = Country.objects.create(name='France', country_code='FR')
+        self.region = Region.objects.create(
+            id='FR-IDF', name='Ile-de-France', country=self.country,
+            geometry=MultiPolygon(Polygon(((2, 48), (3, 48), (3, 49), (2, 49), (2, 48)))),
+        )
+        self.other_region = Region.objects.create(
+            id='FR-NOR', name='Normandie', country=self.country,
+            geometry=MultiPolygon(Polygon(((0, 48.5), (1.5, 48.5), (1.5, 50), (0, 50), (0, 48.5)))),
+        )
+        self._create_data(self.user, 'Louvre', self.region)
+        self._create_data(self.other_user, 'Orsay', self.other_region)
+
+    def _create_data(self, user, name, region):
+        location = Location.objects.create(user=user, name=name, latitude=48.86, longitude=2.34)
+        visit = Visit.objects.create(location=location, start_date=timezone.now(), end_date=timezone.now())
+        Activity.objects.create(
+            user=user, visit=visit, name=f'{name} walk', sport_type='Walk',
+            track=MultiLineString(LineString((2.33, 48.86), (2.35, 48.87))),
+        )
+        VisitedRegion.objects.create(user=user, region=region)
+
+    def _get(self, layer, tile, **extra):
+        return self.client.get(f'/api/tiles/{layer}/{tile}.mvt', **extra)
+
+    def test_001_tiles(self):
+        for layer, name in (('locations', b'Louvre'), ('activities', b'Louvre walk'), ('regions', b'Ile-de-France')):
+            response = self._get(layer, self.tile)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'application/vnd.mapbox-vector-tile')
+            self.assertIn(name, response.content)
+
+            response = self._get(layer, self.empty_tile)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content, b'')
+
+    def test_002_tiles_only_show_own_data(self):
+        for layer, name in (('locations', b'Orsay'), ('activities', b'Orsay walk'), ('regions', b'Normandie')):
+            self.assertNotIn(name, self._get(layer, self.tile).content)
+
+        self.client.force_authenticate(user=self.other_user)
+        self.assertIn(b'Orsay', self._get('locations', self.tile).content)
+        self.assertNotIn(b'Louvre', self._get('locations', self.tile).content)
+
+    def test_003_tiles_change_after_a_write(self):
+        etags = {layer: self._get(layer, self.tile)['ETag'] for layer in ('locations', 'activities', 'regions')}
+
+        location = Location.objects.create(user=self.user, name='Notre-Dame', latitude=48.85, longitude=2.35)
+        visit = Visit.objects.create(location=location, start_date=timezone.now(), end_date=timezone.now())
+        Activity.objects.create(
+            user=self.user, visit=visit, name='Seine walk', sport_type='Walk',
+            track=MultiLineString(LineString((2.34, 48.85), (2.36, 48.85))),
+        )
+        VisitedRegion.objects.create(user=self.user, region=self.other_region)
+
+        for layer, name in (('locations', b'Notre-Dame'), ('activities', b'Seine walk'), ('regions', b'Normandie')):
+            response = self._get(layer, self.tile, HTTP_IF_NONE_MATCH=etags[layer])
+            self.assertEqual(response.status_code, 200)
+            self.assertIn(name, response.content)
+            self.assertEqual(self._get(layer, self.tile, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_004_invalid_tiles(self):
+        for layer, tile in (('trails', '1/1/0'), ('locations', '23/0/0'), ('activities', '1/2/0'),
+                            ('regions', '1/0/2'), ('locations', '0/0/1')):
+            response = self._get(layer, tile)
+            self.assertEqual(response.status_code, 400, f'{layer} {tile}')
+            self.assertIn('error', response.json())
+
+    def test_005_backfill_activity_tracks(self):
+        activity = Activity.objects.get(user=self.user)
+        activity.gpx_file = SimpleUploadedFile('track.gpx', self.gpx, content_type='application/gpx+xml')
+        activity.save()
+        # Uploaded before the track column existed
+        Activity.objects.filter(id=activity.id).update(track=None)
+        response = self._get('activities', self.tile)
+        self.assertNotIn(b'Louvre walk', response.content)
+
+        out = io.StringIO()
+        call_command('backfill_activity_tracks', stdout=out)
+        self.assertIn('Stored the track of 1 activities', out.getvalue())
+        activity.refresh_from_db()
+        self.assertEqual(activity.track.coords, (((2.35, 48.85), (2.36, 48.86)),))
+        # The version bump retires the cached tile
+        self.assertIn(b'Louvre walk', self._get('activities', self.tile).content)
+
+        out = io.StringIO()
+        call_command('backfill_activity_tracks', stdout=out)
+        self.assertIn('No activities without a track found', out.getvalue())
+
+    def test_006_activity_gpx_upload(self):
+        location = Location.objects.create(user=self.user, name='Trailhead')
+        visit = Visit.objects.create(location=location, start_date=timezone.now(), end_date=timezone.now())
+
+        response = self.client.post('/api/activities/', {
+            'visit': str(visit.id), 'name': 'Walk', 'sport_type': 'Walk',
+            'gpx_file': SimpleUploadedFile('track.gpx', self.gpx, content_type='application/gpx+xml'),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 201)
+
+        activity = Activity.objects.get(id=response.json()['id'])
+        self.assertEqual(activity.track.coords, (((2.35, 48.85), (2.36, 48.86)),))
+        with activity.gpx_file.open('rb') as f:
+            self.assertEqual(f.read(), self.gpx)
+
+
+class FakeClock:
+    """Stands in for the `time` module, so that waiting for a rate limit takes no real time."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    monotonic = time
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class HttpClientTestCase(SimpleTestCase):
+    """Outbound calls through the shared client, with the provider's HTTP session mocked."""
+
+    url = 'https://api.example.com/items'
+
+    def setUp(self):
+        cache.clear()
+        http_client.reset_stats()
+        self.session = http_client.get_session()
+
+    def _response(self, status_code):
+        response = requests.Response()
+        response.status_code = status_code
+        response.raw = io.BytesIO(b'')
+        return response
+
+    @mock.patch.object(http_client, '_retry_delay', return_value=0)
+    def test_001_retries_and_stats(self, _):
+        with mock.patch.object(self.session, 'request', side_effect=[self._response(503), self._response(200)]) as send:
+            self.assertEqual(http_client.get('wikipedia', self.url).status_code, 200)
+        self.assertEqual(send.call_count, 2)
+        self.assertEqual(send.call_args.kwargs['timeout'], http_client.get_timeout('wikipedia'))
+
+        # Not idempotent, so not sent twice
+        with mock.patch.object(self.session, 'request', return_value=self._response(503)) as send:
+            self.assertEqual(http_client.post('wikipedia', self.url).status_code, 503)
+        send.assert_called_once()
+
+        with mock.patch.object(self.session, 'request', side_effect=requests.ConnectionError) as send, \
+                self.assertRaises(requests.ConnectionError):
+            http_client.get('wikipedia', self.url)
+        self.assertEqual(send.call_count, http_client.MAX_RETRIES + 1)
+
+        stats = http_client.get_stats()['wikipedia']
+        self.assertEqual(stats['requests'], 3 + http_client.MAX_RETRIES + 1)
+        self.assertEqual(stats['errors'], 2 + http_client.MAX_RETRIES + 1)
+
+        with http_client.override_base_url('https://api.example.com', 'http://localhost:8080'), \
+                mock.patch.object(self.session, 'request', return_value=self._response(200)) as send:
+            http_client.get('wikipedia', self.url)
+        self.assertEqual(send.call_args.args[1], 'http://localhost:8080/items')
+
+    def test_002_rate_limit(self):
+        clock = FakeClock()
+        with mock.patch.dict(provider_limits.RATE_LIMITS, {'nominatim': (1, 60)}), \
+                mock.patch.object(provider_limits, 'time', clock):
+            self.assertTrue(provider_limits.acquire('nominatim'))
+            # Calls made while handling a request do not wait for the next token
+            self.assertFalse(provider_limits.acquire('nominatim'))
+            with mock.patch.object(self.session, 'request') as send, self.assertRaises(http_client.ProviderUnavailable):
+                http_client.get('nominatim', self.url)
+            send.assert_not_called()
+
+            # Background jobs wait for it, up to their limit
+            with provider_limits.waiting(30):
+                self.assertFalse(provider_limits.acquire('nominatim'))
+            with provider_limits.waiting(90):
+                self.assertTrue(provider_limits.acquire('nominatim'))
+            self.assertEqual(clock.now, 1060)
+
+            # A retry that gets no token leaves the caller with the response it already has
+            cache.clear()
+            with mock.patch.object(self.session, 'request', return_value=self._response(503)) as send, \
+                    mock.patch.object(http_client, '_retry_delay', return_value=0):
+                self.assertEqual(http_client.get('nominatim', self.url).status_code, 503)
+            send.assert_called_once()
+
+        with mock.patch.dict(provider_limits.RATE_LIMITS, {'google': (10, 1, 3)}):
+            self.assertEqual([provider_limits.acquire('google') for _ in range(4)], [True, True, True, False])
+
+    def test_003_request_paths_before_background_jobs(self):
+        clock = FakeClock()
+        with mock.patch.dict(provider_limits.RATE_LIMITS, {'nominatim': (1, 1)}), \
+                mock.patch.object(provider_limits, 'time', clock):
+            # Background jobs get half of the rate
+            with provider_limits.waiting(10):
+                self.assertEqual([provider_limits.acquire('nominatim') for _ in range(3)], [True, True, True])
+            self.assertEqual(clock.now, 1004)
+
+            # Other workers have booked the background tokens of the next ten seconds,
+            # which does not hold up calls made while handling a request
+            background_key = f"{provider_limits.PROVIDER_LIMITS_PREFIX}:bucket:nominatim:background"
+            for _ in range(5):
+                self.assertTrue(provider_limits._reserve_token(background_key, 2, 1, 10)[0])
+            self.assertFalse(provider_limits.acquire('nominatim'))
+            clock.sleep(1)
+            self.assertTrue(provider_limits.acquire('nominatim'))
+            clock.sleep(1)
+            self.assertTrue(provider_limits.acquire('nominatim'))
+
+            # A lock left by another holder is neither waited for forever nor released
+            lock_key = f"{provider_limits.PROVIDER_LIMITS_PREFIX}:bucket:nominatim:lock"
+            cache.set(lock_key, 'other')
+            clock.sleep(1)
+            self.assertTrue(provider_limits.acquire('nominatim'))
+            self.assertEqual(cache.get(lock_key), 'other')
+
+    def test_004_circuit_breaker(self):
+        threshold = provider_limits.CIRCUIT_BREAKER_FAILURE_THRESHOLD
+        self.assertIn('overpass', provider_limits.CIRCUIT_BREAKER_PROVIDERS)
+
+        # A success in between starts the count again
+        for _ in range(threshold - 1):
+            provider_limits.record_failure('overpass')
+        provider_limits.record_success('overpass')
+        provider_limits.record_failure('overpass')
+        self.assertTrue(provider_limits.is_available('overpass'))
+
+        with mock.patch.object(self.session, 'request', return_value=self._response(500)) as send:
+            for _ in range(threshold - 1):
+                http_client.get('overpass', self.url, retries=0)
+            with self.assertRaises(http_client.ProviderUnavailable):
+                http_client.get('overpass', self.url)
+        self.assertEqual(send.call_count, threshold - 1)
+        self.assertFalse(provider_limits.is_available('overpass'))
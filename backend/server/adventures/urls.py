@@ -29,4 +29,5 @@ router.register(r'itinerary-days', ItineraryDayViewSet, basename='itinerary-days
 urlpatterns = [
     # Include the router under the 'api/' prefix
     path('', include(router.urls)),
+    path('tiles/<str:layer>/<int:z>/<int:x>/<int:y>.mvt', vector_tile, name='vector-tile'),
 ]
@@ -0,0 +1,123 @@
+"""
+Batch creation of locations, visits and activities.
+
+A batch is a list of objects under the model's key of the request body ({"locations": [...]}).
+Every item is validated with the endpoint's serializer; the valid ones are inserted with
+bulk_create in one transaction and the invalid ones are reported back, so one bad row does not
+fail a whole import. bulk_create skips Model.save() and the post_save signals, so the views do
+their work once per batch instead: default categories, geocode jobs, visited sync, cached stats
+and data versions.
+"""
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from rest_framework import serializers, status
+from rest_framework.response import Response
+
+from adventures.models import PendingVisitedSync
+from adventures.utils.conditional import bump_data_version
+from adventures.utils.stats_cache import invalidate_user_stats
+
+BATCH_MAX_ITEMS = getattr(settings, 'BATCH_MAX_ITEMS', 500)
+
+
+def get_batch_items(request, key):
+    """Return the list of objects under `key` of the request body, raising ValueError when it is missing or too long."""
+    items = request.data.get(key) if isinstance(request.data, dict) else None
+    if not isinstance(items, list) or not items:
+        raise ValueError(f"Provide a list of objects in '{key}'.")
+    if len(items) > BATCH_MAX_ITEMS:
+        raise ValueError(f"A batch can contain at most {BATCH_MAX_ITEMS} objects.")
+    return items
+
+
+class PreloadedRelatedField(serializers.PrimaryKeyRelatedField):
+    """PrimaryKeyRelatedField that finds its objects in a dict loaded once for the whole batch."""
+
+    def __init__(self, objects, **kwargs):
+        self.objects = objects
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        try:
+            obj = self.objects.get(self.get_queryset().model._meta.pk.to_python(data))
+        except (DjangoValidationError, TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if obj is None:
+            self.fail('does_not_exist', pk_value=data)
+        return obj
+
+
+def preload_related(queryset, items, field_name):
+    """Load the objects that `field_name` of every item refers to in one query, keyed by primary key."""
+    pk_field = queryset.model._meta.pk
+    pks = set()
+    for item in items:
+        if not isinstance(item, dict) or item.get(field_name) is None:
+            continue
+        try:
+            pks.add(pk_field.to_python(item[field_name]))
+        except (DjangoValidationError, TypeError, ValueError):
+            continue
+    return {obj.pk: obj for obj in queryset.filter(pk__in=pks)} if pks else {}
+
+
+def validate_items(items, serializer_class, context, check=None, related=None):
+    """
+    Validate every item with `serializer_class`. `check(validated_data)` can reject a valid item
+    by returning an error message, e.g. for permissions. `related` maps relation field names to
+    objects from preload_related, looked up instead of one query per item.
+    Returns ({index: validated_data}, {index: errors}).
+    """
+    valid, errors = {}, {}
+    for index, item in enumerate(items):
+        serializer = serializer_class(data=item, context=context)
+        for field_name, objects in (related or {}).items():
+            field = serializer.fields[field_name]
+            serializer.fields[field_name] = PreloadedRelatedField(
+                objects, queryset=field.queryset, required=field.required, allow_null=field.allow_null
+            )
+        if not serializer.is_valid():
+            errors[index] = serializer.errors
+            continue
+        error = check(serializer.validated_data) if check else None
+        if error:
+            errors[index] = {'non_field_errors': [error]}
+            continue
+        valid[index] = serializer.validated_data
+    return valid, errors
+
+
+def after_batch_commit(user_ids, visited_sync=False):
+    """Once the transaction commits, do for the owners what the skipped post_save signals do per row."""
+    user_ids = set(filter(None, user_ids))
+
+    def run():
+        for user_id in user_ids:
+            if visited_sync:
+                PendingVisitedSync.mark(user_id)
+            invalidate_user_stats(user_id)
+        bump_data_version(*user_ids)
+
+    transaction.on_commit(run)
+
+
+def batch_response(created, errors, total):
+    """
+    Per-item results in request order: {"index", "id"} for created objects and {"index", "errors"}
+    for rejected ones. 201 when every item was created, 207 when some were, 400 when none were.
+    """
+    results = []
+    for index in range(total):
+        if index in created:
+            results.append({'index': index, 'id': created[index].pk})
+        else:
+            results.append({'index': index, 'errors': errors.get(index, {})})
+
+    if not errors:
+        status_code = status.HTTP_201_CREATED
+    elif created:
+        status_code = status.HTTP_207_MULTI_STATUS
+    else:
+        status_code = status.HTTP_400_BAD_REQUEST
+    return Response({'created': len(created), 'failed': len(errors), 'results': results}, status=status_code)
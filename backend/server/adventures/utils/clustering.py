@@ -0,0 +1,161 @@
+"""
+Server-side clustering of a user's location pins for the map.
+
+The world is cut into square tiles of 360 / 2**zoom degrees and every tile into
+CELLS_PER_TILE x CELLS_PER_TILE grid cells. The locations in the requested tiles are found
+through the GiST index on Location.point and grouped per cell in one GROUP BY (the grid
+snapping ST_SnapToGrid would do, computed on the stored coordinates), giving a count,
+centroid and visited/unvisited split per cluster.
+
+Clusters are cached per user, zoom and tile. The key includes the user's data version (see
+adventures.utils.conditional) and the current date (visited status depends on it), so a
+write or a new day simply stops matching the old entries.
+"""
+import logging
+import math
+
+from django.contrib.gis.geos import Polygon
+from django.core.cache import cache
+from django.db.models import Avg, Count, Exists, FloatField, OuterRef, Q, Value
+from django.db.models.functions import Cast, Floor, Least
+from django.utils import timezone
+
+from adventures.utils.conditional import get_data_versions
+
+logger = logging.getLogger(__name__)
+
+CLUSTER_CACHE_PREFIX = 'clusters'
+CLUSTER_CACHE_TTL = 60 * 60
+CELLS_PER_TILE = 4
+MAX_ZOOM = 20
+# A viewport is a few dozen tiles, this only stops a world bbox requested at street level
+MAX_TILES = 1024
+
+
+def tile_size(zoom):
+    return 360 / 2 ** zoom
+
+
+def _tile_columns(min_lng, max_lng, size):
+    """Tile columns covering the longitude range, which wraps when it crosses the antimeridian."""
+    columns = int(360 / size)
+    first = int((min_lng + 180) // size)
+    last = min(int((max_lng + 180) // size), columns - 1)
+    if min_lng <= max_lng:
+        return list(range(first, last + 1))
+    return list(range(first, columns)) + list(range(0, last + 1))
+
+
+def _tile_rows(min_lat, max_lat, size):
+    rows = math.ceil(180 / size)
+    return list(range(int((min_lat + 90) // size), min(int((max_lat + 90) // size), rows - 1) + 1))
+
+
+def _compute_tiles(user, zoom, columns, rows):
+    """Cluster the user's locations in the given tile columns and rows, returning {(x, y): [cluster, ...]}."""
+    from adventures.models import Location, Visit
+
+    size = tile_size(zoom)
+    cell = size / CELLS_PER_TILE
+    tiles = {(x, y): [] for x in columns for y in rows}
+
+    visited = Visit.objects.filter(location=OuterRef('pk'), start_date__date__lte=timezone.now().date())
+    longitude = Cast('longitude', FloatField())
+    latitude = Cast('latitude', FloatField())
+
+    # Contiguous runs of columns, two when the tiles wrap around the antimeridian
+    runs = []
+    for x in sorted(columns):
+        if runs and x == runs[-1][1] + 1:
+            runs[-1][1] = x
+        else:
+            runs.append([x, x])
+    min_lat, max_lat = min(rows) * size - 90, (max(rows) + 1) * size - 90
+    in_tiles = Q()
+    for first, last in runs:
+        in_tiles |= Q(point__bboverlaps=Polygon.from_bbox((first * size - 180, min_lat, (last + 1) * size - 180, max_lat)))
+
+    # Longitude 180 and latitude 90 fall on the far edge of the last cell, not in a cell past it
+    last_cell_x = Value(float(int(360 / size) * CELLS_PER_TILE - 1))
+    last_cell_y = Value(float(math.ceil(180 / size) * CELLS_PER_TILE - 1))
+
+    cells = (
+        Location.objects.filter(in_tiles, user=user)
+        .annotate(
+            cell_x=Least(Floor((longitude + 180.0) / cell), last_cell_x),
+            cell_y=Least(Floor((latitude + 90.0) / cell), last_cell_y),
+        )
+        .values('cell_x', 'cell_y')
+        .annotate(
+            count=Count('id'),
+            visited=Count('id', filter=Q(Exists(visited))),
+            center_lat=Avg(latitude),
+            center_lng=Avg(longitude),
+        )
+        .order_by()
+    )
+
+    for row in cells:
+        cell_x, cell_y = int(row['cell_x']), int(row['cell_y'])
+        key = (cell_x // CELLS_PER_TILE, cell_y // CELLS_PER_TILE)
+        if key not in tiles:
+            continue
+        tiles[key].append({
+            'latitude': round(row['center_lat'], 6),
+            'longitude': round(row['center_lng'], 6),
+            'count': row['count'],
+            'visited': row['visited'],
+            'unvisited': row['count'] - row['visited'],
+            'bounds': [
+                round(cell_x * cell - 180, 6), round(cell_y * cell - 90, 6),
+                round((cell_x + 1) * cell - 180, 6), round((cell_y + 1) * cell - 90, 6),
+            ],
+        })
+    return tiles
+
+
+def parse_bbox(value):
+    """Parse a `min_lon,min_lat,max_lon,max_lat` bbox, raising ValueError when it is malformed."""
+    parts = [float(part) for part in value.split(',')]
+    if len(parts) != 4:
+        raise ValueError('bbox must be min_lon,min_lat,max_lon,max_lat')
+    min_lng, min_lat, max_lng, max_lat = parts
+    if not (-180 <= min_lng <= 180 and -180 <= max_lng <= 180 and -90 <= min_lat <= max_lat <= 90):
+        raise ValueError('bbox is out of range')
+    return min_lng, min_lat, max_lng, max_lat
+
+
+def get_clusters(user, zoom, bbox):
+    """Return the clusters of the user's locations in the tiles covering `bbox` (min_lng, min_lat, max_lng, max_lat)."""
+    min_lng, min_lat, max_lng, max_lat = bbox
+    size = tile_size(zoom)
+    columns = _tile_columns(min_lng, max_lng, size)
+    rows = _tile_rows(min_lat, max_lat, size)
+    if len(columns) * len(rows) > MAX_TILES:
+        raise ValueError('bbox covers too many tiles at this zoom level')
+
+    versions = get_data_versions(user.id)
+    if versions is None:
+        tiles = _compute_tiles(user, zoom, columns, rows)
+        return [cluster for clusters in tiles.values() for cluster in clusters]
+
+    prefix = f"{CLUSTER_CACHE_PREFIX}:{user.id}:{versions[0]}:{timezone.localdate().isoformat()}:{zoom}"
+    keys = {(x, y): f"{prefix}:{x}:{y}" for x in columns for y in rows}
+    try:
+        cached = cache.get_many(keys.values())
+    except Exception as e:
+        logger.warning(f"Cluster cache unavailable: {e}")
+        cached = {}
+
+    missing = [tile for tile, key in keys.items() if key not in cached]
+    if missing:
+        computed = _compute_tiles(
+            user, zoom, sorted({x for x, _ in missing}), sorted({y for _, y in missing})
+        )
+        try:
+            cache.set_many({keys[tile]: clusters for tile, clusters in computed.items()}, CLUSTER_CACHE_TTL)
+        except Exception as e:
+            logger.warning(f"Could not store clusters for user {user.id}: {e}")
+        cached.update({keys[tile]: clusters for tile, clusters in computed.items()})
+
+    return [cluster for key in keys.values() for cluster in cached[key]]
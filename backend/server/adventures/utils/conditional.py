@@ -0,0 +1,155 @@
+"""
+Conditional GET (ETag) for read endpoints.
+
+Before a decorated view runs, its fingerprint is computed from cheap inputs only: the
+Max('updated_at') and row count of the queryset it renders, and the data versions of the
+users whose writes can show up in the response. A client whose cached copy has the same
+fingerprint gets a 304 Not Modified and nothing is serialized.
+
+Data versions are timestamps kept in the cache. A user's version is bumped by
+adventures.signals whenever they write something a response renders (images, visits, notes,
+... which do not change the parent's updated_at). The world data version (countries, regions,
+cities) is bumped by download-countries. A version missing from the cache starts at the
+current time, so an evicted version only costs a full response, never a stale one.
+
+No Last-Modified is sent: its one second resolution cannot tell apart two writes in the same
+second, and a client revalidating with If-Modified-Since alone would get a stale 304.
+"""
+import hashlib
+import logging
+import time
+from functools import wraps
+
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from rest_framework.request import Request
+
+logger = logging.getLogger(__name__)
+
+DATA_VERSION_PREFIX = 'dataversion'
+WORLD_DATA = 'world'
+
+
+def _version_key(scope):
+    return f"{DATA_VERSION_PREFIX}:{scope}"
+
+
+def bump_data_version(*user_ids):
+    """Mark the data of the given users as changed."""
+    now = time.time()
+    versions = {_version_key(user_id): now for user_id in filter(None, user_ids)}
+    if not versions:
+        return
+    try:
+        cache.set_many(versions, None)
+    except Exception as e:
+        logger.warning(f"Could not bump data version: {e}")
+
+
+def bump_world_data_version():
+    """Mark the countries, regions and cities as changed."""
+    try:
+        cache.set(_version_key(WORLD_DATA), time.time(), None)
+    except Exception as e:
+        logger.warning(f"Could not bump world data version: {e}")
+
+
+def get_data_versions(*scopes):
+    """Return the version of each user id or WORLD_DATA scope, or None when the cache is unavailable."""
+    keys = [_version_key(scope) for scope in scopes]
+    try:
+        versions = cache.get_many(keys)
+        missing = {key: time.time() for key in keys if key not in versions}
+        if missing:
+            cache.set_many(missing, None)
+            versions.update(missing)
+    except Exception as e:
+        logger.warning(f"Data versions unavailable: {e}")
+        return None
+    return [versions[key] for key in keys]
+
+
+def related_user_ids(user):
+    """The user and everyone they share a collection with, whose writes can show up in their responses."""
+    if not user.is_authenticated:
+        return set()
+    from adventures.models import Collection
+
+    owners = Collection.objects.filter(shared_with=user).order_by().values_list('user_id', flat=True)
+    members = Collection.objects.filter(
+        user=user, shared_with__isnull=False
+    ).order_by().values_list('shared_with', flat=True)
+    return {user.pk, *owners.union(members)}
+
+
+def get_validators(request, queryset=None, user_ids=(), world=False, date_dependent=False, modified_field='updated_at'):
+    """
+    Return the ETag of a response, or None when it cannot be computed.
+
+    `queryset` is the data the response renders (or a superset of it), fingerprinted by the
+    Max of `modified_field` (None for models without one) and its row count. `user_ids` and
+    `world` select the data versions to include. `date_dependent` responses, whose content
+    changes with the current date (is_visited, collection status), get a new ETag every day.
+    """
+    parts = [request.get_full_path(), request.META.get('HTTP_ACCEPT', ''), request.user.pk]
+    # Whether anything in the fingerprint changes on writes, a bare row count does not on updates
+    tracks_writes = False
+
+    if queryset is not None:
+        aggregates = {'count': Count('pk')}
+        if modified_field:
+            aggregates['modified'] = Max(modified_field)
+        state = queryset.order_by().aggregate(**aggregates)
+        modified = state.get('modified')
+        parts += [state['count'], modified.isoformat() if modified else '']
+        tracks_writes = bool(modified)
+
+    scopes = sorted(filter(None, user_ids))
+    if world:
+        scopes.append(WORLD_DATA)
+    if scopes:
+        versions = get_data_versions(*scopes)
+        if versions is None:
+            return None
+        parts += versions
+        tracks_writes = True
+
+    if date_dependent:
+        parts.append(timezone.localdate().isoformat())
+    if not tracks_writes:
+        return None
+
+    digest = hashlib.md5(repr(parts).encode()).hexdigest()
+    return quote_etag(digest)
+
+
+def conditional_get(validators):
+    """
+    Decorate a view method or function view to answer a conditional GET with 304 Not Modified
+    before the view runs. `validators` is called with the view's arguments and returns the
+    ETag from get_validators(...), or None to always run the view.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            request = args[0] if isinstance(args[0], Request) else args[1]
+            if request.method not in ('GET', 'HEAD'):
+                return func(*args, **kwargs)
+
+            etag = validators(*args, **kwargs)
+            if etag is None:
+                return func(*args, **kwargs)
+
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = func(*args, **kwargs)
+            if response.status_code in (200, 304):
+                response['ETag'] = etag
+                # Cached copies are per user and must be revalidated
+                patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,178 @@
+"""
+Database backed reverse geocoding queue.
+
+Location saves enqueue a GeocodeJob (one row per location, so repeated saves
+collapse into a single job). The process_geocode_queue command claims due jobs
+with SELECT ... FOR UPDATE SKIP LOCKED and runs them on a fixed-size thread pool.
+Jobs left in the running state by a killed worker are reclaimed once their lock
+is older than GEOCODE_QUEUE_STALE_SECONDS.
+"""
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from adventures.geocoding import purge_reverse_geocode_cache
+from adventures.models import GeocodeJob, background_geocode_and_assign
+from main import provider_limits
+
+logger = logging.getLogger(__name__)
+
+# Upper bound for the retry delay, regardless of the number of attempts
+MAX_RETRY_DELAY_SECONDS = 60 * 60
+# How often the worker deletes expired reverse geocode cache entries
+CACHE_PURGE_INTERVAL_SECONDS = 60 * 60
+
+
+def claim_jobs(limit):
+    """Lock and mark up to `limit` due jobs as running. Returns the claimed jobs."""
+    now = timezone.now()
+    stale_before = now - timedelta(seconds=settings.GEOCODE_QUEUE_STALE_SECONDS)
+
+    with transaction.atomic():
+        jobs = list(
+            GeocodeJob.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status='pending', run_after__lte=now) |
+                Q(status='running', locked_at__lt=stale_before)
+            )
+            .order_by('run_after')[:limit]
+        )
+        if jobs:
+            GeocodeJob.objects.filter(id__in=[job.id for job in jobs]).update(
+                status='running', locked_at=now
+            )
+    return jobs
+
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter for the given number of failed attempts."""
+    delay = settings.GEOCODE_QUEUE_RETRY_BASE_SECONDS * (2 ** max(attempts - 1, 0))
+    delay = min(delay, MAX_RETRY_DELAY_SECONDS)
+    return delay + random.uniform(0, delay * 0.1)
+
+
+def run_job(job):
+    """
+    Geocode the location of a claimed job and record the outcome.
+    Returns True when the job completed, False when it was rescheduled or failed.
+
+    Updates are conditional on `requested_at` so a location that was saved again
+    while its job was running keeps the newer pending request.
+    """
+    try:
+        with provider_limits.waiting():
+            background_geocode_and_assign(str(job.location_id))
+    except Exception as e:
+        attempts = job.attempts + 1
+        now = timezone.now()
+        if attempts >= settings.GEOCODE_QUEUE_MAX_ATTEMPTS:
+            status, run_after = 'failed', job.run_after
+            logger.warning(f"Geocode job for location {job.location_id} failed after {attempts} attempts: {e}")
+        else:
+            status, run_after = 'pending', now + timedelta(seconds=retry_delay(attempts))
+            logger.info(f"Geocode job for location {job.location_id} will be retried at {run_after}: {e}")
+
+        GeocodeJob.objects.filter(id=job.id, requested_at=job.requested_at).update(
+            status=status,
+            attempts=attempts,
+            run_after=run_after,
+            locked_at=None,
+            last_error=str(e)[:1000],
+            updated_at=now,
+        )
+        return False
+    finally:
+        close_old_connections()
+
+    now = timezone.now()
+    GeocodeJob.objects.filter(id=job.id, requested_at=job.requested_at).update(
+        status='done',
+        completed_at=now,
+        locked_at=None,
+        last_error=None,
+        updated_at=now,
+    )
+    close_old_connections()
+    return True
+
+
+def queue_stats(window_minutes=60):
+    """Return queue depth per status and the recent throughput of the queue."""
+    now = timezone.now()
+    counts = dict(
+        GeocodeJob.objects.order_by().values_list('status').annotate(total=Count('id'))
+    )
+    completed = GeocodeJob.objects.filter(
+        status='done', completed_at__gte=now - timedelta(minutes=window_minutes)
+    ).count()
+
+    return {
+        'pending': counts.get('pending', 0),
+        'due': GeocodeJob.objects.filter(status='pending', run_after__lte=now).count(),
+        'running': counts.get('running', 0),
+        'done': counts.get('done', 0),
+        'failed': counts.get('failed', 0),
+        'completed_in_window': completed,
+        'window_minutes': window_minutes,
+        'throughput_per_minute': round(completed / window_minutes, 2),
+    }
+
+
+def purge_expired_cache():
+    """Delete expired reverse geocode cache entries, logging instead of stopping the worker on errors."""
+    try:
+        deleted = purge_reverse_geocode_cache()
+    except Exception as e:
+        logger.warning(f"Could not purge the reverse geocode cache: {e}")
+        return
+    finally:
+        close_old_connections()
+    if deleted:
+        logger.info(f"Purged {deleted} expired reverse geocode cache entries")
+
+
+def run_worker(workers, poll_interval, stop_event, once=False):
+    """
+    Process the queue until `stop_event` is set. Claims at most `workers` jobs at a
+    time so the number of concurrent provider calls and DB connections stays bounded.
+    With `once`, returns as soon as no due jobs are left. Expired reverse geocode cache
+    entries are purged every CACHE_PURGE_INTERVAL_SECONDS.
+    """
+    processed = 0
+    succeeded = 0
+    started = time.monotonic()
+    next_purge = started
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='geocode') as pool:
+        while not stop_event.is_set():
+            if time.monotonic() >= next_purge:
+                purge_expired_cache()
+                next_purge = time.monotonic() + CACHE_PURGE_INTERVAL_SECONDS
+
+            jobs = claim_jobs(workers)
+            close_old_connections()
+            if not jobs:
+                if once:
+                    break
+                stop_event.wait(poll_interval)
+                continue
+
+            results = list(pool.map(run_job, jobs))
+            processed += len(results)
+            succeeded += sum(1 for result in results if result)
+
+            if processed % 100 < len(results):
+                elapsed = max(time.monotonic() - started, 1)
+                logger.info(
+                    f"Geocode queue: {processed} jobs processed ({succeeded} succeeded), "
+                    f"{processed / elapsed * 60:.1f} jobs/min"
+                )
+
+    return processed, succeeded
@@ -1,5 +1,6 @@
 import gpxpy
 import geojson
+from django.contrib.gis.geos import LineString, MultiLineString
 
 def gpx_to_geojson(gpx_file):
     """
@@ -36,4 +37,46 @@ def gpx_to_geojson(gpx_file):
         return {
             "error": str(e),
             "message": "Failed to convert GPX to GeoJSON"
-        }
\ No newline at end of file
+        }
+
+
+def _parse_gpx(gpx_file):
+    """
+    Parse a GPX FileField. A new upload is not in the storage yet and is read in place: closing
+    it would make the following save fail (and delete a temporary upload).
+    """
+    if getattr(gpx_file, '_committed', True):
+        with gpx_file.open('r') as f:
+            return gpxpy.parse(f)
+
+    upload = gpx_file.file
+    upload.seek(0)
+    try:
+        content = upload.read()
+    finally:
+        upload.seek(0)
+    if isinstance(content, bytes):
+        content = content.decode('utf-8')
+    return gpxpy.parse(content)
+
+
+def gpx_to_track(gpx_file):
+    """
+    Read the track segments of a GPX file into a MultiLineString (SRID 4326) for spatial
+    queries and vector tiles. Returns None when the file has no usable segment or cannot be read.
+    """
+    if not gpx_file:
+        return None
+
+    try:
+        gpx = _parse_gpx(gpx_file)
+    except Exception:
+        return None
+
+    lines = []
+    for track in gpx.tracks:
+        for segment in track.segments:
+            coords = [(point.longitude, point.latitude) for point in segment.points]
+            if len(coords) >= 2:
+                lines.append(LineString(coords))
+    return MultiLineString(lines, srid=4326) if lines else None
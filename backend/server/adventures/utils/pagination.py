@@ -1,6 +1,159 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from uuid import UUID
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 class StandardResultsSetPagination(PageNumberPagination):
     page_size = 25
     page_size_query_param = 'page_size'
-    max_page_size = 1000
\ No newline at end of file
+    max_page_size = 1000
+
+
+def _encode_value(value):
+    if isinstance(value, (datetime, date)):
+        # Full precision, the cursor must match the stored value exactly
+        return value.isoformat()
+    if isinstance(value, (Decimal, UUID)):
+        return str(value)
+    return value
+
+
+class KeysetPagination(BasePagination):
+    """
+    Opt-in keyset ("cursor") pagination, used when the request has `?pagination=cursor` or a
+    `cursor` parameter. Without either, `paginate_queryset` returns None and the view responds
+    unpaginated.
+
+    Pages are read in the queryset's ordering with the id as tie breaker, continuing after the
+    (sort value, id) of the previous page's last row. Unlike page numbers this needs no OFFSET,
+    so deep pages cost the same as the first, and the total count is only computed with
+    `?count=true`. Rows with a NULL sort value follow PostgreSQL's default order (last when
+    ascending, first when descending).
+
+    Response: {"next": url or null, "results": [...]} plus "count" when requested.
+    """
+    page_size = 25
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    default_ordering = '-id'
+
+    def is_requested(self, request):
+        params = request.query_params
+        return params.get('pagination') == 'cursor' or self.cursor_query_param in params
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def _get_ordering(self, queryset, view):
+        ordering = list(queryset.query.order_by or queryset.model._meta.ordering)
+        if ordering and isinstance(ordering[0], str):
+            key = ordering[0]
+        else:
+            key = getattr(view, 'keyset_ordering', self.default_ordering)
+        descending = key.startswith('-')
+        field = key.lstrip('-')
+        if field == 'pk':
+            field = 'id'
+        return field, descending
+
+    def _decode_cursor(self, cursor):
+        try:
+            data = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+            return data['v'], data['id']
+        except (ValueError, KeyError, TypeError):
+            raise NotFound('Invalid cursor')
+
+    def _encode_cursor(self, value, pk):
+        data = json.dumps({'v': _encode_value(value), 'id': _encode_value(pk)})
+        return base64.urlsafe_b64encode(data.encode()).decode()
+
+    def _after(self, field, descending, value, pk):
+        """Filter for the rows that come after (value, pk) in the ordering."""
+        if field == 'id':
+            return Q(id__lt=pk) if descending else Q(id__gt=pk)
+
+        if descending:
+            if value is None:
+                return Q(**{f'{field}__isnull': True, 'id__lt': pk}) | Q(**{f'{field}__isnull': False})
+            return Q(**{f'{field}__lt': value}) | Q(**{field: value, 'id__lt': pk})
+
+        if value is None:
+            return Q(**{f'{field}__isnull': True, 'id__gt': pk})
+        return (
+            Q(**{f'{field}__gt': value})
+            | Q(**{field: value, 'id__gt': pk})
+            | Q(**{f'{field}__isnull': True})
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.is_requested(request):
+            return None
+
+        self.request = request
+        self.count = queryset.count() if request.query_params.get('count') == 'true' else None
+        page_size = self.get_page_size(request)
+        field, descending = self._get_ordering(queryset, view)
+
+        id_ordering = '-id' if descending else 'id'
+        if field == 'id':
+            queryset = queryset.order_by(id_ordering)
+        else:
+            queryset = queryset.order_by(f"{'-' if descending else ''}{field}", id_ordering)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            value, pk = self._decode_cursor(cursor)
+            queryset = queryset.filter(self._after(field, descending, value, pk))
+
+        # One extra row tells whether there is a next page
+        rows = list(queryset[:page_size + 1])
+        self.has_next = len(rows) > page_size
+        rows = rows[:page_size]
+
+        self.next_cursor = None
+        if self.has_next:
+            last = rows[-1]
+            self.next_cursor = self._encode_cursor(getattr(last, field), last.pk)
+        return rows
+
+    def get_next_link(self):
+        if not self.next_cursor:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        response = {'next': self.get_next_link(), 'results': data}
+        if self.count is not None:
+            response['count'] = self.count
+        return Response(response)
+
+
+class CursorOrPageNumberPagination(StandardResultsSetPagination):
+    """Page number pagination, or KeysetPagination when the client asks for it with ?pagination=cursor."""
+
+    def __init__(self):
+        self.keyset = KeysetPagination()
+        self.use_keyset = False
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.use_keyset = self.keyset.is_requested(request)
+        if self.use_keyset:
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.use_keyset:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
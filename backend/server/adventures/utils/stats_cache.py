@@ -0,0 +1,117 @@
+"""
+Cached per-user stats snapshots for the /stats/counts/ endpoint.
+
+The snapshot is built once and kept in the cache until the user writes a location, visit,
+activity, collection or visited region/city (see adventures.signals), so repeated views of a
+public profile do not recompute every aggregate. Bulk writes that skip model signals (the
+visited sync, the geocode backfill, batch endpoints) call invalidate_user_stats themselves;
+STATS_CACHE_TTL only bounds what is missed.
+
+The /stats/timeline/ buckets that are already closed (everything before the current day,
+week, month or year) are cached the same way; only the current bucket is recomputed per
+request.
+
+World totals (cities, regions, countries) are the same for every user and only change when
+download-countries runs, so they are cached separately under one key.
+"""
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+STATS_CACHE_PREFIX = 'stats'
+STATS_CACHE_TTL = getattr(settings, 'STATS_CACHE_TTL', 600)
+WORLD_TOTALS_TTL = 60 * 60 * 24
+TIMELINE_PERIODS = ('day', 'week', 'month', 'year')
+
+
+def _user_key(user_id):
+    return f"{STATS_CACHE_PREFIX}:counts:{user_id}"
+
+
+def _timeline_key(user_id, period):
+    return f"{STATS_CACHE_PREFIX}:timeline:{user_id}:{period}"
+
+
+def get_user_stats(user_id, build):
+    """Return the cached stats snapshot for the user, building and storing it with `build()` on a miss."""
+    key = _user_key(user_id)
+    try:
+        snapshot = cache.get(key)
+    except Exception as e:
+        logger.warning(f"Stats cache unavailable: {e}")
+        return build()
+    if snapshot is None:
+        snapshot = build()
+        try:
+            cache.set(key, snapshot, STATS_CACHE_TTL)
+        except Exception as e:
+            logger.warning(f"Could not store stats snapshot for user {user_id}: {e}")
+    return snapshot
+
+
+def invalidate_user_stats(*user_ids):
+    """Drop the stats snapshot of the given users so the next request rebuilds it."""
+    keys = []
+    for user_id in filter(None, user_ids):
+        keys.append(_user_key(user_id))
+        keys.extend(_timeline_key(user_id, period) for period in TIMELINE_PERIODS)
+    if not keys:
+        return
+    try:
+        cache.delete_many(keys)
+    except Exception as e:
+        logger.warning(f"Could not invalidate stats snapshot: {e}")
+
+
+def get_closed_timeline(user_id, period, current_start, build):
+    """
+    Return the user's timeline buckets before `current_start`, built with `build()` on a miss.
+    The cached buckets are rebuilt once a new bucket has started.
+    """
+    key = _timeline_key(user_id, period)
+    try:
+        cached = cache.get(key)
+    except Exception as e:
+        logger.warning(f"Stats cache unavailable: {e}")
+        return build()
+    if cached and cached['current_start'] == current_start.isoformat():
+        return cached['buckets']
+
+    buckets = build()
+    try:
+        cache.set(key, {'current_start': current_start.isoformat(), 'buckets': buckets}, STATS_CACHE_TTL)
+    except Exception as e:
+        logger.warning(f"Could not store stats timeline for user {user_id}: {e}")
+    return buckets
+
+
+def get_world_totals():
+    """Return the number of cities, regions and countries known to the server."""
+    from worldtravel.models import City, Country, Region
+
+    key = f"{STATS_CACHE_PREFIX}:world_totals"
+    try:
+        totals = cache.get(key)
+    except Exception:
+        totals = None
+    if totals is None:
+        totals = {
+            'total_cities': City.objects.count(),
+            'total_regions': Region.objects.count(),
+            'total_countries': Country.objects.count(),
+        }
+        try:
+            cache.set(key, totals, WORLD_TOTALS_TTL)
+        except Exception:
+            pass
+    return totals
+
+
+def invalidate_world_totals():
+    try:
+        cache.delete(f"{STATS_CACHE_PREFIX}:world_totals")
+    except Exception:
+        pass
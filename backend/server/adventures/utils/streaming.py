@@ -0,0 +1,39 @@
+"""
+Streaming JSON array responses for endpoints that return every row of a large queryset.
+
+Rows are read with a server-side cursor in chunks of STREAM_CHUNK_SIZE (prefetches run per
+chunk) and written to the client one array element at a time, so memory stays flat however
+many rows the response has and the first bytes go out before the last row is read.
+"""
+import logging
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+logger = logging.getLogger(__name__)
+
+STREAM_CHUNK_SIZE = getattr(settings, 'STREAM_CHUNK_SIZE', 500)
+
+
+def _json_array(queryset, serializer, chunk_size):
+    encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    yield '['
+    try:
+        for index, instance in enumerate(queryset.iterator(chunk_size=chunk_size)):
+            yield (',' if index else '') + encoder.encode(serializer.to_representation(instance))
+    except Exception:
+        # The status line is already sent, the client sees a truncated array
+        logger.exception(f"Streaming {queryset.model.__name__} response failed")
+        raise
+    yield ']'
+
+
+def stream_serialized(queryset, serializer_class, context=None, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Return a streaming JSON response with the serialized rows of `queryset`, the same body as
+    `Response(serializer_class(queryset, many=True, context=context).data)`.
+    """
+    # One serializer renders every row so its fields are only built once
+    serializer = serializer_class(context=context or {})
+    return StreamingHttpResponse(_json_array(queryset, serializer, chunk_size), content_type='application/json')
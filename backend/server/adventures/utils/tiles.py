@@ -0,0 +1,149 @@
+"""
+Mapbox Vector Tiles of a user's map data, built by PostGIS with ST_AsMVT.
+
+Layers:
+    locations   one point per location with coordinates, with name, category and is_visited
+    activities  the GPX track of every activity (Activity.track), simplified to the tile's pixel size
+    regions     the boundaries of the user's visited regions, clipped and simplified per tile
+
+Tiles are cached per user, layer and z/x/y. The key includes the user's data version (and the
+world data version for regions, the current date for locations), see
+adventures.utils.conditional, so writes retire cached tiles without explicit invalidation.
+"""
+import logging
+
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+
+from adventures.utils.conditional import WORLD_DATA, get_data_versions
+
+logger = logging.getLogger(__name__)
+
+TILE_LAYERS = ('locations', 'activities', 'regions')
+TILE_CACHE_PREFIX = 'tiles'
+TILE_CACHE_TTL = 60 * 60 * 24
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+MAX_TILE_ZOOM = 22
+# Width of the web mercator world in meters
+WORLD_WIDTH = 40075016.68557849
+
+_BOUNDS = """
+    WITH bounds AS (
+        SELECT
+            ST_TileEnvelope(%(z)s, %(x)s, %(y)s) AS geom,
+            ST_Transform(ST_TileEnvelope(%(z)s, %(x)s, %(y)s, margin => %(margin)s), 4326) AS geom_4326
+    )
+"""
+
+_LAYER_SQL = {
+    'locations': """
+        SELECT ST_AsMVT(tile, 'locations', %(extent)s, 'geom') FROM (
+            SELECT
+                l.id::text AS id,
+                l.name,
+                c.name AS category,
+                c.icon AS category_icon,
+                EXISTS(
+                    SELECT 1 FROM adventures_visit v
+                    WHERE v.location_id = l.id AND (v.start_date AT TIME ZONE 'UTC')::date <= %(today)s
+                ) AS is_visited,
+                ST_AsMVTGeom(
+                    ST_Transform(l.point, 3857),
+                    bounds.geom, %(extent)s, %(buffer)s, true
+                ) AS geom
+            FROM adventures_location l
+            LEFT JOIN adventures_category c ON c.id = l.category_id
+            CROSS JOIN bounds
+            WHERE l.user_id = %(user_id)s AND l.point && bounds.geom_4326
+        ) AS tile WHERE geom IS NOT NULL
+    """,
+    'activities': """
+        SELECT ST_AsMVT(tile, 'activities', %(extent)s, 'geom') FROM (
+            SELECT
+                a.id::text AS id,
+                a.name,
+                a.sport_type,
+                a.distance,
+                ST_AsMVTGeom(
+                    ST_Simplify(ST_Transform(a.track, 3857), %(tolerance)s),
+                    bounds.geom, %(extent)s, %(buffer)s, true
+                ) AS geom
+            FROM adventures_activity a
+            CROSS JOIN bounds
+            WHERE a.user_id = %(user_id)s AND a.track && bounds.geom_4326
+        ) AS tile WHERE geom IS NOT NULL
+    """,
+    'regions': """
+        SELECT ST_AsMVT(tile, 'regions', %(extent)s, 'geom') FROM (
+            SELECT
+                r.id,
+                r.name,
+                co.country_code,
+                ST_AsMVTGeom(
+                    -- Clipping first keeps the transform away from the poles and off the rest of the polygon
+                    ST_Simplify(ST_Transform(ST_ClipByBox2D(r.geometry, bounds.geom_4326::box2d), 3857), %(tolerance)s),
+                    bounds.geom, %(extent)s, %(buffer)s, true
+                ) AS geom
+            FROM worldtravel_visitedregion vr
+            JOIN worldtravel_region r ON r.id = vr.region_id
+            JOIN worldtravel_country co ON co.id = r.country_id
+            CROSS JOIN bounds
+            WHERE vr.user_id = %(user_id)s AND r.geometry && bounds.geom_4326
+        ) AS tile WHERE geom IS NOT NULL
+    """,
+}
+
+
+def validate_tile(layer, z, x, y):
+    """Raise ValueError when the layer or tile coordinates do not exist."""
+    if layer not in TILE_LAYERS:
+        raise ValueError(f"layer must be one of: {', '.join(TILE_LAYERS)}")
+    if not 0 <= z <= MAX_TILE_ZOOM:
+        raise ValueError(f'z must be between 0 and {MAX_TILE_ZOOM}')
+    if not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise ValueError('x and y must be between 0 and 2^z - 1')
+
+
+def _render_tile(user_id, layer, z, x, y):
+    params = {
+        'z': z,
+        'x': x,
+        'y': y,
+        'user_id': user_id,
+        'extent': TILE_EXTENT,
+        'buffer': TILE_BUFFER,
+        'margin': TILE_BUFFER / TILE_EXTENT,
+        # One pixel of the tile, finer detail is lost in ST_AsMVTGeom anyway
+        'tolerance': WORLD_WIDTH / 2 ** z / TILE_EXTENT,
+        'today': timezone.now().date(),
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(_BOUNDS + _LAYER_SQL[layer], params)
+        row = cursor.fetchone()
+    return bytes(row[0]) if row and row[0] is not None else b''
+
+
+def get_tile(user_id, layer, z, x, y):
+    """Return the vector tile of the user's `layer` at z/x/y, from the cache when possible."""
+    scopes = [user_id, WORLD_DATA] if layer == 'regions' else [user_id]
+    versions = get_data_versions(*scopes)
+    if versions is None:
+        return _render_tile(user_id, layer, z, x, y)
+
+    key = ':'.join(str(part) for part in (TILE_CACHE_PREFIX, layer, user_id, *versions, z, x, y))
+    if layer == 'locations':
+        key += f":{timezone.now().date().isoformat()}"
+    try:
+        tile = cache.get(key)
+    except Exception as e:
+        logger.warning(f"Tile cache unavailable: {e}")
+        return _render_tile(user_id, layer, z, x, y)
+    if tile is None:
+        tile = _render_tile(user_id, layer, z, x, y)
+        try:
+            cache.set(key, tile, TILE_CACHE_TTL)
+        except Exception as e:
+            logger.warning(f"Could not store {layer} tile {z}/{x}/{y}: {e}")
+    return tile
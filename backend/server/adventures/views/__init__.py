@@ -18,4 +18,5 @@ from .import_export_view import *
 from .trail_view import *
 from .activity_view import *
 from .visit_view import *
-from .itinerary_view import *
\ No newline at end of file
+from .itinerary_view import *
+from .tile_view import *
\ No newline at end of file
@@ -1,8 +1,15 @@
 from rest_framework import viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from django.db import transaction
 from django.db.models import Q
-from adventures.models import Location, Activity
+from adventures.models import Location, Activity, Visit
 from adventures.serializers import ActivitySerializer
 from adventures.permissions import IsOwnerOrSharedWithFullAccess
+from adventures.utils import pagination
+from adventures.utils.batch import (
+    after_batch_commit, batch_response, get_batch_items, preload_related, validate_items,
+)
 from rest_framework.exceptions import PermissionDenied
 import gpxpy
 from typing import Tuple
@@ -10,6 +17,9 @@ from typing import Tuple
 class ActivityViewSet(viewsets.ModelViewSet):
     serializer_class = ActivitySerializer
     permission_classes = [IsOwnerOrSharedWithFullAccess]
+    # Lists stay unpaginated unless the client asks for ?pagination=cursor
+    pagination_class = pagination.KeysetPagination
+    keyset_ordering = '-start_date'
 
     def get_queryset(self):
         """
@@ -79,6 +89,46 @@ class ActivityViewSet(viewsets.ModelViewSet):
 
         instance.delete()
 
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """
+        Create many activities in one request. Accepts {"activities": [activity objects]} and
+        returns the id or the validation errors of every object, in request order. GPX files
+        are uploaded per activity, through the regular create endpoint.
+        """
+        if not request.user.is_authenticated:
+            raise PermissionDenied("You must be authenticated to add activities.")
+
+        try:
+            items = get_batch_items(request, 'activities')
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        # Checked once per location, batches usually add many activities to a few visits
+        permitted = {}
+
+        def check(data):
+            location = data['visit'].location
+            if location.id not in permitted:
+                permitted[location.id] = IsOwnerOrSharedWithFullAccess().has_object_permission(request, self, location)
+            if not permitted[location.id]:
+                return "You do not have permission to add an activity to this location."
+
+        # Every visit with its location and owner in one query, the permission check and the owner need both
+        visits = preload_related(Visit.objects.select_related('location__user'), items, 'visit')
+        valid, errors = validate_items(
+            items, ActivitySerializer, self.get_serializer_context(), check, related={'visit': visits}
+        )
+        activities = {}
+        if valid:
+            with transaction.atomic():
+                for index, data in valid.items():
+                    activities[index] = Activity(user=data['visit'].location.user, **data)
+                Activity.objects.bulk_create(activities.values())
+                after_batch_commit({activity.user_id for activity in activities.values()})
+
+        return batch_response(activities, errors, len(items))
+
     def _get_elevation_data_from_gpx(self, gpx_file) -> Tuple[float, float, float, float]:
         """
         Extract elevation data from a GPX file.
@@ -1,6 +1,7 @@
 from django.db.models import Q, Prefetch
 from django.db.models.functions import Lower
 from django.db import transaction
+from django.core.exceptions import ValidationError as DjangoValidationError
 from rest_framework import viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
@@ -13,18 +14,39 @@ import os
 import json
 import zipfile
 import tempfile
-from adventures.models import Collection, Location, Transportation, Note, Checklist, CollectionInvite, ContentImage, CollectionItineraryItem, Lodging, CollectionItineraryDay, ContentAttachment, Category
+from adventures.models import Collection, Location, Transportation, Note, Checklist, ChecklistItem, CollectionInvite, ContentImage, CollectionItineraryItem, Lodging, CollectionItineraryDay, ContentAttachment, Category
 from adventures.permissions import CollectionShared
 from adventures.serializers import CollectionSerializer, CollectionInviteSerializer, UltraSlimCollectionSerializer, CollectionItineraryItemSerializer, CollectionItineraryDaySerializer
 from users.models import CustomUser as User
 from adventures.utils import pagination
+from adventures.utils.conditional import conditional_get, get_validators, related_user_ids
 from users.serializers import CustomUserDetailsSerializer as UserSerializer
 
 
+def _collection_validators(view, request, *args, **kwargs):
+    """
+    Fingerprint the collections the user owns or is shared, or the requested collection and
+    everyone who can write to it for retrieve.
+    """
+    if 'pk' in kwargs:
+        try:
+            queryset = view.get_queryset().filter(pk=kwargs['pk'])
+            members = queryset.prefetch_related(None).values_list('user_id', 'shared_with')
+            user_ids = {user_id for pair in members for user_id in pair}
+        except (ValueError, DjangoValidationError):
+            return None
+        return get_validators(request, queryset, user_ids, date_dependent=True)
+
+    if not request.user.is_authenticated:
+        return None
+    queryset = Collection.objects.filter(Q(user=request.user) | Q(shared_with=request.user)).distinct()
+    return get_validators(request, queryset, related_user_ids(request.user), date_dependent=True)
+
+
 class CollectionViewSet(viewsets.ModelViewSet):
     serializer_class = CollectionSerializer
     permission_classes = [CollectionShared]
-    pagination_class = pagination.StandardResultsSetPagination
+    pagination_class = pagination.CursorOrPageNumberPagination
 
     def get_serializer_class(self):
         """Return different serializers based on the action"""
@@ -162,8 +184,25 @@ class CollectionViewSet(viewsets.ModelViewSet):
         """Get queryset with optimizations for list actions"""
         if self.action in ['list', 'all', 'archived', 'shared']:
             return self.get_optimized_queryset_for_listing()
+        if self.action == 'retrieve':
+            return self.get_base_queryset().select_related('user').prefetch_related(
+                Prefetch(
+                    'locations',
+                    queryset=Location.objects.with_visited().for_serializer(self.request.user),
+                ),
+                Prefetch('transportation_set', queryset=Transportation.objects.select_related('user')),
+                Prefetch('transportation_set__images', queryset=ContentImage.objects.select_related('user')),
+                Prefetch('transportation_set__attachments', queryset=ContentAttachment.objects.select_related('user')),
+                Prefetch('lodging_set', queryset=Lodging.objects.select_related('user')),
+                Prefetch('lodging_set__images', queryset=ContentImage.objects.select_related('user')),
+                Prefetch('lodging_set__attachments', queryset=ContentAttachment.objects.select_related('user')),
+                Prefetch('note_set', queryset=Note.objects.select_related('user')),
+                Prefetch('checklist_set', queryset=Checklist.objects.select_related('user')),
+                Prefetch('checklist_set__checklistitem_set', queryset=ChecklistItem.objects.select_related('user')),
+            )
         return self.get_base_queryset()
     
+    @conditional_get(_collection_validators)
     def list(self, request):
         # make sure the user is authenticated
         if not request.user.is_authenticated:
@@ -186,6 +225,7 @@ class CollectionViewSet(viewsets.ModelViewSet):
         return self.paginate_and_respond(queryset, request)
     
     @action(detail=False, methods=['get'])
+    @conditional_get(_collection_validators)
     def all(self, request):
         if not request.user.is_authenticated:
             return Response({"error": "User is not authenticated"}, status=400)
@@ -206,6 +246,7 @@ class CollectionViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
     
     @action(detail=False, methods=['get'])
+    @conditional_get(_collection_validators)
     def archived(self, request):
         if not request.user.is_authenticated:
             return Response({"error": "User is not authenticated"}, status=400)
@@ -225,6 +266,7 @@ class CollectionViewSet(viewsets.ModelViewSet):
        
         return Response(serializer.data)
     
+    @conditional_get(_collection_validators)
     def retrieve(self, request, pk=None):
         """Retrieve a collection and include itinerary items and day metadata in the response."""
         collection = self.get_object()
@@ -245,6 +287,7 @@ class CollectionViewSet(viewsets.ModelViewSet):
     
     # make an action to retreive all locations that are shared with the user
     @action(detail=False, methods=['get'])
+    @conditional_get(_collection_validators)
     def shared(self, request):
         if not request.user.is_authenticated:
             return Response({"error": "User is not authenticated"}, status=400)
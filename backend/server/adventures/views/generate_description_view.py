@@ -5,6 +5,7 @@ from difflib import SequenceMatcher
 
 import requests
 from django.conf import settings
+from main import http_client
 from rest_framework import viewsets
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
@@ -210,7 +211,7 @@ class GenerateDescription(viewsets.ViewSet):
             'utf8': 1,
         }
 
-        response = requests.get(url, headers=self.get_headers(lang), params=params, timeout=10)
+        response = http_client.get('wikipedia', url, headers=self.get_headers(lang), params=params)
         response.raise_for_status()
 
         try:
@@ -316,11 +317,11 @@ class GenerateDescription(viewsets.ViewSet):
         if extra_params:
             params.update(extra_params)
 
-        response = requests.get(
+        response = http_client.get(
+            'wikipedia',
             self.build_api_url(lang),
             headers=self.get_headers(lang),
             params=params,
-            timeout=10
         )
         response.raise_for_status()
 
@@ -51,23 +51,23 @@ class GlobalSearchView(viewsets.ViewSet):
         results["users"] = UserSerializer(users, many=True).data
 
         # Countries: Full-Text Search
-        countries = Country.objects.annotate(
+        countries = Country.objects.with_counts(request.user).annotate(
             search=SearchVector('name', 'country_code')
         ).filter(search=SearchQuery(search_term))
         results["countries"] = CountrySerializer(countries, many=True).data
 
         # Regions and Cities: Partial Match Search
-        regions = Region.objects.filter(Q(name__icontains=search_term))
+        regions = Region.objects.filter(Q(name__icontains=search_term)).select_related('country').defer('geometry').with_counts()
         results["regions"] = RegionSerializer(regions, many=True).data
 
-        cities = City.objects.filter(Q(name__icontains=search_term))
+        cities = City.objects.filter(Q(name__icontains=search_term)).select_related('region__country').defer('region__geometry')
         results["cities"] = CitySerializer(cities, many=True).data
 
         # Visited Regions and Cities
-        visited_regions = VisitedRegion.objects.filter(user=request.user)
+        visited_regions = VisitedRegion.objects.filter(user=request.user).select_related('region').defer('region__geometry')
         results["visited_regions"] = VisitedRegionSerializer(visited_regions, many=True).data
 
-        visited_cities = VisitedCity.objects.filter(user=request.user)
+        visited_cities = VisitedCity.objects.filter(user=request.user).select_related('city')
         results["visited_cities"] = VisitedCitySerializer(visited_cities, many=True).data
 
         return Response(results)
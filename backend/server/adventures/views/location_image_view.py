@@ -9,6 +9,7 @@ from adventures.serializers import ContentImageSerializer
 from integrations.models import ImmichIntegration
 from adventures.permissions import IsOwnerOrSharedWithFullAccess  # Your existing permission class
 import requests
+from main import http_client
 from adventures.permissions import ContentImagePermission
 
 
@@ -195,10 +196,10 @@ class ContentImageViewSet(viewsets.ModelViewSet):
         
         # Download the image from the shared user's Immich server
         try:
-            immich_response = requests.get(
+            immich_response = http_client.get(
+                'immich',
                 f'{user_integration.server_url}/assets/{immich_id}/thumbnail?size=preview',
                 headers={'x-api-key': user_integration.api_key},
-                timeout=10
             )
             immich_response.raise_for_status()
             
@@ -1,17 +1,41 @@
-from django.utils import timezone
+import math
 from django.db import transaction
-from django.core.exceptions import PermissionDenied
+from django.core.exceptions import PermissionDenied, ValidationError as DjangoValidationError
+from django.contrib.gis.geos import Point, Polygon
+from django.contrib.gis.measure import D
 from django.db.models import Q, Max, Prefetch
 from django.db.models.functions import Lower
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 import requests
-from adventures.models import Location, Category, CollectionItineraryItem, Visit
+from main import http_client
+from adventures.models import Location, Category, CollectionItineraryItem, GeocodeJob, Visit, coordinates_to_point
 from django.contrib.contenttypes.models import ContentType
 from adventures.permissions import IsOwnerOrSharedWithFullAccess
 from adventures.serializers import LocationSerializer, MapPinSerializer, CalendarLocationSerializer
-from adventures.utils import pagination
+from adventures.utils import clustering, pagination
+from adventures.utils.batch import after_batch_commit, batch_response, get_batch_items, validate_items
+from adventures.utils.conditional import conditional_get, get_validators, related_user_ids
+from adventures.utils.streaming import stream_serialized
+
+NEAR_DEFAULT_RADIUS_KM = 25
+NEAR_MAX_RADIUS_KM = 20000
+
+
+def _location_validators(view, request, *args, **kwargs):
+    """Fingerprint the user's own and shared locations, or the requested location for detail actions."""
+    queryset = view.get_queryset()
+    user_ids = related_user_ids(request.user)
+    if 'pk' in kwargs:
+        try:
+            queryset = queryset.filter(pk=kwargs['pk'])
+            user_ids.update(queryset.prefetch_related(None).values_list('user_id', flat=True))
+        except (ValueError, DjangoValidationError):
+            return None
+    return get_validators(request, queryset, user_ids, date_dependent=True)
+
 
 class LocationViewSet(viewsets.ModelViewSet):
     """
@@ -20,10 +44,13 @@ class LocationViewSet(viewsets.ModelViewSet):
     """
     serializer_class = LocationSerializer
     permission_classes = [IsOwnerOrSharedWithFullAccess]
-    pagination_class = pagination.StandardResultsSetPagination
+    pagination_class = pagination.CursorOrPageNumberPagination
 
     # ==================== QUERYSET & PERMISSIONS ====================
 
+    # Actions whose response is built by LocationSerializer from a freshly loaded queryset
+    serialized_actions = {'list', 'retrieve', 'additional_info'}
+
     def get_queryset(self):
         """
         Returns queryset based on user authentication and action type.
@@ -36,16 +63,26 @@ class LocationViewSet(viewsets.ModelViewSet):
             if self.action in public_allowed_actions:
                 return Location.objects.retrieve_locations(
                     user, include_public=True
-                ).order_by('-updated_at')
+                ).with_visited().for_serializer(user, self._rendered_fields()).order_by('-updated_at')
             return Location.objects.none()
 
         include_public = self.action in public_allowed_actions
-        return Location.objects.retrieve_locations(
+        queryset = Location.objects.retrieve_locations(
             user,
             include_public=include_public,
             include_owned=True,
             include_shared=True
-        ).order_by('-updated_at')
+        ).with_visited().order_by('-updated_at')
+        if self.action in ('list', 'calendar'):
+            queryset = self.apply_spatial_filtering(queryset)
+        if self.action in self.serialized_actions:
+            # Writes keep a plain queryset so the response never reuses stale prefetched relations
+            queryset = queryset.for_serializer(user, self._rendered_fields())
+        return queryset
+
+    def _rendered_fields(self):
+        """Top-level fields of a sparse (?fields= / ?expand=) response, None when every field is rendered."""
+        return LocationSerializer.get_rendered_fields(self)
 
     # ==================== SORTING & FILTERING ====================
 
@@ -72,6 +109,43 @@ class LocationViewSet(viewsets.ModelViewSet):
 
         return queryset
 
+    def apply_spatial_filtering(self, queryset):
+        """
+        Keep the locations in `?bbox=min_lon,min_lat,max_lon,max_lat` and/or within `?radius=` km
+        (default 25) of `?near=lat,lon`. Both use the GiST index on Location.point.
+        """
+        params = self.request.query_params
+        try:
+            if 'bbox' in params:
+                min_lng, min_lat, max_lng, max_lat = clustering.parse_bbox(params['bbox'])
+                if min_lng <= max_lng:
+                    queryset = queryset.filter(point__intersects=Polygon.from_bbox((min_lng, min_lat, max_lng, max_lat)))
+                else:
+                    # The box crosses the antimeridian
+                    queryset = queryset.filter(
+                        Q(point__intersects=Polygon.from_bbox((min_lng, min_lat, 180, max_lat)))
+                        | Q(point__intersects=Polygon.from_bbox((-180, min_lat, max_lng, max_lat)))
+                    )
+
+            if 'near' in params:
+                lat, lng = (float(part) for part in params['near'].split(','))
+                radius = float(params.get('radius', NEAR_DEFAULT_RADIUS_KM))
+                if not (-90 <= lat <= 90 and -180 <= lng <= 180 and 0 < radius <= NEAR_MAX_RADIUS_KM):
+                    raise ValueError(f'near must be lat,lon and radius between 0 and {NEAR_MAX_RADIUS_KM} km')
+        except ValueError as e:
+            raise ValidationError({"error": str(e)})
+
+        if 'near' in params:
+            # The bounding box of the circle narrows the rows through the index before the exact distance check
+            lat_delta = radius / 111.32
+            lng_delta = min(radius / (111.32 * max(math.cos(math.radians(lat)), 0.01)), 180)
+            box = Polygon.from_bbox((lng - lng_delta, lat - lat_delta, lng + lng_delta, lat + lat_delta))
+            queryset = queryset.filter(
+                point__intersects=box,
+                point__distance_lte=(Point(lng, lat, srid=4326), D(km=radius)),
+            )
+        return queryset
+
     def _apply_ordering(self, queryset, order_by, order_direction):
         """Apply ordering to queryset based on field type."""
         if order_by == 'date':
@@ -152,9 +226,18 @@ class LocationViewSet(viewsets.ModelViewSet):
         
         return super().destroy(request, *args, **kwargs)
 
+    @conditional_get(_location_validators)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional_get(_location_validators)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
     # ==================== CUSTOM ACTIONS ====================
 
     @action(detail=False, methods=['get'])
+    @conditional_get(_location_validators)
     def filtered(self, request):
         """Filter locations by category types and visit status."""
         types = request.query_params.get('types', '').split(',')
@@ -183,11 +266,13 @@ class LocationViewSet(viewsets.ModelViewSet):
 
         # Apply visit status filtering
         queryset = self._apply_visit_filtering(queryset, request)
-        queryset = self.apply_sorting(queryset)
+        queryset = self.apply_spatial_filtering(queryset)
+        queryset = self.apply_sorting(queryset).for_serializer(request.user, self._rendered_fields())
         
         return self.paginate_and_respond(queryset, request)
 
     @action(detail=False, methods=['get'])
+    @conditional_get(_location_validators)
     def all(self, request):
         """Get all locations (public and owned) with optional collection filtering."""
         if not request.user.is_authenticated:
@@ -205,11 +290,13 @@ class LocationViewSet(viewsets.ModelViewSet):
         else:
             queryset = Location.objects.filter(base_filter, collections__isnull=True)
 
-        queryset = self.apply_sorting(queryset)
-        serializer = self.get_serializer(queryset, many=True, context={'nested': nested, 'allowed_nested_fields': allowedNestedFields})
-        return Response(serializer.data)
+        queryset = self.apply_spatial_filtering(queryset)
+        queryset = self.apply_sorting(queryset).with_visited().for_serializer(request.user, self._rendered_fields())
+        context = {**self.get_serializer_context(), 'nested': nested, 'allowed_nested_fields': allowedNestedFields}
+        return stream_serialized(queryset, self.get_serializer_class(), context)
 
     @action(detail=False, methods=['get'])
+    @conditional_get(_location_validators)
     def calendar(self, request):
         """Return a lightweight payload for calendar rendering."""
         if not request.user.is_authenticated:
@@ -222,17 +309,17 @@ class LocationViewSet(viewsets.ModelViewSet):
             .prefetch_related(
                 Prefetch(
                     'visits',
-                    queryset=Visit.objects.only('id', 'start_date', 'end_date', 'timezone')
+                    queryset=Visit.objects.only('id', 'location_id', 'start_date', 'end_date', 'timezone')
                 )
             )
             .only('id', 'name', 'location', 'category__name', 'category__icon')
             .distinct()
         )
 
-        serializer = CalendarLocationSerializer(queryset, many=True)
-        return Response(serializer.data)
+        return stream_serialized(queryset, CalendarLocationSerializer)
 
     @action(detail=True, methods=['get'], url_path='additional-info')
+    @conditional_get(_location_validators)
     def additional_info(self, request, pk=None):
         """Get adventure with additional sunrise/sunset information."""
         adventure = self.get_object()
@@ -256,14 +343,59 @@ class LocationViewSet(viewsets.ModelViewSet):
     
     # view to return location name and lat/lon for all locations a user owns for the golobal map
     @action(detail=False, methods=['get'], url_path='pins')
+    @conditional_get(_location_validators)
     def map_locations(self, request):
         """Get all locations with name and lat/lon for map display."""
         if not request.user.is_authenticated:
             return Response({"error": "User is not authenticated"}, status=400)
 
-        locations = Location.objects.filter(user=request.user)
-        serializer = MapPinSerializer(locations, many=True)
-        return Response(serializer.data)
+        locations = self.apply_spatial_filtering(Location.objects.filter(user=request.user))
+        locations = locations.with_visited().for_serializer(
+            request.user, set(MapPinSerializer.Meta.fields)
+        )
+        return stream_serialized(locations, MapPinSerializer)
+
+    @action(detail=False, methods=['get'], url_path='pins/clusters')
+    @conditional_get(_location_validators)
+    def clustered_pins(self, request):
+        """
+        Pins of the user's locations grouped into grid cells for the map: count, centroid and
+        visited/unvisited split per cell. Takes `zoom` (0-20) and an optional
+        `bbox=min_lon,min_lat,max_lon,max_lat` (default the whole world).
+        """
+        if not request.user.is_authenticated:
+            return Response({"error": "User is not authenticated"}, status=400)
+
+        try:
+            zoom = int(request.query_params.get('zoom', 0))
+            if not 0 <= zoom <= clustering.MAX_ZOOM:
+                raise ValueError(f'zoom must be between 0 and {clustering.MAX_ZOOM}')
+            bbox = clustering.parse_bbox(request.query_params.get('bbox', '-180,-90,180,90'))
+            clusters = clustering.get_clusters(request.user, zoom, bbox)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        return Response({'zoom': zoom, 'clusters': clusters})
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """
+        Create many locations in one request. Accepts {"locations": [location objects]} and
+        returns the id or the validation errors of every object, in request order.
+        """
+        if not request.user.is_authenticated:
+            return Response({"error": "User is not authenticated"}, status=400)
+
+        try:
+            items = get_batch_items(request, 'locations')
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        context = self.get_serializer_context()
+        context['categories'] = {category.name: category for category in Category.objects.filter(user=request.user)}
+        valid, errors = validate_items(items, LocationSerializer, context)
+        created = self._bulk_create_locations(valid, context['categories']) if valid else {}
+        return batch_response(created, errors, len(items))
 
     # ==================== HELPER METHODS ====================
 
@@ -321,6 +453,52 @@ class LocationViewSet(viewsets.ModelViewSet):
                     # is best-effort and shouldn't block the update operation.
                     pass
 
+    def _bulk_create_locations(self, valid, categories):
+        """Insert the validated locations of a batch, returning {index: location}."""
+        user = self.request.user
+
+        def get_category(name, defaults):
+            if name not in categories:
+                categories[name], _ = Category.objects.get_or_create(user=user, name=name, defaults=defaults)
+            return categories[name]
+
+        locations = {}
+        memberships = []
+        with transaction.atomic():
+            for index, data in valid.items():
+                data = dict(data)
+                category = data.pop('category', None)
+                collections = data.pop('collections', [])
+                # Visits are created through /visits/batch/ once the locations exist
+                data.pop('visits', None)
+
+                if isinstance(category, dict):
+                    category = get_category(category['name'], {
+                        'display_name': category.get('display_name', category['name']),
+                        'icon': category.get('icon', '🌍'),
+                    })
+                elif not category:
+                    category = get_category('general', {'display_name': 'General', 'icon': '🌍'})
+
+                location = Location(user=user, category=category, **data)
+                location.point = coordinates_to_point(location.latitude, location.longitude)
+                # What update_adventure_publicity does when a location joins a public collection
+                if any(collection.is_public for collection in collections):
+                    location.is_public = True
+                memberships += [
+                    Location.collections.through(location=location, collection=collection)
+                    for collection in collections
+                ]
+                locations[index] = location
+
+            Location.objects.bulk_create(locations.values())
+            Location.collections.through.objects.bulk_create(memberships)
+            GeocodeJob.enqueue_many(
+                location.id for location in locations.values() if location.latitude and location.longitude
+            )
+            after_batch_commit([user.id], visited_sync=True)
+        return locations
+
     def _validate_collection_permissions(self, collections):
         """Validate permissions for all collections (used in create)."""
         for collection in collections:
@@ -345,14 +523,7 @@ class LocationViewSet(viewsets.ModelViewSet):
         else:
             return queryset
 
-        # Apply visit filtering
-        now = timezone.now().date()
-        if is_visited_bool:
-            queryset = queryset.filter(visits__start_date__lte=now).distinct()
-        else:
-            queryset = queryset.exclude(visits__start_date__lte=now).distinct()
-
-        return queryset
+        return queryset.with_visited().filter(is_visited=is_visited_bool)
 
     def _has_adventure_access(self, adventure, user):
         """Check if user has access to adventure."""
@@ -387,7 +558,8 @@ class LocationViewSet(viewsets.ModelViewSet):
             )
             
             try:
-                response = requests.get(api_url)
+                # Failed visits are skipped, so don't retry inside the request
+                response = http_client.get('sunrise_sunset', api_url, retries=0)
                 if response.status_code == 200:
                     data = response.json()
                     results = data.get('results', {})
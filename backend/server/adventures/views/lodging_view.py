@@ -1,8 +1,8 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.db.models import Q
-from adventures.models import Lodging
+from django.db.models import Prefetch, Q
+from adventures.models import ContentAttachment, ContentImage, Lodging
 from adventures.serializers import LodgingSerializer
 from rest_framework.exceptions import PermissionDenied
 from adventures.permissions import IsOwnerOrSharedWithFullAccess
@@ -18,6 +18,9 @@ class LodgingViewSet(viewsets.ModelViewSet):
             return Response(status=status.HTTP_403_FORBIDDEN)
         queryset = Lodging.objects.filter(
             Q(user=request.user.id)
+        ).select_related('user').prefetch_related(
+            Prefetch('images', queryset=ContentImage.objects.select_related('user')),
+            Prefetch('attachments', queryset=ContentAttachment.objects.select_related('user')),
         )
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
@@ -4,6 +4,7 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from django.conf import settings
 import requests
+from main import http_client
 from geopy.distance import geodesic
 import logging
 from ..geocoding import search_google, search_osm
@@ -321,11 +322,11 @@ class RecommendationsViewSet(viewsets.ViewSet):
             return {"error": "Invalid category.", "results": []}
 
         try:
-            response = requests.post(
+            response = http_client.post(
+                'overpass',
                 self.OVERPASS_URL,
                 data=query,
                 headers=self.HEADERS,
-                timeout=30
             )
             response.raise_for_status()
             data = response.json()
@@ -409,7 +410,7 @@ class RecommendationsViewSet(viewsets.ViewSet):
         }
         
         try:
-            response = requests.post(url, json=payload, headers=headers, timeout=15)
+            response = http_client.post('google_places', url, json=payload, headers=headers)
             response.raise_for_status()
             data = response.json()
             
@@ -616,7 +617,7 @@ class RecommendationsViewSet(viewsets.ViewSet):
                     }
                 }
                 
-                response = requests.post(url, json=payload, headers=headers, timeout=15)
+                response = http_client.post('google_places', url, json=payload, headers=headers)
                 response.raise_for_status()
                 data = response.json()
                 places = data.get('places', [])
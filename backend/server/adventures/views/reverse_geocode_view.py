@@ -4,6 +4,8 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from worldtravel.models import Region, City, VisitedRegion, VisitedCity
 from adventures.models import Location
+from adventures.utils.conditional import bump_data_version
+from adventures.utils.stats_cache import invalidate_user_stats
 from adventures.serializers import LocationSerializer
 from adventures.geocoding import reverse_geocode
 from django.conf import settings
@@ -54,27 +56,23 @@ class ReverseGeocodeViewSet(viewsets.ViewSet):
         new_city_count = 0
         new_cities = {}
         
-        # Get all visited locations with their region and city data
+        # Get the region and city ids of all visited locations
         visited_locations = Location.objects.filter(
             user=self.request.user
-        ).select_related('region', 'city')
+        ).visited().values_list('region_id', 'city_id')
         
         # Track unique regions and cities to create VisitedRegion/VisitedCity entries
         regions_to_mark = set()
         cities_to_mark = set()
         
-        for location in visited_locations:
-            # Only process locations that are marked as visited
-            if not location.is_visited_status():
-                continue
-            
+        for region_id, city_id in visited_locations:
             # Collect regions
-            if location.region:
-                regions_to_mark.add(location.region.id)
+            if region_id:
+                regions_to_mark.add(region_id)
             
             # Collect cities
-            if location.city:
-                cities_to_mark.add(location.city.id)
+            if city_id:
+                cities_to_mark.add(city_id)
         
         # Get existing visited regions for this user
         existing_visited_regions = set(
@@ -93,12 +91,12 @@ class ReverseGeocodeViewSet(viewsets.ViewSet):
                 )
         
         if new_visited_regions:
-            VisitedRegion.objects.bulk_create(new_visited_regions)
+            VisitedRegion.objects.bulk_create(new_visited_regions, ignore_conflicts=True)
             new_region_count = len(new_visited_regions)
             # Get region names for response
             regions = Region.objects.filter(
                 id__in=[vr.region_id for vr in new_visited_regions]
-            )
+            ).only('id', 'name')
             new_regions = {r.id: r.name for r in regions}
         
         # Get existing visited cities for this user
@@ -118,7 +116,7 @@ class ReverseGeocodeViewSet(viewsets.ViewSet):
                 )
         
         if new_visited_cities:
-            VisitedCity.objects.bulk_create(new_visited_cities)
+            VisitedCity.objects.bulk_create(new_visited_cities, ignore_conflicts=True)
             new_city_count = len(new_visited_cities)
             # Get city names for response
             cities = City.objects.filter(
@@ -126,6 +124,11 @@ class ReverseGeocodeViewSet(viewsets.ViewSet):
             )
             new_cities = {c.id: c.name for c in cities}
         
+        if new_visited_regions or new_visited_cities:
+            # bulk_create skips the signals that drop the cached stats and change the user's ETags
+            invalidate_user_stats(self.request.user.id)
+            bump_data_version(self.request.user.id)
+
         return Response({
             "new_regions": new_region_count,
             "regions": new_regions,
@@ -3,14 +3,29 @@ from rest_framework.response import Response
 from rest_framework.decorators import action
 from django.shortcuts import get_object_or_404
 from adventures.utils.sports_types import SPORT_CATEGORIES
-from adventures.utils.get_is_visited import is_location_visited
-from django.db.models import Sum, Avg, Max, Count
-from worldtravel.models import City, Region, Country, VisitedCity, VisitedRegion
-from adventures.models import Location, Collection, Activity
+from django.db.models import Sum, Max, Min, Count, Q
+from django.db.models.functions import Trunc
+from django.utils import timezone
+from datetime import timedelta
+from worldtravel.models import VisitedCity, VisitedRegion
+from adventures.models import Location, Collection, Activity, Visit
+from adventures.utils.conditional import conditional_get, get_validators
+from adventures.utils.stats_cache import TIMELINE_PERIODS, get_closed_timeline, get_user_stats, get_world_totals
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
+
+def _stats_validators(view, request, username):
+    """Stats only change with the profile owner's data, the world data and the current date."""
+    user_id = User.objects.filter(
+        Q(public_profile=True) | Q(pk=request.user.pk), username=username
+    ).values_list('pk', flat=True).first()
+    if user_id is None:
+        return None
+    return get_validators(request, user_ids=[user_id], world=True, date_dependent=True)
+
+
 class StatsViewSet(viewsets.ViewSet):
     """
     A simple ViewSet for listing the stats of a user.
@@ -18,165 +33,256 @@ class StatsViewSet(viewsets.ViewSet):
 
     def _get_visited_locations_count(self, user):
         """Calculate count of visited locations for a user"""
-        visited_count = 0
-        
-        # Get all locations for this user
-        user_locations = Location.objects.filter(user=user).prefetch_related('visits')
-        
-        for location in user_locations:
-            if is_location_visited(location):
-                visited_count += 1
-        
-        return visited_count
+        return Location.objects.filter(user=user).visited().count()
+
+    def _get_activity_totals_by_sport(self, user_activities):
+        """
+        Aggregate the user's activities per sport type in a single GROUP BY query.
+        Averages are returned as sum and non-null count so they can be combined across sports.
+        """
+        rows = user_activities.values('sport_type').annotate(
+            count=Count('id'),
+            total_distance=Sum('distance'),
+            total_moving_time=Sum('moving_time'),
+            total_elevation_gain=Sum('elevation_gain'),
+            total_elevation_loss=Sum('elevation_loss'),
+            total_calories=Sum('calories'),
+            max_distance=Max('distance'),
+            max_elevation_gain=Max('elevation_gain'),
+            max_speed=Max('max_speed'),
+            distance_count=Count('distance'),
+            elevation_gain_count=Count('elevation_gain'),
+            speed_sum=Sum('average_speed'),
+            speed_count=Count('average_speed'),
+        ).order_by()
+        return {row['sport_type']: row for row in rows}
 
-    def _get_activity_stats_by_category(self, user_activities):
+    @staticmethod
+    def _combine(rows):
+        """Fold per-sport aggregate rows into one set of totals."""
+        def total(field):
+            return sum(row[field] or 0 for row in rows)
+
+        def maximum(field):
+            values = [row[field] for row in rows if row[field] is not None]
+            return max(values) if values else 0
+
+        def average(sum_field, count_field):
+            count = total(count_field)
+            return total(sum_field) / count if count else 0
+
+        moving_time = sum((row['total_moving_time'] for row in rows if row['total_moving_time']), timedelta())
+        return {
+            'count': total('count'),
+            'total_distance': total('total_distance'),
+            # Convert Duration objects to total seconds for JSON serialization
+            'total_moving_time': int(moving_time.total_seconds()),
+            'total_elevation_gain': total('total_elevation_gain'),
+            'total_elevation_loss': total('total_elevation_loss'),
+            'total_calories': total('total_calories'),
+            'avg_distance': average('total_distance', 'distance_count'),
+            'max_distance': maximum('max_distance'),
+            'avg_elevation_gain': average('total_elevation_gain', 'elevation_gain_count'),
+            'max_elevation_gain': maximum('max_elevation_gain'),
+            'avg_speed': average('speed_sum', 'speed_count'),
+            'max_speed': maximum('max_speed'),
+        }
+
+    def _get_activity_stats_by_category(self, totals_by_sport):
         """Calculate detailed stats for each sport category"""
         category_stats = {}
-        
+
         for category, sports in SPORT_CATEGORIES.items():
-            activities = user_activities.filter(sport_type__in=sports)
-            
-            if activities.exists():
-                # Calculate aggregated stats
-                stats = activities.aggregate(
-                    count=Count('id'),
-                    total_distance=Sum('distance'),
-                    total_moving_time=Sum('moving_time'),
-                    total_elevation_gain=Sum('elevation_gain'),
-                    total_elevation_loss=Sum('elevation_loss'),
-                    avg_distance=Avg('distance'),
-                    max_distance=Max('distance'),
-                    avg_elevation_gain=Avg('elevation_gain'),
-                    max_elevation_gain=Max('elevation_gain'),
-                    avg_speed=Avg('average_speed'),
-                    max_speed=Max('max_speed'),
-                    total_calories=Sum('calories')
-                )
-                
-                # Convert Duration objects to total seconds for JSON serialization
-                total_moving_seconds = 0
-                if stats['total_moving_time']:
-                    total_moving_seconds = int(stats['total_moving_time'].total_seconds())
-                
-                # Get sport type breakdown within category
-                sport_breakdown = {}
-                for sport in sports:
-                    sport_activities = activities.filter(sport_type=sport)
-                    if sport_activities.exists():
-                        sport_stats = sport_activities.aggregate(
-                            count=Count('id'),
-                            total_distance=Sum('distance'),
-                            total_elevation_gain=Sum('elevation_gain')
-                        )
-                        sport_breakdown[sport] = {
-                            'count': sport_stats['count'],
-                            'total_distance': round(sport_stats['total_distance'] or 0, 2),
-                            'total_elevation_gain': round(sport_stats['total_elevation_gain'] or 0, 2)
-                        }
-                
-                category_stats[category] = {
-                    'count': stats['count'],
-                    'total_distance': round(stats['total_distance'] or 0, 2),
-                    'total_moving_time': total_moving_seconds,
-                    'total_elevation_gain': round(stats['total_elevation_gain'] or 0, 2),
-                    'total_elevation_loss': round(stats['total_elevation_loss'] or 0, 2),
-                    'avg_distance': round(stats['avg_distance'] or 0, 2),
-                    'max_distance': round(stats['max_distance'] or 0, 2),
-                    'avg_elevation_gain': round(stats['avg_elevation_gain'] or 0, 2),
-                    'max_elevation_gain': round(stats['max_elevation_gain'] or 0, 2),
-                    'avg_speed': round(stats['avg_speed'] or 0, 2),
-                    'max_speed': round(stats['max_speed'] or 0, 2),
-                    'total_calories': round(stats['total_calories'] or 0, 2),
-                    'sports': sport_breakdown
-                }
-        
+            rows = [totals_by_sport[sport] for sport in sports if sport in totals_by_sport]
+            if not rows:
+                continue
+
+            stats = self._combine(rows)
+
+            # Get sport type breakdown within category
+            sport_breakdown = {}
+            for sport in sports:
+                if sport in totals_by_sport:
+                    sport_stats = totals_by_sport[sport]
+                    sport_breakdown[sport] = {
+                        'count': sport_stats['count'],
+                        'total_distance': round(sport_stats['total_distance'] or 0, 2),
+                        'total_elevation_gain': round(sport_stats['total_elevation_gain'] or 0, 2)
+                    }
+
+            category_stats[category] = {
+                'count': stats['count'],
+                'total_distance': round(stats['total_distance'], 2),
+                'total_moving_time': stats['total_moving_time'],
+                'total_elevation_gain': round(stats['total_elevation_gain'], 2),
+                'total_elevation_loss': round(stats['total_elevation_loss'], 2),
+                'avg_distance': round(stats['avg_distance'], 2),
+                'max_distance': round(stats['max_distance'], 2),
+                'avg_elevation_gain': round(stats['avg_elevation_gain'], 2),
+                'max_elevation_gain': round(stats['max_elevation_gain'], 2),
+                'avg_speed': round(stats['avg_speed'], 2),
+                'max_speed': round(stats['max_speed'], 2),
+                'total_calories': round(stats['total_calories'], 2),
+                'sports': sport_breakdown
+            }
+
         return category_stats
 
-    def _get_overall_activity_stats(self, user_activities):
+    def _get_overall_activity_stats(self, totals_by_sport):
         """Calculate overall activity statistics"""
-        if not user_activities.exists():
-            return {
-                'total_count': 0,
-                'total_distance': 0,
-                'total_moving_time': 0,
-                'total_elevation_gain': 0,
-                'total_elevation_loss': 0,
-                'total_calories': 0
-            }
-        
-        stats = user_activities.aggregate(
-            total_count=Count('id'),
-            total_distance=Sum('distance'),
-            total_moving_time=Sum('moving_time'),
-            total_elevation_gain=Sum('elevation_gain'),
-            total_elevation_loss=Sum('elevation_loss'),
-            total_calories=Sum('calories')
-        )
-        
-        # Convert Duration to seconds
-        total_moving_seconds = 0
-        if stats['total_moving_time']:
-            total_moving_seconds = int(stats['total_moving_time'].total_seconds())
-        
+        stats = self._combine(list(totals_by_sport.values()))
         return {
-            'total_count': stats['total_count'],
-            'total_distance': round(stats['total_distance'] or 0, 2),
-            'total_moving_time': total_moving_seconds,
-            'total_elevation_gain': round(stats['total_elevation_gain'] or 0, 2),
-            'total_elevation_loss': round(stats['total_elevation_loss'] or 0, 2),
-            'total_calories': round(stats['total_calories'] or 0, 2)
+            'total_count': stats['count'],
+            'total_distance': round(stats['total_distance'], 2),
+            'total_moving_time': stats['total_moving_time'],
+            'total_elevation_gain': round(stats['total_elevation_gain'], 2),
+            'total_elevation_loss': round(stats['total_elevation_loss'], 2),
+            'total_calories': round(stats['total_calories'], 2)
         }
 
-    @action(detail=False, methods=['get'], url_path=r'counts/(?P<username>[\w.@+-]+)')
-    def counts(self, request, username):
-        if request.user.username == username:
-            user = get_object_or_404(User, username=username)
-        else:
-            user = get_object_or_404(User, username=username, public_profile=True)
-        
-        # remove the email address from the response
-        user.email = None
-        
-        # get the counts for the user
-        location_count = Location.objects.filter(user=user.id).count()
-        visited_location_count = self._get_visited_locations_count(user)
-        trips_count = Collection.objects.filter(user=user.id).count()
-        visited_city_count = VisitedCity.objects.filter(user=user.id).count()
-        total_cities = City.objects.count()
-        visited_region_count = VisitedRegion.objects.filter(user=user.id).count()
-        total_regions = Region.objects.count()
-        visited_country_count = VisitedRegion.objects.filter(
-            user=user.id).values('region__country').distinct().count()
-        total_countries = Country.objects.count()
-        
+    def _build_counts(self, user):
+        """Compute the stats snapshot for a user. World totals are added by the caller."""
+        visited_regions = VisitedRegion.objects.filter(user=user.id).aggregate(
+            regions=Count('id'),
+            countries=Count('region__country', distinct=True),
+        )
+
         # get activity data
-        user_activities = Activity.objects.filter(user=user.id)
-        
+        totals_by_sport = self._get_activity_totals_by_sport(Activity.objects.filter(user=user.id))
+
         # Get enhanced activity statistics
-        overall_activity_stats = self._get_overall_activity_stats(user_activities)
-        activity_stats_by_category = self._get_activity_stats_by_category(user_activities)
-        
-        return Response({
+        overall_activity_stats = self._get_overall_activity_stats(totals_by_sport)
+        activity_stats_by_category = self._get_activity_stats_by_category(totals_by_sport)
+
+        return {
             # Travel stats
-            'location_count': location_count,
-            'visited_location_count': visited_location_count,
-            'trips_count': trips_count,
-            'visited_city_count': visited_city_count,
-            'total_cities': total_cities,
-            'visited_region_count': visited_region_count,
-            'total_regions': total_regions,
-            'visited_country_count': visited_country_count,
-            'total_countries': total_countries,
-            
+            'location_count': Location.objects.filter(user=user.id).count(),
+            'visited_location_count': self._get_visited_locations_count(user),
+            'trips_count': Collection.objects.filter(user=user.id).count(),
+            'visited_city_count': VisitedCity.objects.filter(user=user.id).count(),
+            'visited_region_count': visited_regions['regions'],
+            'visited_country_count': visited_regions['countries'],
+
             # Overall activity stats
             'activities_overall': overall_activity_stats,
-            
+
             # Detailed activity stats by category
             'activities_by_category': activity_stats_by_category,
-            
+
             # Legacy fields (for backward compatibility)
             'activity_distance': overall_activity_stats['total_distance'],
             'activity_moving_time': overall_activity_stats['total_moving_time'],
             'activity_elevation': overall_activity_stats['total_elevation_gain'],
             'activity_count': overall_activity_stats['total_count'],
-        })
\ No newline at end of file
+        }
+
+    @staticmethod
+    def _bucket_start(now, period):
+        """Start of the day/week/month/year bucket that `now` falls into, matching SQL date_trunc."""
+        start = timezone.localtime(now).replace(hour=0, minute=0, second=0, microsecond=0)
+        if period == 'week':
+            start -= timedelta(days=start.weekday())
+        elif period == 'month':
+            start = start.replace(day=1)
+        elif period == 'year':
+            start = start.replace(month=1, day=1)
+        return start
+
+    def _get_timeline_buckets(self, user, period, since=None, until=None):
+        """
+        Aggregate activities, visits and first visits of countries/regions per `period` bucket
+        with date_trunc. `since`/`until` limit the buckets to [since, until).
+        """
+        def in_range(queryset, field):
+            if since:
+                queryset = queryset.filter(**{f'{field}__gte': since})
+            if until:
+                queryset = queryset.filter(**{f'{field}__lt': until})
+            return queryset
+
+        buckets = {}
+
+        def bucket(start):
+            return buckets.setdefault(start.date().isoformat(), {
+                'activity_count': 0,
+                'distance': 0,
+                'elevation_gain': 0,
+                'moving_time': 0,
+                'visit_count': 0,
+                'new_countries': 0,
+                'new_regions': 0,
+            })
+
+        activities = in_range(Activity.objects.filter(user=user.id, start_date__isnull=False), 'start_date')
+        activity_rows = activities.annotate(bucket=Trunc('start_date', period)).values('bucket').annotate(
+            count=Count('id'),
+            distance=Sum('distance'),
+            elevation_gain=Sum('elevation_gain'),
+            moving_time=Sum('moving_time'),
+        ).order_by()
+        for row in activity_rows:
+            entry = bucket(row['bucket'])
+            entry['activity_count'] = row['count']
+            entry['distance'] = round(row['distance'] or 0, 2)
+            entry['elevation_gain'] = round(row['elevation_gain'] or 0, 2)
+            entry['moving_time'] = int(row['moving_time'].total_seconds()) if row['moving_time'] else 0
+
+        user_visits = Visit.objects.filter(location__user=user.id, start_date__isnull=False)
+        visit_rows = in_range(user_visits, 'start_date').annotate(
+            bucket=Trunc('start_date', period)
+        ).values('bucket').annotate(count=Count('id')).order_by()
+        for row in visit_rows:
+            bucket(row['bucket'])['visit_count'] = row['count']
+
+        # A country or region is new in the bucket of its first visit
+        for field, name in (('location__country', 'new_countries'), ('location__region', 'new_regions')):
+            first_visits = user_visits.filter(**{f'{field}__isnull': False}).values(field).annotate(
+                first_visit=Min('start_date')
+            ).order_by()
+            first_visits = in_range(first_visits, 'first_visit').annotate(bucket=Trunc('first_visit', period))
+            for row in first_visits:
+                bucket(row['bucket'])[name] += 1
+
+        return buckets
+
+    @action(detail=False, methods=['get'], url_path=r'timeline/(?P<username>[\w.@+-]+)')
+    @conditional_get(_stats_validators)
+    def timeline(self, request, username):
+        """
+        Travel and activity totals per day, week, month or year (`?period=`, default month).
+        Closed buckets are served from the cache and only the current bucket is recomputed.
+        """
+        if request.user.username == username:
+            user = get_object_or_404(User, username=username)
+        else:
+            user = get_object_or_404(User, username=username, public_profile=True)
+
+        period = request.query_params.get('period', 'month')
+        if period not in TIMELINE_PERIODS:
+            return Response({'error': f"period must be one of: {', '.join(TIMELINE_PERIODS)}"}, status=400)
+
+        current_start = self._bucket_start(timezone.now(), period)
+        buckets = dict(get_closed_timeline(
+            user.id, period, current_start,
+            lambda: self._get_timeline_buckets(user, period, until=current_start),
+        ))
+        buckets.update(self._get_timeline_buckets(user, period, since=current_start))
+
+        return Response({
+            'period': period,
+            'buckets': [{'start': start, **values} for start, values in sorted(buckets.items())],
+        })
+
+    @action(detail=False, methods=['get'], url_path=r'counts/(?P<username>[\w.@+-]+)')
+    @conditional_get(_stats_validators)
+    def counts(self, request, username):
+        if request.user.username == username:
+            user = get_object_or_404(User, username=username)
+        else:
+            user = get_object_or_404(User, username=username, public_profile=True)
+        
+        # remove the email address from the response
+        user.email = None
+
+        counts = get_user_stats(user.id, lambda: self._build_counts(user))
+        return Response({**counts, **get_world_totals()})
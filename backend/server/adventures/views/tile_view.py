@@ -0,0 +1,29 @@
+from django.http import HttpResponse
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from adventures.utils import tiles
+from adventures.utils.conditional import conditional_get, get_validators
+
+
+def _tile_validators(request, layer, z, x, y):
+    if layer not in tiles.TILE_LAYERS:
+        return None
+    return get_validators(
+        request, user_ids=[request.user.pk], world=layer == 'regions', date_dependent=layer == 'locations'
+    )
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@conditional_get(_tile_validators)
+def vector_tile(request, layer, z, x, y):
+    """Mapbox Vector Tile of the user's locations, activity tracks or visited regions."""
+    try:
+        tiles.validate_tile(layer, z, x, y)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
+
+    tile = tiles.get_tile(request.user.id, layer, z, x, y)
+    return HttpResponse(tile, content_type='application/vnd.mapbox-vector-tile')
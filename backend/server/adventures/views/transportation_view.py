@@ -1,7 +1,7 @@
 from rest_framework import viewsets, status
 from rest_framework.response import Response
-from django.db.models import Q
-from adventures.models import Transportation
+from django.db.models import Prefetch, Q
+from adventures.models import ContentAttachment, ContentImage, Transportation
 from adventures.serializers import TransportationSerializer
 from rest_framework.exceptions import PermissionDenied
 from adventures.permissions import IsOwnerOrSharedWithFullAccess
@@ -16,6 +16,9 @@ class TransportationViewSet(viewsets.ModelViewSet):
             return Response(status=status.HTTP_403_FORBIDDEN)
         queryset = Transportation.objects.filter(
             Q(user=request.user.id)
+        ).select_related('user').prefetch_related(
+            Prefetch('images', queryset=ContentImage.objects.select_related('user')),
+            Prefetch('attachments', queryset=ContentAttachment.objects.select_related('user')),
         )
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
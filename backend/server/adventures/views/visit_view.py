@@ -1,10 +1,15 @@
 from rest_framework import viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from django.db import transaction
 from django.db.models import Q
-from adventures.models import Location, Visit
+from adventures.models import Location, Visit, GeocodeJob
 from adventures.serializers import VisitSerializer
 from adventures.permissions import IsOwnerOrSharedWithFullAccess
+from adventures.utils.batch import (
+    after_batch_commit, batch_response, get_batch_items, preload_related, validate_items,
+)
 from rest_framework.exceptions import PermissionDenied
-from adventures.models import background_geocode_and_assign
 
 class VisitViewSet(viewsets.ModelViewSet):
     serializer_class = VisitSerializer
@@ -47,7 +52,7 @@ class VisitViewSet(viewsets.ModelViewSet):
         serializer.save()
 
         # This will update any visited regions or cities based on if it's now visited
-        background_geocode_and_assign(str(location.id))
+        GeocodeJob.enqueue(location.id)
 
     def perform_update(self, serializer):
         instance = serializer.instance
@@ -63,10 +68,54 @@ class VisitViewSet(viewsets.ModelViewSet):
 
         serializer.save()
 
-        background_geocode_and_assign(str(instance.location.id))
+        GeocodeJob.enqueue(instance.location.id)
 
     def perform_destroy(self, instance):
         if not IsOwnerOrSharedWithFullAccess().has_object_permission(self.request, self, instance.location):
             raise PermissionDenied("You do not have permission to delete this visit.")
 
-        instance.delete()
\ No newline at end of file
+        instance.delete()
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """
+        Create many visits in one request. Accepts {"visits": [visit objects]} and returns
+        the id or the validation errors of every object, in request order.
+        """
+        if not request.user.is_authenticated:
+            raise PermissionDenied("You must be authenticated to add visits.")
+
+        try:
+            items = get_batch_items(request, 'visits')
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        # Checked once per location, batches usually add many visits to a few locations
+        permitted = {}
+
+        def check(data):
+            location = data['location']
+            if location.id not in permitted:
+                permitted[location.id] = IsOwnerOrSharedWithFullAccess().has_object_permission(request, self, location)
+            if not permitted[location.id]:
+                return "You do not have permission to add a visit to this location."
+
+        locations = preload_related(Location.objects.select_related('user'), items, 'location')
+        valid, errors = validate_items(
+            items, VisitSerializer, self.get_serializer_context(), check, related={'location': locations}
+        )
+        visits = {}
+        if valid:
+            with transaction.atomic():
+                for index, data in valid.items():
+                    visit = Visit(**data)
+                    if not visit.end_date and visit.start_date:
+                        visit.end_date = visit.start_date
+                    visits[index] = visit
+                Visit.objects.bulk_create(visits.values())
+
+                # New visits can make their locations visited
+                GeocodeJob.enqueue_many(visit.location_id for visit in visits.values())
+                after_batch_commit({visit.location.user_id for visit in visits.values()}, visited_sync=True)
+
+        return batch_response(visits, errors, len(items))
@@ -1,6 +1,33 @@
 from rest_framework.pagination import PageNumberPagination
 
+from integrations.models import ImmichIntegration
+
 class StandardResultsSetPagination(PageNumberPagination):
     page_size = 25
     page_size_query_param = 'page_size'
-    max_page_size = 1000
\ No newline at end of file
+    max_page_size = 1000
+
+
+class ImmichIntegrationResolver:
+    """Looks up users' Immich integrations, querying each user at most once."""
+
+    def __init__(self):
+        self._integrations = {}
+
+    def get(self, user_id):
+        if user_id not in self._integrations:
+            self._integrations[user_id] = ImmichIntegration.objects.filter(user_id=user_id).first()
+        return self._integrations[user_id]
+
+
+def get_immich_resolver(context):
+    """
+    Return the Immich integration resolver for a serializer context. It is kept on the request,
+    so all serializers of a request share it, including ones created with a new context.
+    """
+    request = context.get('request')
+    if request is None:
+        return context.setdefault('_immich_resolver', ImmichIntegrationResolver())
+    if not hasattr(request, '_immich_resolver'):
+        request._immich_resolver = ImmichIntegrationResolver()
+    return request._immich_resolver
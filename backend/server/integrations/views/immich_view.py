@@ -1,4 +1,4 @@
-import os
+from main.utils import PUBLIC_URL
 from rest_framework.response import Response
 from rest_framework import viewsets, status
 from integrations.serializers import ImmichIntegrationSerializer
@@ -6,6 +6,7 @@ from integrations.models import ImmichIntegration
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 import requests
+from main import http_client
 from adventures.models import ContentImage
 from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
@@ -98,7 +99,7 @@ class ImmichIntegrationView(viewsets.ViewSet):
         # check so if the server is down, it does not tweak out like a madman and crash the server with a 500 error code
         try:
             url = f'{integration.server_url}/search/{"smart" if query else "metadata"}'
-            immich_fetch = requests.post(url, headers={
+            immich_fetch = http_client.post('immich', url, headers={
                 'x-api-key': integration.api_key
             },
             json = arguments
@@ -117,10 +118,8 @@ class ImmichIntegrationView(viewsets.ViewSet):
         if 'assets' in res and 'items' in res['assets']:
             paginator = self.pagination_class()
             # for each item in the items, we need to add the image url to the item so we can display it in the frontend
-            public_url = os.environ.get('PUBLIC_URL', 'http://127.0.0.1:8000').rstrip('/')
-            public_url = public_url.replace("'", "")
             for item in res['assets']['items']:
-                item['image_url'] = f'{public_url}/api/integrations/immich/{integration.id}/get/{item["id"]}'
+                item['image_url'] = f'{PUBLIC_URL}/api/integrations/immich/{integration.id}/get/{item["id"]}'
             result_page = paginator.paginate_queryset(res['assets']['items'], request)
             return paginator.get_paginated_response(result_page)
         else:
@@ -145,7 +144,7 @@ class ImmichIntegrationView(viewsets.ViewSet):
 
         # check so if the server is down, it does not tweak out like a madman and crash the server with a 500 error code
         try:
-            immich_fetch = requests.get(f'{integration.server_url}/albums', headers={
+            immich_fetch = http_client.get('immich', f'{integration.server_url}/albums', headers={
                 'x-api-key': integration.api_key
             })
             res = immich_fetch.json()
@@ -187,7 +186,7 @@ class ImmichIntegrationView(viewsets.ViewSet):
         
         # check so if the server is down, it does not tweak out like a madman and crash the server with a 500 error code
         try:
-            immich_fetch = requests.get(f'{integration.server_url}/albums/{albumid}', headers={
+            immich_fetch = http_client.get('immich', f'{integration.server_url}/albums/{albumid}', headers={
                 'x-api-key': integration.api_key
             })
             res = immich_fetch.json()
@@ -204,10 +203,8 @@ class ImmichIntegrationView(viewsets.ViewSet):
         if 'assets' in res:
             paginator = self.pagination_class()
             # for each item in the items, we need to add the image url to the item so we can display it in the frontend
-            public_url = os.environ.get('PUBLIC_URL', 'http://127.0.0.1:8000').rstrip('/')
-            public_url = public_url.replace("'", "")
             for item in res['assets']:
-                item['image_url'] = f'{public_url}/api/integrations/immich/{integration.id}/get/{item["id"]}'
+                item['image_url'] = f'{PUBLIC_URL}/api/integrations/immich/{integration.id}/get/{item["id"]}'
             result_page = paginator.paginate_queryset(res['assets'], request)
             return paginator.get_paginated_response(result_page)
         else:
@@ -346,10 +343,10 @@ class ImmichIntegrationView(viewsets.ViewSet):
 
         # Fetch from Immich
         try:
-            immich_response = requests.get(
+            immich_response = http_client.get(
+                'immich',
                 f'{integration.server_url}/assets/{imageid}/thumbnail?size=preview',
                 headers={'x-api-key': integration.api_key},
-                timeout=5
             )
             content_type = immich_response.headers.get('Content-Type', 'image/jpeg')
             if not content_type.startswith('image/'):
@@ -413,10 +410,11 @@ class ImmichIntegrationViewSet(viewsets.ModelViewSet):
         
         for corrected_url, test_endpoint in test_configs:
             try:
-                response = requests.get(
+                response = http_client.get(
+                    'immich',
                     test_endpoint, 
                     headers=headers, 
-                    timeout=10,  # 10 second timeout
+                    retries=0,  # Both endpoints are tried anyway
                     verify=True  # SSL verification
                 )
                 
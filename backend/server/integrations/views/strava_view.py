@@ -3,6 +3,7 @@ from rest_framework import viewsets, status
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
 import requests
+from main import http_client
 import logging
 import time
 import re
@@ -97,7 +98,7 @@ class StravaIntegrationView(viewsets.ViewSet):
         }
 
         try:
-            response = requests.post(token_url, data=payload)
+            response = http_client.post('strava', token_url, data=payload)
             response_data = response.json()
 
             if response.status_code != 200:
@@ -186,7 +187,7 @@ class StravaIntegrationView(viewsets.ViewSet):
                 'refresh_token': strava_token.refresh_token,
             }
             try:
-                response = requests.post(refresh_url, data=payload)
+                response = http_client.post('strava', refresh_url, data=payload)
                 data = response.json()
                 if response.status_code == 200:
                     # Update token info
@@ -399,7 +400,7 @@ class StravaIntegrationView(viewsets.ViewSet):
 
         headers = {'Authorization': f'Bearer {strava_token.access_token}'}
         try:
-            response = requests.get('https://www.strava.com/api/v3/athlete/activities', 
+            response = http_client.get('strava', 'https://www.strava.com/api/v3/athlete/activities',
                                 headers=headers, params=params)
             if response.status_code != 200:
                 return Response({
@@ -442,7 +443,7 @@ class StravaIntegrationView(viewsets.ViewSet):
 
         headers = {'Authorization': f'Bearer {strava_token.access_token}'}
         try:
-            response = requests.get(f'https://www.strava.com/api/v3/activities/{activity_id}', headers=headers)
+            response = http_client.get('strava', f'https://www.strava.com/api/v3/activities/{activity_id}', headers=headers)
             if response.status_code != 200:
                 return Response({
                     'message': 'Failed to fetch activity from Strava.',
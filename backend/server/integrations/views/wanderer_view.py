@@ -1,5 +1,6 @@
 # views.py
 import requests
+from main import http_client
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
@@ -157,7 +158,7 @@ class WandererIntegrationViewSet(viewsets.ViewSet):
         
         url = f"{inst.server_url.rstrip('/')}/api/v1/trail"
         try:
-            response = session.get(url, params=params, timeout=10)
+            response = http_client.get('wanderer', url, session=session, params=params)
             response.raise_for_status()
         except requests.RequestException:
             raise ValidationError({"detail": f"Error fetching trails"})
@@ -1,5 +1,6 @@
 # wanderer_services.py
 import requests
+from main import http_client
 from datetime import datetime
 from datetime import timezone as dt_timezone
 from django.utils import timezone as django_timezone
@@ -39,10 +40,10 @@ def login_to_wanderer(integration: WandererIntegration, password: str):
     url = integration.server_url.rstrip("/") + LOGIN_PATH
     
     try:
-        resp = requests.post(url, json={
+        resp = http_client.post('wanderer', url, json={
             "username": integration.username,
             "password": password
-        }, timeout=10)
+        })
         resp.raise_for_status()
     except requests.RequestException as exc:
         logger.error("Error connecting to Wanderer login: %s", exc)
@@ -73,11 +74,11 @@ def login_to_wanderer(integration: WandererIntegration, password: str):
 
 def get_valid_session(integration: WandererIntegration, password_for_reauth: str = None):
     """
-    Get a requests session with valid authentication.
+    Get a requests session with valid authentication, sharing the pooled connections.
     Will reuse existing token if valid, or re-authenticate if needed.
     """
     now = django_timezone.now()
-    session = requests.Session()
+    session = http_client.new_session()
 
     if not integration:
         raise IntegrationError("No Wanderer integration found.")
@@ -122,7 +123,7 @@ def make_wanderer_request(integration: WandererIntegration, endpoint: str, metho
     url = f"{integration.server_url.rstrip('/')}{endpoint}"
     
     try:
-        response = getattr(session, method.lower())(url, timeout=10, **kwargs)
+        response = http_client.request('wanderer', method, url, session=session, **kwargs)
         response.raise_for_status()
         return response
     except requests.RequestException as exc:
@@ -0,0 +1,218 @@
+"""
+Shared outbound HTTP client for third-party integrations.
+
+Every call goes through one connection-pooled requests session, so repeated calls to the
+same host reuse keep-alive connections instead of paying a new TCP and TLS handshake.
+Each call names a provider, which selects its timeout and retry policy and the counters
+the call is recorded under.
+
+Usage:
+    from main import http_client
+
+    response = http_client.get('nominatim', url, params=params, headers=headers)
+    response = http_client.post('strava', token_url, data=payload)
+    http_client.get_stats()
+
+Callers that need their own cookie jar (e.g. Wanderer) can use `new_session()`, which
+shares the same connection pool, and pass it as `session=`.
+
+Providers with a rate limit or circuit breaker (see main.provider_limits) are throttled
+here; when a provider is skipped, ProviderUnavailable is raised. Calls do not wait for a
+rate limit unless they run inside `provider_limits.waiting()`, as background jobs do.
+
+Tests can send a provider's calls to a local stub server with `override_base_url`.
+"""
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from http.cookiejar import DefaultCookiePolicy
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+from main import provider_limits
+
+logger = logging.getLogger(__name__)
+
+# (connect, read) timeouts in seconds per provider, extended by settings.HTTP_CLIENT_TIMEOUTS
+DEFAULT_TIMEOUTS = {
+    'default': (3, 10),
+    'nominatim': (2, 5),
+    'google': (2, 5),
+    'google_places': (3, 15),
+    'overpass': (3, 30),
+    'wikipedia': (3, 10),
+    'immich': (3, 10),
+    'strava': (3, 15),
+    'wanderer': (3, 10),
+    'sunrise_sunset': (2, 5),
+    'region_boundaries': (3, 60),
+}
+PROVIDER_TIMEOUTS = {**DEFAULT_TIMEOUTS, **getattr(settings, 'HTTP_CLIENT_TIMEOUTS', {})}
+
+MAX_RETRIES = getattr(settings, 'HTTP_CLIENT_MAX_RETRIES', 2)
+RETRY_BACKOFF_SECONDS = getattr(settings, 'HTTP_CLIENT_RETRY_BACKOFF', 0.5)
+POOL_MAXSIZE = getattr(settings, 'HTTP_CLIENT_POOL_MAXSIZE', 10)
+
+# Responses worth retrying, and the methods that are safe to send twice
+RETRY_STATUSES = {429, 502, 503, 504}
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS'}
+
+_adapter = HTTPAdapter(pool_connections=32, pool_maxsize=POOL_MAXSIZE)
+_session = None
+_session_lock = threading.Lock()
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+_base_url_overrides = {}
+
+
+class ProviderUnavailable(requests.ConnectionError):
+    """Raised without contacting the provider while its circuit is open or its rate limit is exhausted."""
+
+
+def new_session():
+    """Return a new session with its own cookie jar that shares the pooled connections."""
+    session = requests.Session()
+    session.mount('https://', _adapter)
+    session.mount('http://', _adapter)
+    return session
+
+
+def get_session():
+    """Return the process wide session. It never stores cookies since it is shared by all users."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = new_session()
+                session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+                _session = session
+    return _session
+
+
+def get_timeout(provider):
+    return PROVIDER_TIMEOUTS.get(provider, PROVIDER_TIMEOUTS['default'])
+
+
+def _record(provider, elapsed, error):
+    with _stats_lock:
+        stats = _stats.setdefault(provider, {'requests': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+        stats['requests'] += 1
+        stats['total_ms'] += elapsed * 1000
+        stats['max_ms'] = max(stats['max_ms'], elapsed * 1000)
+        if error:
+            stats['errors'] += 1
+
+
+def get_stats():
+    """Return request count, error count and latency per provider for this process."""
+    with _stats_lock:
+        return {
+            provider: {
+                'requests': stats['requests'],
+                'errors': stats['errors'],
+                'avg_ms': round(stats['total_ms'] / stats['requests'], 1) if stats['requests'] else 0.0,
+                'max_ms': round(stats['max_ms'], 1),
+            }
+            for provider, stats in _stats.items()
+        }
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+@contextmanager
+def override_base_url(base_url, replacement):
+    """Send every call whose URL starts with `base_url` to `replacement` instead, e.g. a local stub server."""
+    _base_url_overrides[base_url] = replacement
+    try:
+        yield
+    finally:
+        _base_url_overrides.pop(base_url, None)
+
+
+def _rewrite_url(url):
+    for base_url, replacement in _base_url_overrides.items():
+        if url.startswith(base_url):
+            return replacement + url[len(base_url):]
+    return url
+
+
+def _retry_delay(attempt):
+    # Full jitter so concurrent workers do not retry in lockstep
+    return random.uniform(0, RETRY_BACKOFF_SECONDS * (2 ** attempt))
+
+
+def request(provider, method, url, session=None, timeout=None, retries=None, max_wait=None, **kwargs):
+    """
+    Send a request through the pooled session using the provider's timeout policy.
+
+    Idempotent requests are retried with jittered exponential backoff on connection errors,
+    timeouts and 429/502/503/504 responses; pass `retries` to override that. Exceptions are
+    the usual requests exceptions so callers keep their existing error handling.
+
+    `max_wait` bounds how long the call may wait for the provider's rate limit; by default it
+    fails immediately, or waits as long as an enclosing `provider_limits.waiting()` allows.
+    """
+    method = method.upper()
+    session = session or get_session()
+    timeout = timeout or get_timeout(provider)
+    if retries is None:
+        retries = MAX_RETRIES if method in IDEMPOTENT_METHODS else 0
+    url = _rewrite_url(url)
+
+    attempt = 0
+    # A retry that cannot be sent falls back to the outcome of the attempt before it
+    last_response = last_error = None
+    while True:
+        unavailable = None
+        if not provider_limits.is_available(provider):
+            unavailable = ProviderUnavailable(f"{provider} is temporarily skipped after repeated failures")
+        elif not provider_limits.acquire(provider, max_wait=max_wait):
+            unavailable = ProviderUnavailable(f"{provider} rate limit exceeded")
+        if unavailable:
+            if last_response is not None:
+                return last_response
+            raise last_error or unavailable
+        if last_response is not None:
+            last_response.close()
+
+        started = time.monotonic()
+        try:
+            response = session.request(method, url, timeout=timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            _record(provider, time.monotonic() - started, error=True)
+            provider_limits.record_failure(provider)
+            if attempt >= retries:
+                raise
+            logger.debug(f"{provider} request to {url} failed ({e}), retrying")
+            last_response, last_error = None, e
+        else:
+            failed = response.status_code >= 500 or response.status_code == 429
+            _record(provider, time.monotonic() - started, error=failed)
+            if failed:
+                provider_limits.record_failure(provider)
+            else:
+                provider_limits.record_success(provider)
+            if response.status_code not in RETRY_STATUSES or attempt >= retries:
+                return response
+            logger.debug(f"{provider} request to {url} returned {response.status_code}, retrying")
+            last_response, last_error = response, None
+
+        time.sleep(_retry_delay(attempt))
+        attempt += 1
+
+
+def get(provider, url, **kwargs):
+    return request(provider, 'GET', url, **kwargs)
+
+
+def post(provider, url, **kwargs):
+    return request(provider, 'POST', url, **kwargs)
@@ -0,0 +1,194 @@
+"""
+Rate limits and circuit breakers for third-party providers, shared by every process
+through the Django cache (memcached).
+
+Rate limits are token buckets, e.g. Nominatim's usage policy of 1 request per second. A
+bucket refills at `requests` tokens per `per_seconds` and holds at most `burst` tokens, so
+calls are spread evenly instead of bunching up at the edges of a fixed window. The bucket
+of a provider is a single cache entry, so gunicorn workers, the geocode queue and
+management commands draw from the same bucket.
+
+Calls made while handling a request never wait for a token, they fail straight away so a
+gunicorn thread is not held up. Background jobs (the geocode queue, backfill_geocode) run
+inside `waiting()` and wait up to PROVIDER_RATE_LIMIT_MAX_WAIT seconds for one. So that they
+cannot starve request paths, waiting calls first draw from a second bucket that only refills
+at PROVIDER_RATE_LIMIT_BACKGROUND_SHARE of the rate, and then take a token of the shared
+bucket only once one is free, without reserving it ahead of time.
+
+The circuit breaker opens after a run of failed calls and makes calls to that provider
+fail immediately until the cool-down has passed, instead of waiting for full timeouts.
+
+Both fail open: when the cache is unreachable, calls are let through.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+PROVIDER_LIMITS_PREFIX = 'provider_limits'
+
+# provider -> (requests, per seconds) or (requests, per seconds, burst)
+RATE_LIMITS = getattr(settings, 'PROVIDER_RATE_LIMITS', {})
+RATE_LIMIT_MAX_WAIT = getattr(settings, 'PROVIDER_RATE_LIMIT_MAX_WAIT', 10)
+RATE_LIMIT_BACKGROUND_SHARE = getattr(settings, 'PROVIDER_RATE_LIMIT_BACKGROUND_SHARE', 0.5)
+
+CIRCUIT_BREAKER_PROVIDERS = getattr(settings, 'CIRCUIT_BREAKER_PROVIDERS', ())
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = getattr(settings, 'CIRCUIT_BREAKER_FAILURE_THRESHOLD', 5)
+CIRCUIT_BREAKER_COOLDOWN_SECONDS = getattr(settings, 'CIRCUIT_BREAKER_COOLDOWN_SECONDS', 60)
+
+# A bucket is read and written under a short lock, released after a crash by its timeout
+BUCKET_LOCK_TIMEOUT_SECONDS = 2
+
+_max_wait = ContextVar('provider_rate_limit_max_wait', default=0)
+
+
+@contextmanager
+def waiting(max_wait=None):
+    """Let calls inside the block wait up to `max_wait` (PROVIDER_RATE_LIMIT_MAX_WAIT) seconds for a token."""
+    token = _max_wait.set(RATE_LIMIT_MAX_WAIT if max_wait is None else max_wait)
+    try:
+        yield
+    finally:
+        _max_wait.reset(token)
+
+
+@contextmanager
+def _locked(key):
+    """
+    Hold the lock of a bucket for the block. When it cannot be taken in time the block runs
+    anyway, like the rest of the limiter fails open, and the other holder's lock is kept.
+    """
+    lock_key = f"{key}:lock"
+    deadline = time.monotonic() + BUCKET_LOCK_TIMEOUT_SECONDS
+    locked = cache.add(lock_key, 1, BUCKET_LOCK_TIMEOUT_SECONDS)
+    while not locked and time.monotonic() < deadline:
+        time.sleep(0.005)
+        locked = cache.add(lock_key, 1, BUCKET_LOCK_TIMEOUT_SECONDS)
+    if not locked:
+        logger.warning(f"Could not lock {key} in time, using it without the lock")
+    try:
+        yield
+    finally:
+        if locked:
+            cache.delete(lock_key)
+
+
+def _reserve_token(key, interval, burst, max_wait):
+    """
+    Reserve the next token of a bucket that refills one token every `interval` seconds and
+    holds at most `burst`. Returns (reserved, wait): the seconds until the token may be used,
+    or, when that is longer than `max_wait`, until the next one is free and nothing was reserved.
+    """
+    with _locked(key):
+        now = time.time()
+        # The time at which the bucket is full again; every token taken pushes it one interval further
+        full_at = max(cache.get(key) or 0, now)
+        wait = full_at - now - (burst - 1) * interval
+        if wait > max_wait:
+            return False, wait
+        full_at += interval
+        cache.set(key, full_at, int(full_at - now) + 1)
+    return True, max(wait, 0)
+
+
+def _release_token(key, interval):
+    """Hand back a token reserved with `_reserve_token` that was not used."""
+    with _locked(key):
+        full_at = cache.get(key)
+        if full_at:
+            cache.set(key, full_at - interval, max(int(full_at - interval - time.time()), 0) + 1)
+
+
+def _acquire_waiting(key, interval, burst, max_wait):
+    """Take a token for a call that may wait, leaving the rest of the rate to request paths."""
+    deadline = time.monotonic() + max_wait
+    background_key = f"{key}:background"
+    background_interval = interval / RATE_LIMIT_BACKGROUND_SHARE
+    reserved, wait = _reserve_token(background_key, background_interval, burst, max_wait)
+    if not reserved:
+        return False
+    # Only a token that is free right now is taken, so none are booked ahead of request paths
+    while True:
+        if wait:
+            time.sleep(wait)
+        reserved, wait = _reserve_token(key, interval, burst, 0)
+        if reserved:
+            return True
+        if time.monotonic() + wait > deadline:
+            _release_token(background_key, background_interval)
+            return False
+
+
+def acquire(provider, max_wait=None):
+    """
+    Take a token from the provider's bucket, sleeping until it is available.
+    Returns False when that would take longer than `max_wait` seconds, which defaults to 0
+    outside of `waiting()`.
+    """
+    if provider not in RATE_LIMITS:
+        return True
+
+    limit, per_seconds, *burst = RATE_LIMITS[provider]
+    burst = burst[0] if burst else 1
+    interval = per_seconds / limit
+    key = f"{PROVIDER_LIMITS_PREFIX}:bucket:{provider}"
+    if max_wait is None:
+        max_wait = _max_wait.get()
+    try:
+        if max_wait > 0:
+            return _acquire_waiting(key, interval, burst, max_wait)
+        reserved, _ = _reserve_token(key, interval, burst, 0)
+        return reserved
+    except Exception as e:
+        logger.warning(f"Rate limiter unavailable for {provider}, letting request through: {e}")
+        return True
+
+
+def _open_key(provider):
+    return f"{PROVIDER_LIMITS_PREFIX}:circuit_open:{provider}"
+
+
+def _failures_key(provider):
+    return f"{PROVIDER_LIMITS_PREFIX}:failures:{provider}"
+
+
+def is_available(provider):
+    """Return False while the provider's circuit is open."""
+    if provider not in CIRCUIT_BREAKER_PROVIDERS:
+        return True
+    try:
+        return cache.get(_open_key(provider)) is None
+    except Exception:
+        return True
+
+
+def record_success(provider):
+    if provider not in CIRCUIT_BREAKER_PROVIDERS:
+        return
+    try:
+        cache.delete(_failures_key(provider))
+    except Exception:
+        pass
+
+
+def record_failure(provider):
+    """Count a failed call and open the circuit once the threshold is reached."""
+    if provider not in CIRCUIT_BREAKER_PROVIDERS:
+        return
+    try:
+        key = _failures_key(provider)
+        cache.add(key, 0, CIRCUIT_BREAKER_COOLDOWN_SECONDS)
+        failures = cache.incr(key)
+        if failures >= CIRCUIT_BREAKER_FAILURE_THRESHOLD:
+            cache.set(_open_key(provider), time.time(), CIRCUIT_BREAKER_COOLDOWN_SECONDS)
+            cache.delete(key)
+            logger.warning(
+                f"{provider} failed {failures} times in a row, skipping it for {CIRCUIT_BREAKER_COOLDOWN_SECONDS}s"
+            )
+    except Exception as e:
+        logger.warning(f"Circuit breaker unavailable for {provider}: {e}")
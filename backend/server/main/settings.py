@@ -366,7 +366,66 @@ ADVENTURELOG_RELEASE_VERSION = 'v0.11.0'
 # https://github.com/dr5hn/countries-states-cities-database/tags
 COUNTRY_REGION_JSON_VERSION = 'v3.0'
 
+# Admin-1 (state/province) boundaries matched to regions by ISO 3166-2 code for offline reverse geocoding
+REGION_BOUNDARIES_URL = getenv(
+    'REGION_BOUNDARIES_URL',
+    'https://raw.githubusercontent.com/nvkelso/natural-earth-vector/v5.1.2/geojson/ne_10m_admin_1_states_provinces.geojson'
+)
+
 # External service keys (do not hardcode secrets)
 GOOGLE_MAPS_API_KEY = getenv('GOOGLE_MAPS_API_KEY', '')
 STRAVA_CLIENT_ID = getenv('STRAVA_CLIENT_ID', '')
-STRAVA_CLIENT_SECRET = getenv('STRAVA_CLIENT_SECRET', '')
\ No newline at end of file
+STRAVA_CLIENT_SECRET = getenv('STRAVA_CLIENT_SECRET', '')
+
+# ---------------------------------------------------------------------------
+# Background Geocoding Queue
+# ---------------------------------------------------------------------------
+# Processed by `python manage.py process_geocode_queue` (run by supervisord).
+GEOCODE_QUEUE_WORKERS = int(getenv('GEOCODE_QUEUE_WORKERS', '2'))
+GEOCODE_QUEUE_MAX_ATTEMPTS = int(getenv('GEOCODE_QUEUE_MAX_ATTEMPTS', '5'))
+GEOCODE_QUEUE_RETRY_BASE_SECONDS = int(getenv('GEOCODE_QUEUE_RETRY_BASE_SECONDS', '30'))
+# Running jobs whose lock is older than this are assumed lost (e.g. worker restart) and reclaimed
+GEOCODE_QUEUE_STALE_SECONDS = int(getenv('GEOCODE_QUEUE_STALE_SECONDS', '300'))
+
+# Shared reverse geocode cache (memcached in front of a database table)
+REVERSE_GEOCODE_CACHE_ENABLED = getenv('REVERSE_GEOCODE_CACHE_ENABLED', 'true').lower() == 'true'
+# Number of decimal places coordinates are rounded to when building the cache key (3 ~= 110m)
+REVERSE_GEOCODE_CACHE_PRECISION = int(getenv('REVERSE_GEOCODE_CACHE_PRECISION', '3'))
+REVERSE_GEOCODE_CACHE_TTL = int(getenv('REVERSE_GEOCODE_CACHE_TTL', str(60 * 60 * 24 * 30)))
+# Resolve regions from the stored region boundaries first and only call the provider as a fallback
+REVERSE_GEOCODE_OFFLINE = getenv('REVERSE_GEOCODE_OFFLINE', 'true').lower() == 'true'
+# Radius in km in which the nearest known city is assigned when no city name matches
+REVERSE_GEOCODE_CITY_RADIUS_KM = float(getenv('REVERSE_GEOCODE_CITY_RADIUS_KM', '10'))
+
+# Seconds a user's /stats/counts/ snapshot is kept. It is also dropped whenever the user's data changes.
+STATS_CACHE_TTL = int(getenv('STATS_CACHE_TTL', '600'))
+
+# Rows read per server-side cursor fetch by the streamed /locations/all/, /pins/ and /calendar/ responses
+STREAM_CHUNK_SIZE = int(getenv('STREAM_CHUNK_SIZE', '500'))
+
+# Maximum number of objects accepted by the /locations/batch/, /visits/batch/ and /activities/batch/ endpoints
+BATCH_MAX_ITEMS = int(getenv('BATCH_MAX_ITEMS', '500'))
+
+# ---------------------------------------------------------------------------
+# Outbound HTTP Client
+# ---------------------------------------------------------------------------
+# Retries for idempotent calls to third-party services (connection errors, timeouts, 429/502/503/504)
+HTTP_CLIENT_MAX_RETRIES = int(getenv('HTTP_CLIENT_MAX_RETRIES', '2'))
+# Maximum number of pooled keep-alive connections per host
+HTTP_CLIENT_POOL_MAXSIZE = int(getenv('HTTP_CLIENT_POOL_MAXSIZE', '10'))
+
+# Token buckets shared across processes through the cache: (requests, per seconds, burst).
+# Nominatim's usage policy allows 1 request per second.
+PROVIDER_RATE_LIMITS = {
+    'nominatim': (int(getenv('NOMINATIM_RATE_LIMIT', '1')), 1),
+    'google': (int(getenv('GOOGLE_MAPS_RATE_LIMIT', '50')), 1, 10),
+}
+# Seconds the geocode queue and backfill may wait for a provider's rate limit before giving up.
+# Calls made while handling a request never wait.
+PROVIDER_RATE_LIMIT_MAX_WAIT = int(getenv('PROVIDER_RATE_LIMIT_MAX_WAIT', '10'))
+# Share of a provider's rate limit those background calls may use, the rest is kept for requests
+PROVIDER_RATE_LIMIT_BACKGROUND_SHARE = float(getenv('PROVIDER_RATE_LIMIT_BACKGROUND_SHARE', '0.5'))
+# Providers that are skipped for a cool-down after repeated failures
+CIRCUIT_BREAKER_PROVIDERS = ('nominatim', 'google', 'google_places', 'overpass')
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = int(getenv('CIRCUIT_BREAKER_FAILURE_THRESHOLD', '5'))
+CIRCUIT_BREAKER_COOLDOWN_SECONDS = int(getenv('CIRCUIT_BREAKER_COOLDOWN_SECONDS', '60'))
\ No newline at end of file
@@ -1,11 +1,92 @@
+import os
+
 from rest_framework import serializers
 
+# Base URL for media and API links in responses, read once at startup
+PUBLIC_URL = os.environ.get('PUBLIC_URL', 'http://127.0.0.1:8000').rstrip('/').replace("'", "")
+
 def get_user_uuid(user):
     return str(user.uuid)
 
+def parse_field_paths(value):
+    """Turn "id,name,visits.start_date" into {'id': {}, 'name': {}, 'visits': {'start_date': {}}}."""
+    tree = {}
+    for path in (value or '').split(','):
+        node = tree
+        for part in path.strip().split('.'):
+            if part:
+                node = node.setdefault(part, {})
+    return tree
+
 class CustomModelSerializer(serializers.ModelSerializer):
+    """
+    Model serializer that renders the owner as a uuid and supports sparse fieldsets on GET requests:
+
+        ?fields=id,name,visits.start_date   only render these fields (dotted paths select nested fields)
+        ?expand=visits.activities           also render these fields, including ones in Meta.expandable_fields
+
+    Fields listed in `Meta.expandable_fields` are expensive relations that are left out once either
+    parameter is used, unless they are named in `fields` or `expand`. Without either parameter every
+    field is rendered as before. Unselected fields are dropped before serialization, so their method
+    fields and nested serializers never run.
+    """
     def to_representation(self, instance):
         representation = super().to_representation(instance)
-        if hasattr(instance, 'user') and instance.user:
+        if hasattr(instance, 'user') and instance.user and (not self._sparse or 'user' in representation):
             representation['user'] = get_user_uuid(instance.user)
-        return representation
\ No newline at end of file
+        return representation
+
+    def _get_field_selection(self):
+        """Return (fields, expand) trees for this serializer, or None when every field is rendered."""
+        if hasattr(self, '_field_selection'):
+            return self._field_selection
+
+        request = self.context.get('request')
+        view = self.context.get('view')
+        if request is None or view is None or request.method not in ('GET', 'HEAD'):
+            return None
+        # Only the serializer the view responds with reads the query parameters
+        is_top_level = self.parent is None or (self.parent is self.root and isinstance(self.root, serializers.ListSerializer))
+        if not is_top_level or not isinstance(self, view.get_serializer_class()):
+            return None
+
+        params = request.query_params
+        if 'fields' not in params and 'expand' not in params:
+            return None
+        return parse_field_paths(params.get('fields')), parse_field_paths(params.get('expand'))
+
+    _sparse = False
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selection = self._get_field_selection()
+        if selection is None:
+            return fields
+        self._sparse = True
+
+        requested, expand = selection
+        expandable = set(getattr(self.Meta, 'expandable_fields', ()))
+        allowed = set(requested) if requested else set(fields) - expandable
+        allowed |= set(expand)
+        allowed.add('id')
+        for name in list(fields):
+            if name not in allowed:
+                fields.pop(name)
+
+        # Nested serializers render their own selection, or their non-expandable fields
+        for name, field in fields.items():
+            child = getattr(field, 'child', field)
+            if isinstance(child, CustomModelSerializer):
+                child._field_selection = (requested.get(name, {}), expand.get(name, {}))
+        return fields
+
+    @classmethod
+    def get_rendered_fields(cls, view):
+        """
+        Names of the top-level fields the view's response will contain, or None for all of them.
+        Views use it to skip prefetches for fields that are not rendered.
+        """
+        params = view.request.query_params
+        if view.request.method not in ('GET', 'HEAD') or ('fields' not in params and 'expand' not in params):
+            return None
+        return set(cls(context=view.get_serializer_context()).fields)
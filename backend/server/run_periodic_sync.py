@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 """
 Periodic sync runner for AdventureLog.
-Runs sync_visited_regions management command every 60 seconds.
+Runs sync_visited_regions for users flagged by location/visit changes every 60 seconds,
+and an incremental reconciliation of everything changed since the last run at midnight.
 Managed by supervisord to ensure it inherits container environment variables.
 """
 import os
@@ -51,19 +52,27 @@ def _handle_termination(signum, frame):
     _stop_event.set()
 
 
-def run_sync():
+def run_sync(*args):
     """Run the sync_visited_regions command."""
     try:
-        logger.info("Running sync_visited_regions...")
-        call_command('sync_visited_regions')
+        logger.info(f"Running sync_visited_regions {' '.join(args)}...")
+        call_command('sync_visited_regions', *args)
         logger.info("Sync completed successfully")
     except Exception as e:
         logger.error(f"Sync failed: {e}", exc_info=True)
 
 
+def run_pending_sync():
+    """Sync the users flagged by recent changes, quietly unless there is work."""
+    from adventures.models import PendingVisitedSync
+
+    if PendingVisitedSync.objects.exists():
+        run_sync('--pending')
+
+
 def main():
-    """Main loop - run sync every INTERVAL_SECONDS."""
-    logger.info(f"Starting periodic sync worker for midnight background jobs...")
+    """Main loop - sync flagged users every INTERVAL_SECONDS and reconcile at midnight."""
+    logger.info(f"Starting periodic sync worker for background jobs...")
 
     # Install signal handlers so supervisord (or other process managers)
     # can request a clean shutdown using SIGTERM/SIGINT.
@@ -71,21 +80,21 @@ def main():
     signal.signal(signal.SIGINT, _handle_termination)
 
     try:
+        next_reconcile = time.monotonic() + _seconds_until_next_midnight()
+        logger.info(
+            f"Next reconciliation scheduled in {next_reconcile - time.monotonic():.0f}s at midnight"
+        )
         while not _stop_event.is_set():
-            # Wait until the next local midnight (or until shutdown)
-            wait_seconds = _seconds_until_next_midnight()
-            hours = wait_seconds / 3600.0
-            logger.info(
-                f"Next sync scheduled in {wait_seconds:.0f}s (~{hours:.2f}h) at UTC midnight"
-            )
-            # Sleep until midnight or until stop event is set
-            if _stop_event.wait(wait_seconds):
+            # Sleep for one interval, or until the stop event is set
+            if _stop_event.wait(min(INTERVAL_SECONDS, max(next_reconcile - time.monotonic(), 0))):
                 break
 
-            # It's midnight (or we woke up), run the sync once
-            run_sync()
-
-            # After running at midnight, loop continues to compute next midnight
+            if time.monotonic() >= next_reconcile:
+                # Only touches users changed since the previous run
+                run_sync('--incremental')
+                next_reconcile = time.monotonic() + _seconds_until_next_midnight()
+            else:
+                run_pending_sync()
     except Exception:
         logger.exception("Unexpected error in periodic sync loop")
     finally:
@@ -1,8 +1,13 @@
 import os
+import json
 from django.core.management.base import BaseCommand
 import requests
-from worldtravel.models import Country, Region, City
+from main import http_client
+from adventures.utils.conditional import bump_world_data_version
+from adventures.utils.stats_cache import invalidate_world_totals
+from worldtravel.models import Country, Region, City, normalize_place_name
 from django.db import transaction
+from django.contrib.gis.geos import GEOSGeometry, MultiPolygon, GEOSException
 import ijson
 import gc
 import tempfile
@@ -12,6 +17,7 @@ from contextlib import contextmanager
 from django.conf import settings
 
 COUNTRY_REGION_JSON_VERSION = settings.COUNTRY_REGION_JSON_VERSION
+REGION_BOUNDARIES_URL = settings.REGION_BOUNDARIES_URL
         
 media_root = settings.MEDIA_ROOT
 
@@ -30,7 +36,7 @@ def saveCountryFlag(country_code):
         print(f'Flag for {country_code} already exists')
         return
 
-    res = requests.get(f'https://flagcdn.com/h240/{country_code}.png'.lower())
+    res = http_client.get('flagcdn', f'https://flagcdn.com/h240/{country_code}.png'.lower())
     if res.status_code == 200:
         with open(flag_path, 'wb') as f:
             f.write(res.content)
@@ -44,6 +50,8 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument('--force', action='store_true', help='Force download the countries+regions+states.json file')
         parser.add_argument('--batch-size', type=int, default=500, help='Batch size for database operations')
+        parser.add_argument('--boundaries-file', type=str, help='Load region boundaries from a local GeoJSON file instead of downloading them')
+        parser.add_argument('--skip-boundaries', action='store_true', help='Do not load region boundaries used for offline reverse geocoding')
 
     @contextmanager
     def _temp_db(self):
@@ -113,6 +121,9 @@ class Command(BaseCommand):
             self.stdout.write(self.style.WARNING('Some data is missing. Re-importing all data.'))
         else:
             self.stdout.write(self.style.SUCCESS('Latest data already imported.'))
+            if not options['skip_boundaries'] and not Region.objects.filter(geometry__isnull=False).exists():
+                self.stdout.write('Region boundaries are missing. Loading boundaries...')
+                self._import_region_boundaries(options['boundaries_file'], force, batch_size)
             return
 
         self.stdout.write(self.style.SUCCESS('Starting ultra-memory-efficient import process...'))
@@ -134,8 +145,77 @@ class Command(BaseCommand):
             self.stdout.write('Step 5: Cleaning up obsolete records...')
             self._cleanup_obsolete_records(temp_conn)
 
+        if not options['skip_boundaries']:
+            self.stdout.write('Step 6: Loading region boundaries...')
+            self._import_region_boundaries(options['boundaries_file'], force, batch_size)
+
+        invalidate_world_totals()
+        bump_world_data_version()
         self.stdout.write(self.style.SUCCESS('All data imported successfully with minimal memory usage'))
 
+    def _import_region_boundaries(self, boundaries_file, force, batch_size):
+        """Download (or use the given) admin-1 boundaries file and attach the polygons to regions"""
+        boundaries_path = boundaries_file or os.path.join(settings.MEDIA_ROOT, 'region-boundaries.geojson')
+
+        if boundaries_file:
+            if not os.path.isfile(boundaries_path):
+                self.stdout.write(self.style.ERROR(f'Boundaries file {boundaries_path} does not exist'))
+                return
+        elif not os.path.exists(boundaries_path) or force:
+            self.stdout.write('Downloading region boundaries...')
+            try:
+                with http_client.get('region_boundaries', REGION_BOUNDARIES_URL, stream=True) as res:
+                    res.raise_for_status()
+                    with open(boundaries_path, 'wb') as f:
+                        for chunk in res.iter_content(chunk_size=1024 * 1024):
+                            f.write(chunk)
+            except requests.RequestException as e:
+                if os.path.exists(boundaries_path):
+                    os.unlink(boundaries_path)
+                self.stdout.write(self.style.ERROR(f'Error downloading region boundaries: {e}'))
+                return
+
+        self._load_region_boundaries(boundaries_path, batch_size)
+
+    def _load_region_boundaries(self, boundaries_path, batch_size):
+        """Stream the GeoJSON features and store each boundary on the region with the same ISO 3166-2 code"""
+        region_ids = set(Region.objects.values_list('id', flat=True))
+        geometries = {}
+        skipped = 0
+
+        with open(boundaries_path, 'rb') as f:
+            for feature in ijson.items(f, 'features.item', use_float=True):
+                region_id = (feature.get('properties') or {}).get('iso_3166_2')
+                if region_id not in region_ids or not feature.get('geometry'):
+                    skipped += 1
+                    continue
+
+                try:
+                    geometry = GEOSGeometry(json.dumps(feature['geometry']), srid=4326)
+                except (ValueError, GEOSException):
+                    skipped += 1
+                    continue
+
+                # Some regions are split over several features, merge them into one boundary
+                if region_id in geometries:
+                    geometry = geometries[region_id].union(geometry)
+
+                if geometry.geom_type == 'Polygon':
+                    geometry = MultiPolygon(geometry, srid=4326)
+                elif geometry.geom_type != 'MultiPolygon':
+                    skipped += 1
+                    continue
+
+                geometries[region_id] = geometry
+
+        regions_to_update = [Region(id=region_id, geometry=geometry) for region_id, geometry in geometries.items()]
+        for start in range(0, len(regions_to_update), batch_size):
+            with transaction.atomic():
+                Region.objects.bulk_update(regions_to_update[start:start + batch_size], ['geometry'])
+            gc.collect()
+
+        self.stdout.write(f'✓ Region boundaries complete: {len(regions_to_update)} regions updated, {skipped} features skipped')
+
     def _parse_and_store_temp(self, json_path, temp_conn):
         """Parse JSON once and store in temporary SQLite database"""
         country_count = 0
@@ -407,6 +487,7 @@ class Command(BaseCommand):
                     cities_to_update.append({
                         'id': city_id,
                         'name': name,
+                        'normalized_name': normalize_place_name(name),
                         'region_id': region_obj.id,
                         'longitude': longitude,
                         'latitude': latitude
@@ -415,6 +496,7 @@ class Command(BaseCommand):
                     cities_to_create.append(City(
                         id=city_id,
                         name=name,
+                        normalized_name=normalize_place_name(name),
                         region=region_obj,
                         longitude=longitude,
                         latitude=latitude
@@ -443,9 +525,27 @@ class Command(BaseCommand):
                 City.objects.bulk_create(cities_to_create, batch_size=batch_size, ignore_conflicts=True)
         if cities_to_update:
             self._bulk_update_cities_raw(cities_to_update)
+
+        self._sync_city_points()
         
         self.stdout.write(f'✓ Cities complete: {processed} processed')
 
+    def _sync_city_points(self):
+        """Rebuild the indexed city points used for nearest-city lookups from latitude/longitude"""
+        from django.db import connection
+
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                UPDATE worldtravel_city
+                SET point = CASE
+                    WHEN longitude IS NULL OR latitude IS NULL THEN NULL
+                    ELSE ST_SetSRID(ST_MakePoint(longitude, latitude), 4326)
+                END
+                WHERE point IS NULL
+                    OR longitude IS NULL OR latitude IS NULL
+                    OR NOT ST_Equals(point, ST_SetSRID(ST_MakePoint(longitude, latitude), 4326))
+            """)
+
     def _bulk_update_cities_raw(self, cities_data):
         """Fast bulk update using raw SQL"""
         if not cities_data:
@@ -457,6 +557,7 @@ class Command(BaseCommand):
             # Build the SQL for bulk update
             # Using CASE statements for efficient bulk updates
             when_clauses_name = []
+            when_clauses_normalized = []
             when_clauses_region = []
             when_clauses_lng = []
             when_clauses_lat = []
@@ -466,6 +567,7 @@ class Command(BaseCommand):
                 city_id = city['id']
                 city_ids.append(city_id)
                 when_clauses_name.append(f"WHEN id = %s THEN %s")
+                when_clauses_normalized.append(f"WHEN id = %s THEN %s")
                 when_clauses_region.append(f"WHEN id = %s THEN %s")
                 when_clauses_lng.append(f"WHEN id = %s THEN %s")
                 when_clauses_lat.append(f"WHEN id = %s THEN %s")
@@ -474,6 +576,8 @@ class Command(BaseCommand):
             params = []
             for city in cities_data:
                 params.extend([city['id'], city['name']])  # for name
+            for city in cities_data:
+                params.extend([city['id'], city['normalized_name']])  # for normalized_name
             for city in cities_data:
                 params.extend([city['id'], city['region_id']])  # for region_id
             for city in cities_data:
@@ -487,6 +591,7 @@ class Command(BaseCommand):
                 UPDATE worldtravel_city 
                 SET 
                     name = CASE {' '.join(when_clauses_name)} END,
+                    normalized_name = CASE {' '.join(when_clauses_normalized)} END,
                     region_id = CASE {' '.join(when_clauses_region)} END,
                     longitude = CASE {' '.join(when_clauses_lng)} END,
                     latitude = CASE {' '.join(when_clauses_lat)} END
@@ -0,0 +1,36 @@
+from django.db import models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def _count_subquery(queryset, group_by):
+    """COUNT(*) of `queryset` per `group_by` as a correlated subquery, 0 when there are no rows."""
+    counts = queryset.order_by().values(group_by).annotate(count=Count('*')).values('count')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+
+class CountryQuerySet(models.QuerySet):
+    def with_counts(self, user=None):
+        """
+        Annotate `num_regions` and, for an authenticated user, `num_visits` (regions of the
+        country the user has visited) as read by CountrySerializer.
+        """
+        from worldtravel.models import Region, VisitedRegion
+
+        queryset = self.annotate(
+            num_regions=_count_subquery(Region.objects.filter(country=OuterRef('pk')), 'country')
+        )
+        if user is not None and user.is_authenticated:
+            visits = VisitedRegion.objects.filter(region__country=OuterRef('pk'), user=user)
+            return queryset.annotate(num_visits=_count_subquery(visits, 'region__country'))
+        return queryset.annotate(num_visits=Value(0, output_field=IntegerField()))
+
+
+class RegionQuerySet(models.QuerySet):
+    def with_counts(self):
+        """Annotate `num_cities` as read by RegionSerializer."""
+        from worldtravel.models import City
+
+        return self.annotate(
+            num_cities=_count_subquery(City.objects.filter(region=OuterRef('pk')), 'region')
+        )
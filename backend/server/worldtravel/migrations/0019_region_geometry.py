@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-17 06:13
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('worldtravel', '0018_rename_user_id_visitedcity_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='region',
+            name='geometry',
+            field=django.contrib.gis.db.models.fields.MultiPolygonField(blank=True, null=True, srid=4326),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.8 on 2026-10-17 06:13
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+
+def normalize_place_name(value):
+    # Copy of worldtravel.models.normalize_place_name as it was when this migration was written
+    normalized = unicodedata.normalize("NFKD", value or "")
+    ascii_only = normalized.encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^a-z0-9]", "", ascii_only.lower())
+
+
+def backfill_normalized_names(apps, schema_editor):
+    # Fill normalized_name for cities imported before the column existed
+    City = apps.get_model('worldtravel', 'City')
+    batch = []
+    for city in City.objects.only('id', 'name').iterator(chunk_size=2000):
+        city.normalized_name = normalize_place_name(city.name)
+        batch.append(city)
+        if len(batch) >= 2000:
+            City.objects.bulk_update(batch, ['normalized_name'])
+            batch = []
+    if batch:
+        City.objects.bulk_update(batch, ['normalized_name'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('worldtravel', '0019_region_geometry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='city',
+            name='normalized_name',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+        migrations.RunPython(backfill_normalized_names, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='city',
+            index=models.Index(fields=['region', 'normalized_name'], name='worldtravel_region__125c8d_idx'),
+        ),
+    ]
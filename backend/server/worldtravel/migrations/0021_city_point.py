@@ -0,0 +1,27 @@
+# Generated by Django 5.2.8 on 2026-10-17 06:14
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('worldtravel', '0020_city_normalized_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='city',
+            name='point',
+            field=django.contrib.gis.db.models.fields.PointField(blank=True, editable=False, null=True, srid=4326),
+        ),
+        migrations.RunSQL(
+            sql=(
+                "UPDATE worldtravel_city "
+                "SET point = ST_SetSRID(ST_MakePoint(longitude, latitude), 4326) "
+                "WHERE longitude IS NOT NULL AND latitude IS NOT NULL"
+            ),
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.8 on 2026-10-17 06:21
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def remove_duplicate_visits(apps, schema_editor):
+    # Keep the oldest row of every (user, region) and (user, city) pair so the constraints can be added
+    for model_name, field in (('VisitedRegion', 'region'), ('VisitedCity', 'city')):
+        model = apps.get_model('worldtravel', model_name)
+        keep_ids = (
+            model.objects.values('user', field)
+            .annotate(keep_id=Min('id'))
+            .values_list('keep_id', flat=True)
+        )
+        model.objects.exclude(id__in=list(keep_ids)).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('worldtravel', '0021_city_point'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_visits, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='visitedcity',
+            constraint=models.UniqueConstraint(fields=('user', 'city'), name='unique_visited_city_per_user'),
+        ),
+        migrations.AddConstraint(
+            model_name='visitedregion',
+            constraint=models.UniqueConstraint(fields=('user', 'region'), name='unique_visited_region_per_user'),
+        ),
+    ]
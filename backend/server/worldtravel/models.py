@@ -1,13 +1,24 @@
+import re
+import unicodedata
+
 from django.db import models
 from django.contrib.auth import get_user_model
-from django.core.exceptions import ValidationError
 from django.contrib.gis.db import models as gis_models
+from django.contrib.gis.geos import Point
+
+from worldtravel.managers import CountryQuerySet, RegionQuerySet
 
 
 User = get_user_model()
 
 default_user = 1  # Replace with an actual user ID
 
+def normalize_place_name(value):
+    """Lowercase ASCII-folded form of a place name with everything but letters and digits removed."""
+    normalized = unicodedata.normalize("NFKD", value or "")
+    ascii_only = normalized.encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^a-z0-9]", "", ascii_only.lower())
+
 class Country(models.Model):
 
     id = models.AutoField(primary_key=True)
@@ -18,6 +29,8 @@ class Country(models.Model):
     longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
 
+    objects = CountryQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Country"
         verbose_name_plural = "Countries"
@@ -31,6 +44,10 @@ class Region(models.Model):
     country = models.ForeignKey(Country, on_delete=models.CASCADE)
     longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    # Admin-1 boundary loaded by download-countries, GiST indexed for offline point-in-region lookups
+    geometry = gis_models.MultiPolygonField(srid=4326, null=True, blank=True)
+
+    objects = RegionQuerySet.as_manager()
 
     def __str__(self):
         return self.name
@@ -41,26 +58,41 @@ class City(models.Model):
     region = models.ForeignKey(Region, on_delete=models.CASCADE)
     longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    # normalize_place_name(name), used to match provider locality names without scanning every city in a region
+    normalized_name = models.CharField(max_length=100, blank=True, default='', editable=False)
+    # Point built from latitude/longitude, GiST indexed for nearest-city lookups
+    point = gis_models.PointField(srid=4326, null=True, blank=True, editable=False)
 
     class Meta:
         verbose_name_plural = "Cities"
+        indexes = [
+            models.Index(fields=['region', 'normalized_name']),
+        ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.normalized_name = normalize_place_name(self.name)
+        if self.latitude is not None and self.longitude is not None:
+            self.point = Point(float(self.longitude), float(self.latitude), srid=4326)
+        else:
+            self.point = None
+        super().save(*args, **kwargs)
+
 class VisitedRegion(models.Model):
     id = models.AutoField(primary_key=True)
     user = models.ForeignKey(
         User, on_delete=models.CASCADE, default=default_user)
     region = models.ForeignKey(Region, on_delete=models.CASCADE)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'region'], name='unique_visited_region_per_user'),
+        ]
+
     def __str__(self):
         return f'{self.region.name} ({self.region.country.country_code}) visited by: {self.user.username}'
-    
-    def save(self, *args, **kwargs):
-        if VisitedRegion.objects.filter(user=self.user, region=self.region).exists():
-            raise ValidationError("Region already visited by user.")
-        super().save(*args, **kwargs)
 
 class VisitedCity(models.Model):
     id = models.AutoField(primary_key=True)
@@ -68,13 +100,11 @@ class VisitedCity(models.Model):
         User, on_delete=models.CASCADE, default=default_user)
     city = models.ForeignKey(City, on_delete=models.CASCADE)
 
-    def __str__(self):
-        return f'{self.city.name} ({self.city.region.name}) visited by: {self.user.username}'
-    
-    def save(self, *args, **kwargs):
-        if VisitedCity.objects.filter(user=self.user, city=self.city).exists():
-            raise ValidationError("City already visited by user.")
-        super().save(*args, **kwargs)
-
     class Meta:
-        verbose_name_plural = "Visited Cities"
\ No newline at end of file
+        verbose_name_plural = "Visited Cities"
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'city'], name='unique_visited_city_per_user'),
+        ]
+
+    def __str__(self):
+        return f'{self.city.name} ({self.city.region.name}) visited by: {self.user.username}'
\ No newline at end of file
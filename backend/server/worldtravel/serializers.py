@@ -1,12 +1,11 @@
-import os
 from .models import Country, Region, VisitedRegion, City, VisitedCity
 from rest_framework import serializers
-from main.utils import CustomModelSerializer
+from main.utils import CustomModelSerializer, PUBLIC_URL
 
 
 class CountrySerializer(serializers.ModelSerializer):
     def get_public_url(self, obj):
-        return os.environ.get('PUBLIC_URL', 'http://127.0.0.1:8000').rstrip('/').replace("'", "")
+        return PUBLIC_URL
 
     flag_url = serializers.SerializerMethodField()
     num_regions = serializers.SerializerMethodField()
@@ -17,10 +16,15 @@ class CountrySerializer(serializers.ModelSerializer):
         return public_url + '/media/' + 'flags/' + obj.country_code.lower() + '.png'
     
     def get_num_regions(self, obj):
+        # Annotated by Country.objects.with_counts()
+        if hasattr(obj, 'num_regions'):
+            return obj.num_regions
         # get the number of regions in the country
         return Region.objects.filter(country=obj).count()
     
     def get_num_visits(self, obj):
+        if hasattr(obj, 'num_visits'):
+            return obj.num_visits
         request = self.context.get('request')
         user = getattr(request, 'user', None)
         
@@ -40,10 +44,14 @@ class RegionSerializer(serializers.ModelSerializer):
     country_name = serializers.CharField(source='country.name', read_only=True)
     class Meta:
         model = Region
-        fields = '__all__'
+        # The boundary polygon is only used server side and can be several MB
+        exclude = ['geometry']
         read_only_fields = ['id', 'name', 'country', 'longitude', 'latitude', 'num_cities', 'country_name']
 
     def get_num_cities(self, obj):
+        # Annotated by Region.objects.with_counts()
+        if hasattr(obj, 'num_cities'):
+            return obj.num_cities
         return City.objects.filter(region=obj).count()
 
 class CitySerializer(serializers.ModelSerializer):
@@ -52,7 +60,7 @@ class CitySerializer(serializers.ModelSerializer):
     )
     class Meta:
         model = City
-        fields = '__all__'
+        exclude = ['normalized_name', 'point']
         read_only_fields = ['id', 'name', 'region', 'longitude', 'latitude', 'region_name', 'country_name']
 
 class VisitedRegionSerializer(CustomModelSerializer):
@@ -1,42 +1,63 @@
 from django.shortcuts import get_object_or_404
+from django.db import IntegrityError, transaction
 from .models import Country, Region, VisitedRegion, City, VisitedCity
 from .serializers import CitySerializer, CountrySerializer, RegionSerializer, VisitedRegionSerializer, VisitedCitySerializer
 from rest_framework import viewsets, status
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes, action
 from django.contrib.gis.geos import Point
+from django.utils import timezone
 from adventures.models import Location
+from adventures.utils.conditional import bump_data_version, conditional_get, get_validators
+from adventures.utils.stats_cache import invalidate_user_stats
+
+
+def _world_validators(*args, **kwargs):
+    """Countries, regions and cities only change when download-countries runs."""
+    request = args[0] if isinstance(args[0], Request) else args[1]
+    return get_validators(request, world=True)
+
+
+def _user_world_validators(*args, **kwargs):
+    """World data combined with the user's visited regions and cities."""
+    request = args[0] if isinstance(args[0], Request) else args[1]
+    return get_validators(request, user_ids=[request.user.pk], world=True)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@conditional_get(_world_validators)
 def regions_by_country(request, country_code):
     country = get_object_or_404(Country, country_code=country_code)
-    regions = Region.objects.filter(country=country).order_by('name')
+    regions = Region.objects.filter(country=country).select_related('country').defer('geometry').with_counts().order_by('name')
     serializer = RegionSerializer(regions, many=True)
     return Response(serializer.data)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@conditional_get(_user_world_validators)
 def visits_by_country(request, country_code):
     country = get_object_or_404(Country, country_code=country_code)
-    visits = VisitedRegion.objects.filter(region__country=country, user=request.user.id)
+    visits = VisitedRegion.objects.filter(region__country=country, user=request.user.id).select_related('region').defer('region__geometry')
     serializer = VisitedRegionSerializer(visits, many=True)
     return Response(serializer.data)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@conditional_get(_world_validators)
 def cities_by_region(request, region_id):
     region = get_object_or_404(Region, id=region_id)
-    cities = City.objects.filter(region=region).order_by('name')
+    cities = City.objects.filter(region=region).select_related('region__country').defer('region__geometry').order_by('name')
     serializer = CitySerializer(cities, many=True)
     return Response(serializer.data)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@conditional_get(_user_world_validators)
 def visits_by_region(request, region_id):
     region = get_object_or_404(Region, id=region_id)
-    visits = VisitedCity.objects.filter(city__region=region, user=request.user.id)
+    visits = VisitedCity.objects.filter(city__region=region, user=request.user.id).select_related('city')
     serializer = VisitedCitySerializer(visits, many=True)
     return Response(serializer.data)
 
@@ -44,34 +65,66 @@ def visits_by_region(request, region_id):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def globespin(request):
-    country = Country.objects.order_by('?').first()
+    country = Country.objects.with_counts(request.user).order_by('?').first()
     data = {
-        "country": CountrySerializer(country).data,
+        "country": CountrySerializer(country, context={'request': request}).data,
     }
     
-    regions = Region.objects.filter(country=country)
-    if regions.exists():
-        region = regions.order_by('?').first()
+    region = Region.objects.filter(country=country).select_related('country').defer('geometry').with_counts().order_by('?').first()
+    if region:
         data["region"] = RegionSerializer(region).data
         
-        cities = City.objects.filter(region=region)
-        if cities.exists():
-            city = cities.order_by('?').first()
+        city = City.objects.filter(region=region).select_related('region__country').defer('region__geometry').order_by('?').first()
+        if city:
             data["city"] = CitySerializer(city).data
     
     return Response(data)
 
+def _mark_visited(user, region_ids=(), city_ids=()):
+    """
+    Insert visited regions and cities for the user, skipping those already visited.
+    Returns the number of new rows per type.
+    """
+    with transaction.atomic():
+        existing_regions = VisitedRegion.objects.filter(user=user).count()
+        existing_cities = VisitedCity.objects.filter(user=user).count()
+        VisitedRegion.objects.bulk_create(
+            [VisitedRegion(user=user, region_id=region_id) for region_id in region_ids],
+            ignore_conflicts=True,
+        )
+        VisitedCity.objects.bulk_create(
+            [VisitedCity(user=user, city_id=city_id) for city_id in city_ids],
+            ignore_conflicts=True,
+        )
+        # bulk_create skips the signals that drop the cached stats
+        transaction.on_commit(lambda: (invalidate_user_stats(user.id), bump_data_version(user.id)))
+        return {
+            'regions': VisitedRegion.objects.filter(user=user).count() - existing_regions,
+            'cities': VisitedCity.objects.filter(user=user).count() - existing_cities,
+        }
+
 class CountryViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Country.objects.all().order_by('name')
     serializer_class = CountrySerializer
     permission_classes = [IsAuthenticated]
 
+    def get_queryset(self):
+        # Region and visit counts are annotated so listing all countries stays a single query
+        return Country.objects.with_counts(self.request.user).order_by('name')
+
+    @conditional_get(_user_world_validators)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional_get(_user_world_validators)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
     @action(detail=False, methods=['get'])
     def check_point_in_region(self, request):
         lat = float(request.query_params.get('lat'))
         lon = float(request.query_params.get('lon'))
         point = Point(lon, lat, srid=4326)
-        region = Region.objects.filter(geometry__contains=point).first()
+        region = Region.objects.filter(geometry__contains=point).defer('geometry').first()
         if region:
             return Response({'in_region': True, 'region_name': region.name, 'region_id': region.id})
         else:
@@ -79,16 +132,19 @@ class CountryViewSet(viewsets.ReadOnlyModelViewSet):
 
     @action(detail=False, methods=['post'])
     def region_check_all_adventures(self, request):
-        adventures = Location.objects.filter(user=request.user.id, type='visited')
+        # Locations count as visited once they have a visit that has started
+        adventures = Location.objects.filter(
+            user=request.user.id, visits__start_date__lte=timezone.now()
+        ).distinct()
         count = 0
         for adventure in adventures:
             if adventure.latitude is not None and adventure.longitude is not None:
                 try:
                     point = Point(float(adventure.longitude), float(adventure.latitude), srid=4326)
-                    region = Region.objects.filter(geometry__contains=point).first()
+                    region = Region.objects.filter(geometry__contains=point).defer('geometry').first()
                     if region:
-                        if not VisitedRegion.objects.filter(user=request.user.id, region=region).exists():
-                            VisitedRegion.objects.create(user=request.user, region=region)
+                        _, created = VisitedRegion.objects.get_or_create(user=request.user, region=region)
+                        if created:
                             count += 1
                 except Exception as e:
                     print(f"Error processing adventure {adventure.id}: {e}")
@@ -96,16 +152,24 @@ class CountryViewSet(viewsets.ReadOnlyModelViewSet):
         return Response({'regions_visited': count})
 
 class RegionViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Region.objects.all()
+    queryset = Region.objects.select_related('country').defer('geometry').with_counts()
     serializer_class = RegionSerializer
     permission_classes = [IsAuthenticated]
 
+    @conditional_get(_world_validators)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional_get(_world_validators)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
 class VisitedRegionViewSet(viewsets.ModelViewSet):
     serializer_class = VisitedRegionSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return VisitedRegion.objects.filter(user=self.request.user.id)
+        return VisitedRegion.objects.filter(user=self.request.user.id).select_related('region').defer('region__geometry')
     
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -128,13 +192,36 @@ class VisitedRegionViewSet(viewsets.ModelViewSet):
             return Response(status=status.HTTP_204_NO_CONTENT)
         else:
             return Response({"error": "Visited region not found."}, status=status.HTTP_404_NOT_FOUND)
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """
+        Mark many regions as visited in one request.
+        Accepts {"regions": [region ids]} and/or {"country": country code} to mark every region of a country.
+        """
+        region_ids = request.data.get('regions') or []
+        country_code = request.data.get('country')
+        if not isinstance(region_ids, list) or (not region_ids and not country_code):
+            return Response({"error": "Provide a list of region ids in 'regions' or a country code in 'country'."}, status=400)
+
+        regions = Region.objects.filter(id__in=[str(region_id) for region_id in region_ids])
+        if country_code:
+            regions = regions | Region.objects.filter(country__country_code=str(country_code).upper())
+        found_ids = set(regions.values_list('id', flat=True))
+        not_found = [region_id for region_id in region_ids if str(region_id) not in found_ids]
+
+        created = _mark_visited(request.user, region_ids=found_ids)
+        return Response({
+            'regions_created': created['regions'],
+            'not_found': not_found,
+        }, status=status.HTTP_200_OK)
     
 class VisitedCityViewSet(viewsets.ModelViewSet):
     serializer_class = VisitedCitySerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return VisitedCity.objects.filter(user=self.request.user.id)
+        return VisitedCity.objects.filter(user=self.request.user.id).select_related('city')
     
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -143,11 +230,16 @@ class VisitedCityViewSet(viewsets.ModelViewSet):
         request.data['user'] = request.user
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        self.perform_create(serializer)
+        try:
+            with transaction.atomic():
+                self.perform_create(serializer)
+        except IntegrityError:
+            return Response({"error": "City already visited by user."}, status=400)
         # Ensure a VisitedRegion exists for the city
         region = serializer.validated_data['city'].region
-        if not VisitedRegion.objects.filter(user=request.user.id, region=region).exists():
-            VisitedRegion.objects.create(user=request.user, region=region)
+        VisitedRegion.objects.bulk_create([VisitedRegion(user=request.user, region=region)], ignore_conflicts=True)
+        invalidate_user_stats(request.user.id)
+        bump_data_version(request.user.id)
         headers = self.get_success_headers(serializer.data)
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
     
@@ -159,3 +251,23 @@ class VisitedCityViewSet(viewsets.ModelViewSet):
             return Response(status=status.HTTP_204_NO_CONTENT)
         else:
             return Response({"error": "Visited city not found."}, status=status.HTTP_404_NOT_FOUND)
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """
+        Mark many cities as visited in one request. Accepts {"cities": [city ids]};
+        the regions of those cities are marked as visited as well.
+        """
+        city_ids = request.data.get('cities')
+        if not isinstance(city_ids, list) or not city_ids:
+            return Response({"error": "Provide a list of city ids in 'cities'."}, status=400)
+
+        cities = dict(City.objects.filter(id__in=[str(city_id) for city_id in city_ids]).values_list('id', 'region_id'))
+        not_found = [city_id for city_id in city_ids if str(city_id) not in cities]
+
+        created = _mark_visited(request.user, region_ids=set(cities.values()), city_ids=set(cities))
+        return Response({
+            'cities_created': created['cities'],
+            'regions_created': created['regions'],
+            'not_found': not_found,
+        }, status=status.HTTP_200_OK)